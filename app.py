@@ -1,12 +1,14 @@
 import streamlit as st
-import pandas as pd
-from db_utils import init_db # db_utilsからinit_dbをインポート
+from db_utils import init_db, start_digest_scheduler, start_maintenance_scheduler # db_utilsからinit_dbをインポート
+from auth import restore_session, end_session # ログイン状態の確認 (再接続時はトークンから復元)
 
 # --- DB初期化 ---
-init_db() # アプリ起動時にテーブルを作成
+init_db() # スキーマの確認 (プロセスごとに一度だけ。最新なら何もしない)
+start_digest_scheduler() # 週報・月報の自動作成 (プロセスごとに一度だけ開始される)
+start_maintenance_scheduler() # 削除済みデータの完全削除とVACUUM (1日1回)
 
 # --- 認証チェック ---
-if "logged_in" not in st.session_state or not st.session_state.logged_in:
+if not restore_session():
     st.switch_page("pages/0_Login.py")
 
 # --- アプリ設定 ---
@@ -18,9 +20,7 @@ st.set_page_config(
 
 # --- ログアウトボタン ---
 if st.sidebar.button("ログアウト"):
-    st.session_state.logged_in = False
-    st.session_state.username = None
-    st.session_state.role = None
+    end_session()
     st.switch_page("pages/0_Login.py")
 
 # --- 管理者向けメニュー ---
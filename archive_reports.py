@@ -0,0 +1,25 @@
+import argparse
+import datetime
+from db_utils import init_db
+from db_utils.archive import ARCHIVE_AFTER_YEARS, archive_cutoff, archive_path, archive_reports, get_archives
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="古い承認済みレポートを年ごとのアーカイブDB (incident_reports_archive_YYYY.db) に移します。")
+    parser.add_argument("--years", type=int, default=ARCHIVE_AFTER_YEARS,
+                        help=f"発生年が今年よりこの年数より前のレポートをアーカイブする (既定: {ARCHIVE_AFTER_YEARS})")
+    parser.add_argument("--date", type=datetime.date.fromisoformat, default=None, help="基準日 (YYYY-MM-DD。省略時は今日)")
+    parser.add_argument("--list", action="store_true", help="アーカイブせず、アーカイブの一覧を表示する")
+    args = parser.parse_args(argv)
+
+    init_db()
+    if not args.list:
+        archived = archive_reports(args.date, args.years)
+        if not archived:
+            print(f"{archive_cutoff(args.date, args.years)} より前に発生した、アーカイブする承認済みレポートはありません。")
+        for year, count in archived.items():
+            print(f"{year}年: {count}件を {archive_path(year)} に移しました。")
+    for archive in get_archives():
+        print(f"{archive['year']}年: {archive['report_count']}件 ({archive['filename']}, 最終更新 {archive['archived_at']} UTC)")
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,386 @@
+import base64
+import hashlib
+import hmac
+import ipaddress
+import json
+import os
+import re
+import secrets
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor, TimeoutError as FutureTimeoutError
+
+import bcrypt
+from dotenv import load_dotenv
+
+# --- パスワードのハッシュ化とログイン試行の制限 ---
+# bcryptの照合はCPUを大きく使うため、同時に実行する数をスレッドプールで制限し、
+# ログインが集中しても既にログイン済みの利用者の操作が遅くならないようにします。
+# また、ユーザー名・接続元ごとにトークンバケットで試行回数を制限し、
+# 制限中の試行はbcryptを実行せずにすぐ拒否します。
+
+load_dotenv()
+
+def _env_int(name: str, default: int, minimum: int, maximum: int) -> int:
+    try:
+        value = int(os.environ.get(name, default))
+    except ValueError:
+        value = default
+    return max(minimum, min(maximum, value))
+
+# bcryptのコスト (2のべき乗回の計算)。変更すると、既存のユーザーは次回ログイン時に新しいコストで再ハッシュされます。
+BCRYPT_ROUNDS = _env_int("BCRYPT_ROUNDS", 12, 10, 15)
+# 同時にbcryptを実行するスレッド数と、実行待ちにできる件数
+AUTH_WORKERS = _env_int("AUTH_WORKERS", 2, 1, 8)
+AUTH_MAX_PENDING = _env_int("AUTH_MAX_PENDING", 8, 1, 64)
+AUTH_TIMEOUT_SECONDS = 10
+
+# ログイン試行の制限 (バケットの容量と、1秒あたりの回復量)
+LOGIN_USER_BURST = 5                # 同じユーザー名への連続試行
+LOGIN_USER_REFILL_PER_SEC = 1 / 60  # 1分に1回ずつ回復
+LOGIN_CLIENT_BURST = 20             # 同じ接続元からの連続試行 (ユーザー名を問わない)
+LOGIN_CLIENT_REFILL_PER_SEC = 1 / 15
+# X-Forwarded-For を付けるリバースプロキシのアドレス (カンマ区切り。"10.0.0.0/8" のような範囲も可)。
+# 直接の接続元がこの一覧にある場合だけ X-Forwarded-For を読みます (空の場合は常に直接の接続元を使います)。
+TRUSTED_PROXIES = [
+    ipaddress.ip_network(item.strip(), strict=False) for item in os.environ.get("TRUSTED_PROXIES", "").split(",") if item.strip()
+]
+
+# ログイントークン (再接続やページの再読み込みでbcryptによる再ログインを不要にする)
+SESSION_TOKEN_TTL_SECONDS = _env_int("SESSION_TOKEN_TTL_HOURS", 12, 1, 24 * 7) * 3600
+SESSION_COOKIE = "incident_session" # トークンを保存するCookieの名前 (URLには載せない)
+_LEGACY_TOKEN_PARAM = "session"      # 以前トークンを載せていたURLのクエリパラメータ (残っていれば削除する)
+# 署名用の秘密鍵は .env の SESSION_SECRET に設定します。全てのワーカーで同じ値にし、再起動しても変えないでください。
+# 未設定の場合は、最初に使うときにランダムな鍵を生成してDBと同じ場所のファイル (SESSION_SECRET_FILE) に保存し、
+# 以後はそのファイルを使います (同じPCの全てのワーカーで共有され、再起動しても変わりません)。
+SESSION_SECRET_FILE = os.environ.get("SESSION_SECRET_FILE", "").strip() # 空の場合は DB_NAME と同じ場所の session_secret.key
+_session_secret = None
+_session_secret_lock = threading.Lock()
+
+_BCRYPT_COST_PATTERN = re.compile(r"^\$2[abxy]?\$(\d{2})\$")
+
+
+class AuthBusyError(Exception):
+    """照合の待ち行列が一杯で、パスワードを照合できなかった場合に送出されます"""
+
+
+# --- ハッシュ化 ---
+
+def hash_password(plain_password: str) -> str:
+    """設定されたコストでパスワードをハッシュ化します"""
+    return bcrypt.hashpw(plain_password.encode('utf-8'), bcrypt.gensalt(rounds=BCRYPT_ROUNDS)).decode('utf-8')
+
+
+def needs_rehash(hashed_password: str) -> bool:
+    """保存済みのハッシュのコストが現在の設定と異なる場合に True を返します"""
+    match = _BCRYPT_COST_PATTERN.match(hashed_password or "")
+    return match is None or int(match.group(1)) != BCRYPT_ROUNDS
+
+
+# --- 照合用のスレッドプール ---
+
+_verify_pool = ThreadPoolExecutor(max_workers=AUTH_WORKERS, thread_name_prefix="bcrypt-verify")
+_verify_slots = threading.BoundedSemaphore(AUTH_WORKERS + AUTH_MAX_PENDING)
+
+
+def _checkpw(plain_password: str, hashed_password: str) -> bool:
+    try:
+        return bcrypt.checkpw(plain_password.encode('utf-8'), hashed_password.encode('utf-8'))
+    except ValueError:
+        return False # ハッシュの形式が不正な場合
+
+
+def _run_bounded(func, *args):
+    """func を照合用スレッドプールで実行します。待ち行列が一杯の場合は待たずに AuthBusyError を送出します。"""
+    if not _verify_slots.acquire(blocking=False):
+        raise AuthBusyError()
+    try:
+        future = _verify_pool.submit(func, *args)
+    except Exception:
+        _verify_slots.release()
+        raise
+    future.add_done_callback(lambda _: _verify_slots.release())
+    try:
+        return future.result(timeout=AUTH_TIMEOUT_SECONDS)
+    except FutureTimeoutError:
+        raise AuthBusyError()
+
+
+def check_password(plain_password: str, hashed_password: str) -> bool:
+    """平文パスワードとハッシュを照合します (照合は同時実行数を制限したスレッドプールで行います)"""
+    return _run_bounded(_checkpw, plain_password, hashed_password)
+
+
+def hash_password_bounded(plain_password: str) -> str:
+    """hash_password を照合と同じスレッドプールで実行します (新規登録などの画面操作用)"""
+    return _run_bounded(hash_password, plain_password)
+
+
+# --- トークンバケットによる試行回数の制限 ---
+
+class TokenBucketLimiter:
+    """
+    キーごとのトークンバケットです。試行のたびにトークンを1つ使い、時間の経過で回復します。
+    プロセス内のメモリだけで管理するため、再起動するとリセットされます。
+    """
+
+    def __init__(self, capacity: float, refill_per_sec: float, max_keys: int = 10000):
+        self.capacity = capacity
+        self.refill_per_sec = refill_per_sec
+        self.max_keys = max_keys
+        self._buckets = {} # キー -> (残りトークン, 最終更新時刻)
+        self._lock = threading.Lock()
+
+    def _current(self, key, now: float) -> float:
+        tokens, updated = self._buckets.get(key, (self.capacity, now))
+        return min(self.capacity, tokens + (now - updated) * self.refill_per_sec)
+
+    def try_acquire(self, key) -> float:
+        """トークンを1つ使います。成功した場合は0を、不足している場合は回復までの秒数を返します。"""
+        now = time.monotonic()
+        with self._lock:
+            tokens = self._current(key, now)
+            if tokens < 1:
+                self._buckets[key] = (tokens, now)
+                return (1 - tokens) / self.refill_per_sec
+            self._buckets[key] = (tokens - 1, now)
+            if len(self._buckets) > self.max_keys:
+                self._prune(now)
+            return 0
+
+    def reset(self, key):
+        """ログインに成功した場合などに、キーの試行回数をリセットします"""
+        with self._lock:
+            self._buckets.pop(key, None)
+
+    def _prune(self, now: float):
+        # 満タンまで回復したキーは保持する必要がないため削除する
+        for key in [k for k in self._buckets if self._current(k, now) >= self.capacity]:
+            del self._buckets[key]
+
+
+_user_limiter = TokenBucketLimiter(LOGIN_USER_BURST, LOGIN_USER_REFILL_PER_SEC)
+_client_limiter = TokenBucketLimiter(LOGIN_CLIENT_BURST, LOGIN_CLIENT_REFILL_PER_SEC)
+
+
+def _is_trusted_proxy(address: str) -> bool:
+    try:
+        ip = ipaddress.ip_address(address)
+    except ValueError:
+        return False
+    return any(ip in network for network in TRUSTED_PROXIES)
+
+
+def resolve_client_address(peer: str, forwarded_for: str = None):
+    """
+    試行回数の制限に使う接続元のアドレスを返します。
+    X-Forwarded-For は利用者が自由に付けられるため、直接の接続元 (peer) が TRUSTED_PROXIES にある場合だけ読み、
+    右から順に信頼できるプロキシを除いた最初のアドレスを使います。
+    ループバック (launch_workers.py のプロキシ経由など、全員が同じ接続元になる場合) は None を返し、
+    ユーザー名ごとの制限だけを使います。
+    """
+    address = (peer or "").strip()
+    if _is_trusted_proxy(address):
+        for hop in reversed([hop.strip() for hop in (forwarded_for or "").split(",") if hop.strip()]):
+            address = hop
+            if not _is_trusted_proxy(hop):
+                break
+    try:
+        if ipaddress.ip_address(address).is_loopback:
+            return None
+    except ValueError:
+        pass
+    return address or None
+
+
+def check_login_rate(username: str, client: str = None) -> float:
+    """
+    ログイン試行が制限内かを確認し、制限内ならトークンを消費します。
+    制限内の場合は0を、制限中の場合は再試行できるまでの秒数を返します。
+    """
+    if client:
+        wait = _client_limiter.try_acquire(client)
+        if wait:
+            return wait
+    return _user_limiter.try_acquire((username or "").strip().lower())
+
+
+def reset_login_rate(username: str):
+    """ログインに成功したユーザー名の試行回数をリセットします"""
+    _user_limiter.reset((username or "").strip().lower())
+
+
+def check_register_rate(client: str = None) -> float:
+    """新規登録の試行が制限内かを確認します (接続元ごと。戻り値は check_login_rate と同じ)"""
+    return _client_limiter.try_acquire(("register", client or ""))
+
+
+# --- 署名付きログイントークン ---
+
+def _b64encode(data: bytes) -> str:
+    return base64.urlsafe_b64encode(data).decode("ascii").rstrip("=")
+
+
+def _b64decode(text: str) -> bytes:
+    return base64.urlsafe_b64decode(text + "=" * (-len(text) % 4))
+
+
+def _session_secret_path() -> str:
+    import db_utils # db_utilsがこのモジュールを読み込むため、使うときにインポートする
+    return SESSION_SECRET_FILE or os.path.join(os.path.dirname(os.path.abspath(db_utils.DB_NAME)), "session_secret.key")
+
+
+def _load_or_create_secret_file(path: str) -> str:
+    """鍵のファイルを読み込みます。無い場合は作成します (他のプロセスが同時に作成した場合はそちらを読み込みます)"""
+    try:
+        fd = os.open(path, os.O_WRONLY | os.O_CREAT | os.O_EXCL, 0o600)
+    except FileExistsError:
+        for _ in range(50): # 他のプロセスが書き込み中の場合は少し待つ
+            with open(path, encoding="ascii") as f:
+                secret = f.read().strip()
+            if secret:
+                return secret
+            time.sleep(0.1)
+        raise OSError(f"{path} が空です")
+    secret = secrets.token_hex(32)
+    with os.fdopen(fd, "w", encoding="ascii") as f:
+        f.write(secret)
+    print(f"DEBUG: ログイントークンの署名鍵を生成し、{path} に保存しました。")
+    return secret
+
+
+def _get_session_secret() -> bytes:
+    global _session_secret
+    with _session_secret_lock:
+        if _session_secret is None:
+            secret = os.environ.get("SESSION_SECRET", "").strip()
+            if not secret:
+                path = _session_secret_path()
+                try:
+                    secret = _load_or_create_secret_file(path)
+                except OSError as e:
+                    # ログインできなくなるよりは、このプロセスだけの鍵で続ける (再起動すると再ログインが必要)
+                    secret = secrets.token_hex(32)
+                    print(f"WARNING: 署名鍵のファイル {path} を使えないため、一時的な鍵を生成しました: {e}")
+            _session_secret = secret.encode("utf-8")
+    return _session_secret
+
+
+def _sign(payload: str) -> str:
+    return _b64encode(hmac.new(_get_session_secret(), payload.encode("ascii"), hashlib.sha256).digest())
+
+
+def issue_session_token(username: str, password_version: str, ttl_seconds: int = SESSION_TOKEN_TTL_SECONDS) -> str:
+    """ユーザー名・パスワードの識別子・有効期限を署名したトークンを発行します"""
+    claims = {"u": username, "v": password_version, "exp": int(time.time()) + ttl_seconds}
+    payload = _b64encode(json.dumps(claims, ensure_ascii=False, separators=(",", ":")).encode("utf-8"))
+    return f"{payload}.{_sign(payload)}"
+
+
+def verify_session_token(token: str):
+    """
+    トークンの署名と有効期限を確認します。
+
+    Returns:
+        tuple: 有効な場合は (ユーザー名, パスワードの識別子)、無効な場合は None
+    """
+    try:
+        payload, signature = (token or "").split(".", 1)
+        if not hmac.compare_digest(signature, _sign(payload)):
+            return None
+        claims = json.loads(_b64decode(payload))
+    except (ValueError, UnicodeError):
+        return None
+    if claims.get("exp", 0) < time.time():
+        return None
+    return claims.get("u"), claims.get("v")
+
+
+# --- Streamlitのログイン状態 ---
+# ログイン時に発行したトークンをCookieに保持し (URL・履歴・アクセスログには残しません)、
+# セッションが切れて再接続した場合はトークンからログイン状態を復元します。
+# StreamlitにはCookieを書き込むAPIが無いため、ブラウザ側のスクリプトで書き込みます (そのため HttpOnly にはできません)。
+
+def _token_expiry(token: str) -> int:
+    try:
+        return int(json.loads(_b64decode(token.split(".", 1)[0])).get("exp", 0))
+    except (ValueError, UnicodeError):
+        return 0
+
+
+def _write_session_cookie(token: str = None):
+    """ブラウザのCookieにトークンを書き込みます (token が None の場合は削除します)"""
+    import streamlit as st
+
+    if token:
+        expires = time.strftime("%a, %d %b %Y %H:%M:%S GMT", time.gmtime(_token_expiry(token)))
+        cookie = f"{SESSION_COOKIE}={token}; Expires={expires}"
+    else:
+        cookie = f"{SESSION_COOKIE}=; Max-Age=0"
+    # 内容が同じ間はブラウザ側で読み込み直されないため、毎回呼び出しても書き込みは1回だけです
+    with st.sidebar:
+        st.iframe(f"""
+            <script>
+                const secure = window.parent.location.protocol === "https:" ? "; Secure" : "";
+                window.parent.document.cookie = {json.dumps(cookie)} + "; Path=/; SameSite=Strict" + secure;
+            </script>
+        """, height="content") # 表示する内容は無い
+
+
+def start_session(user: dict):
+    """ログイン状態をsession_stateに設定し、再接続用のトークンを発行します (Cookieへの書き込みは restore_session が行います)"""
+    import streamlit as st
+    from db_utils import get_user_profile # db_utilsがこのモジュールを読み込むため、循環しないようここでインポート
+
+    profile = get_user_profile(user['username']) or {}
+    st.session_state.logged_in = True
+    st.session_state.username = user['username']
+    st.session_state.role = user['role']
+    st.session_state.session_token = issue_session_token(user['username'], profile.get('password_version', ""))
+    st.session_state.pop("session_ended", None)
+
+
+def restore_session() -> bool:
+    """
+    ログイン済みなら True を返します。未ログインでもCookieに有効なトークンがあれば、
+    bcryptを使わずにログイン状態を復元して True を返します。
+    トークンはパスワードが変更されたユーザーや削除されたユーザーでは無効になります。
+    """
+    import streamlit as st
+    from db_utils import get_user_profile
+
+    if _LEGACY_TOKEN_PARAM in st.query_params:
+        st.query_params.pop(_LEGACY_TOKEN_PARAM) # 以前のURLのトークンは使わずに消す
+
+    if st.session_state.get("logged_in"):
+        # ログイン直後の画面移動で消えないよう、Cookieの書き込みは移動先のページで行う
+        if st.session_state.get("session_token"):
+            _write_session_cookie(st.session_state.session_token)
+        return True
+    if st.session_state.get("session_ended"):
+        # st.context.cookies は接続した時点の値のため、ログアウトしたセッションでは読まない
+        _write_session_cookie(None)
+        return False
+
+    token = st.context.cookies.get(SESSION_COOKIE)
+    claims = verify_session_token(token) if token else None
+    profile = get_user_profile(claims[0]) if claims else None
+    if not profile or not hmac.compare_digest(profile['password_version'], claims[1] or ""):
+        return False
+
+    st.session_state.logged_in = True
+    st.session_state.username = profile['username']
+    st.session_state.role = profile['role'] # ロールはトークンではなく現在のユーザー情報から設定する
+    st.session_state.session_token = token
+    return True
+
+
+def end_session():
+    """ログアウトします (Cookieのトークンは移動先のページの restore_session が削除します)"""
+    import streamlit as st
+
+    st.session_state.logged_in = False
+    st.session_state.username = None
+    st.session_state.role = None
+    st.session_state.pop("session_token", None)
+    st.session_state.session_ended = True
@@ -1,5 +1,5 @@
 import os
-import shutil
+import sqlite3
 import datetime
 
 # データベースファイルの名前
@@ -22,12 +22,22 @@ def backup_database():
     # バックアップファイルの保存先パス
     destination_path = os.path.join(os.getcwd(), BACKUP_DIR, backup_file_name)
 
+    if not os.path.exists(source_path):
+        print(f"エラー: データベースファイル '{DB_NAME}' が見つかりません。")
+        return
+
     try:
-        # データベースファイルをコピー
-        shutil.copy2(source_path, destination_path)
+        # WALモードでは書き込みの一部が -wal ファイルにあるため、ファイルのコピーではなく
+        # SQLiteのバックアップAPIで、アプリの実行中でも整合性のとれた複製を作成する
+        source = sqlite3.connect(source_path)
+        destination = sqlite3.connect(destination_path)
+        try:
+            with destination:
+                source.backup(destination)
+        finally:
+            destination.close()
+            source.close()
         print(f"データベース '{DB_NAME}' のバックアップを '{destination_path}' に作成しました。")
-    except FileNotFoundError:
-        print(f"エラー: データベースファイル '{DB_NAME}' が見つかりません。")
     except Exception as e:
         print(f"エラー: データベースのバックアップ中に問題が発生しました: {e}")
 
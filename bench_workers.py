@@ -0,0 +1,93 @@
+import argparse
+import os
+import random
+import shutil
+import tempfile
+import time
+from concurrent.futures import ProcessPoolExecutor, ThreadPoolExecutor
+
+# 複数プロセス運用 (launch_workers.py) でどこまで速くなり得るかの目安を調べるベンチマークです。
+# 画面1回分の処理に近い「ログイン照合 (bcrypt) + 一覧の読み込み (pandas) + 報告書HTMLの生成 + 下書きの保存」を
+# 同じ数のスレッド (1プロセス) と ProcessPoolExecutor の複数プロセスで db_utils を直接呼び出して実行し、
+# 1秒あたりの処理件数を比較します (GILによる直列化の影響だけを比べます)。
+# Streamlit・プロキシ・WebSocketは通らないため、launch_workers.py で起動した構成の応答時間の計測ではありません。
+# DBは一時ディレクトリのコピーを使うため、運用中のDBは変更しません。
+
+
+def _one_request(db_utils, render, password_hash: str, report_ids: list, draft_id: int, rng: random.Random):
+    from auth import _checkpw
+    _checkpw("benchmark", password_hash)
+    db_utils.get_pending_approvals()
+    db_utils.get_all_reports(labeled=True)
+    if report_ids:
+        report = db_utils.get_report_by_id(rng.choice(report_ids))
+        if report:
+            render.generate_report_html_content(report)
+    db_utils.save_draft_delta(draft_id, "benchmark", {"situation": f"負荷テスト {rng.random()}"})
+
+
+def run_for(db_path: str, duration: float, seed: int):
+    """duration 秒間処理を繰り返し、(処理件数, エラー件数, 経過秒数) を返します"""
+    import bcrypt
+    import db_utils
+    from db_utils import render
+    db_utils.DB_NAME = db_path
+
+    rng = random.Random(seed)
+    password_hash = bcrypt.hashpw(b"benchmark", bcrypt.gensalt(rounds=int(os.environ.get("BENCH_BCRYPT_ROUNDS", 10)))).decode("utf-8")
+    with db_utils.get_db_connection() as conn:
+        report_ids = [row[0] for row in conn.execute("SELECT id FROM reports ORDER BY id DESC LIMIT 200")]
+    draft_id = db_utils.create_draft("benchmark", f"負荷テスト {seed}", {"situation": ""})
+
+    count = errors = 0
+    started = time.perf_counter()
+    while time.perf_counter() - started < duration:
+        try:
+            _one_request(db_utils, render, password_hash, report_ids, draft_id, rng)
+            count += 1
+        except Exception as e:
+            errors += 1
+            print(f"ERROR: {e}")
+    return count, errors, time.perf_counter() - started
+
+
+def measure(mode: str, concurrency: int, db_path: str, duration: float):
+    """mode ("thread" / "process") で concurrency 個を並行に実行し、(1秒あたりの件数, エラー件数) を返します"""
+    executor_class = ThreadPoolExecutor if mode == "thread" else ProcessPoolExecutor
+    with executor_class(max_workers=concurrency) as executor:
+        futures = [executor.submit(run_for, db_path, duration, seed) for seed in range(concurrency)]
+        results = [future.result() for future in futures]
+    # プロセスの起動時間を含めないよう、各ワーカーが計測した時間で割ってから合計する
+    throughput = sum(count / elapsed for count, _, elapsed in results)
+    return throughput, sum(errors for _, errors, _ in results)
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(
+        description="db_utils の処理をスレッドと複数プロセスで直接実行し、処理件数を比較します (Streamlit・プロキシは通りません)。"
+    )
+    parser.add_argument("--db", default="incident_reports.db", help="コピー元のDBファイル")
+    parser.add_argument("--workers", default="1,2,4", help="並行数 (カンマ区切り)")
+    parser.add_argument("--duration", type=float, default=10.0, help="1回の計測時間 (秒)")
+    parser.add_argument("--modes", default="thread,process", help="計測する方式 (thread / process)")
+    args = parser.parse_args(argv)
+
+    with tempfile.TemporaryDirectory() as work_dir:
+        db_path = os.path.join(work_dir, "bench.db")
+        shutil.copy2(args.db, db_path)
+        import db_utils
+        db_utils.DB_NAME = db_path
+        db_utils.init_db() # スキーマを最新にし、WALに切り替える
+
+        print("db_utils を直接呼び出した処理件数です (Streamlit・プロキシ経由の応答時間ではありません)。")
+        print(f"{'方式':<8}{'並行数':>6}{'件/秒':>10}{'1並行比':>10}{'エラー':>8}")
+        for mode in args.modes.split(","):
+            baseline = None
+            for concurrency in [int(n) for n in args.workers.split(",")]:
+                throughput, errors = measure(mode, concurrency, db_path, args.duration)
+                baseline = baseline or throughput
+                print(f"{mode:<8}{concurrency:>6}{throughput:>10.1f}{throughput / baseline:>9.2f}x{errors:>8}")
+
+
+if __name__ == "__main__":
+    main()
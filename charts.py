@@ -0,0 +1,141 @@
+import os
+import threading
+from collections import OrderedDict
+
+import plotly.graph_objects as go
+import plotly.io as pio
+import streamlit as st
+
+# --- グラフ分析ページのグラフ表示 ---
+# グラフ (plotlyのFigure) は (グラフの名前, データの世代, 絞り込み条件) をキーにプロセス内にキャッシュし、
+# データも条件も変わっていない再実行ではFigureを作り直しません。
+# 動作の遅いPC向けに、グラフを画像 (PNG/SVG) にして表示する「画像表示」も選べます。
+# 画像への変換には kaleido が必要です。インストールされていない場合は通常の表示になります。
+
+CHART_RENDER_MODE = os.environ.get("CHART_RENDER_MODE", "interactive")  # 既定の表示方法 (interactive / static)
+STATIC_CHART_FORMAT = os.environ.get("STATIC_CHART_FORMAT", "png")      # 画像表示の形式 (png / svg)
+CHART_CACHE_SIZE = 64           # キャッシュするグラフ (と画像) の数の上限
+MAX_SERIES_POINTS = 400         # 時系列グラフに表示する点の数の上限 (これより多い場合は間引く)
+
+# plotlyの既定のテンプレートはグラフ1つごとに約7KBのJSONとしてブラウザに送られる。
+# 配色や文字はStreamlitのテーマが設定するため、全グラフ共通の小さなテンプレートだけを使う
+CHART_TEMPLATE = "incident_report"
+pio.templates[CHART_TEMPLATE] = go.layout.Template(layout={"margin": {"l": 10, "r": 10, "t": 60, "b": 10}})
+
+_figure_cache = OrderedDict()
+_image_cache = OrderedDict()
+_cache_lock = threading.Lock()
+_static_available = None        # 画像に変換できるか (最初に確認するまでNone。kaleidoが無い場合などはFalse)
+
+
+def freeze(value):
+    """絞り込み条件 (辞書・リスト) をキャッシュのキーに使える形 (タプル) にします"""
+    if isinstance(value, dict):
+        return tuple((key, freeze(item)) for key, item in sorted(value.items()))
+    if isinstance(value, (list, tuple, set)):
+        return tuple(freeze(item) for item in value)
+    return value
+
+
+def _cache_get(cache: OrderedDict, key):
+    with _cache_lock:
+        if key in cache:
+            cache.move_to_end(key)
+            return cache[key]
+    return None
+
+
+def _cache_put(cache: OrderedDict, key, value):
+    with _cache_lock:
+        cache[key] = value
+        cache.move_to_end(key)
+        while len(cache) > CHART_CACHE_SIZE:
+            cache.popitem(last=False)
+
+
+def cached_figure(key: tuple, build) -> go.Figure:
+    """key に対応するFigureを返します。無い場合だけ build() で作成します"""
+    figure = _cache_get(_figure_cache, key)
+    if figure is None:
+        figure = build()
+        _cache_put(_figure_cache, key, figure)
+    return figure
+
+
+def _cached_image(key: tuple, figure: go.Figure):
+    global _static_available
+    if not static_mode_available():
+        return None
+    image_key = key + (STATIC_CHART_FORMAT,)
+    image = _cache_get(_image_cache, image_key)
+    if image is None:
+        try:
+            image = figure.to_image(format=STATIC_CHART_FORMAT, width=900, height=500)
+        except Exception as e:
+            print(f"DEBUG: charts: グラフを画像に変換できないため、通常の表示にします: {e}")
+            _static_available = False
+            return None
+        _cache_put(_image_cache, image_key, image)
+    return image
+
+
+def show_chart(key: tuple, build, static: bool = False):
+    """
+    キャッシュしたグラフを表示します。static=True の場合は画像として表示します。
+    key にはグラフの名前・データの世代 (ReportCube.revision など)・絞り込み条件を含めてください。
+    """
+    figure = cached_figure(key, build)
+    if static:
+        image = _cached_image(key, figure)
+        if image is not None:
+            if STATIC_CHART_FORMAT == "svg":
+                st.image(image.decode("utf-8"), use_container_width=True)
+            else:
+                st.image(image, use_container_width=True)
+            return
+    st.plotly_chart(figure, use_container_width=True)
+
+
+def static_mode_available() -> bool:
+    """画像表示が使える場合にTrueを返します (最初の呼び出しで小さなグラフを変換して確認します)"""
+    global _static_available
+    if _static_available is None:
+        try:
+            go.Figure().to_image(format=STATIC_CHART_FORMAT, width=10, height=10)
+            _static_available = True
+        except Exception as e:
+            print(f"DEBUG: charts: グラフを画像に変換できないため、画像表示は使用できません: {e}")
+            _static_available = False
+    return _static_available
+
+
+def downsample_indexes(values: list, max_points: int = MAX_SERIES_POINTS) -> list:
+    """
+    時系列の点を max_points 個に間引き、残す点の位置を返します (Largest-Triangle-Three-Buckets)。
+    区間ごとに、前後の点と作る三角形が最も大きい点を残すため、山や谷の形は保たれます。
+    """
+    count = len(values)
+    if max_points < 3 or count <= max_points:
+        return list(range(count))
+    bucket_size = (count - 2) / (max_points - 2)
+    indexes = [0]
+    previous = 0
+    for i in range(max_points - 2):
+        start = int(i * bucket_size) + 1
+        end = int((i + 1) * bucket_size) + 1
+        next_end = min(int((i + 2) * bucket_size) + 1, count)
+        # 次の区間の平均 (最後の区間では最後の点) を三角形の3つ目の頂点にする
+        if end < next_end:
+            average_x = (end + next_end - 1) / 2
+            average_y = sum(values[end:next_end]) / (next_end - end)
+        else:
+            average_x, average_y = count - 1, values[-1]
+        best, best_area = start, -1.0
+        for j in range(start, end):
+            area = abs((previous - average_x) * (values[j] - values[previous]) - (previous - j) * (average_y - values[previous]))
+            if area > best_area:
+                best, best_area = j, area
+        indexes.append(best)
+        previous = best
+    indexes.append(count - 1)
+    return indexes
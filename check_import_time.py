@@ -0,0 +1,63 @@
+import argparse
+import os
+import subprocess
+import sys
+
+# 各ページが最初に読み込むモジュールと、その読み込みにかけてよい時間 (ミリ秒)
+IMPORT_BUDGETS_MS = {
+    "db_utils": 400,
+    "auth": 200,
+}
+# db_utils を読み込んだだけでは読み込まれてはいけない重いモジュール (PDFの生成時や通知時にだけ読み込む)
+LAZY_MODULES = ["weasyprint", "pandas", "lineworks_bot_room", "lineworks_api", "httpx", "jwt", "db_utils.render", "db_utils.export", "db_utils.notify"]
+
+def measure_import(module: str):
+    """
+    `python -X importtime` で module を新しいプロセスに読み込み、
+    (合計時間 (ミリ秒), 読み込まれたモジュール名の集合) を返します。
+    """
+    env = dict(os.environ, PYTHONDONTWRITEBYTECODE="1")
+    result = subprocess.run(
+        [sys.executable, "-X", "importtime", "-c", f"import {module}"],
+        capture_output=True, text=True, encoding="utf-8", errors="replace", env=env,
+        cwd=os.path.dirname(os.path.abspath(__file__)),
+    )
+    if result.returncode != 0:
+        raise RuntimeError(f"{module} を読み込めませんでした:\n{result.stderr}")
+
+    total_us = 0
+    imported = set()
+    for line in result.stderr.splitlines():
+        # 形式: "import time: self [us] | cumulative | imported package"
+        if not line.startswith("import time:") or "cumulative" in line:
+            continue
+        _, cumulative, name = line[len("import time:"):].split("|")
+        imported.add(name.strip())
+        if name.strip() == module:
+            total_us = int(cumulative)
+    return total_us / 1000, imported
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="主要モジュールの読み込み時間が予算内か、重いモジュールが遅延読み込みされているかを確認します。")
+    parser.add_argument("--scale", type=float, default=1.0, help="予算に掛ける倍率 (遅いPCで確認する場合など)")
+    args = parser.parse_args(argv)
+
+    failures = []
+    for module, budget_ms in IMPORT_BUDGETS_MS.items():
+        elapsed_ms, imported = measure_import(module)
+        limit_ms = budget_ms * args.scale
+        print(f"{module}: {elapsed_ms:.0f} ms (予算 {limit_ms:.0f} ms)")
+        if elapsed_ms > limit_ms:
+            failures.append(f"{module} の読み込みに {elapsed_ms:.0f} ms かかりました (予算 {limit_ms:.0f} ms)")
+        if module == "db_utils":
+            eager = [name for name in LAZY_MODULES if name in imported]
+            if eager:
+                failures.append(f"db_utils の読み込み時に次のモジュールが読み込まれています: {', '.join(eager)}")
+
+    if failures:
+        print("\n".join(f"NG: {failure}" for failure in failures))
+        sys.exit(1)
+    print("OK: すべて予算内です。")
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,195 @@
+import argparse
+import json
+import os
+import re
+import sys
+import tempfile
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+# lineworks_api.py の動作を、LINE WORKSの代わりのローカルのHTTPサーバーで確認します (実際のLINE WORKSには接続しません)。
+# - アクセストークンを有効期限まで使い回すか
+# - 同じファイルを再送するときにアップロードを省略し、fileId を再利用するか
+# - 再利用した fileId が拒否された場合 (HTTP 400/404/410) にアップロードし直して送信するか
+# - 複数ファイルのアップロードを同時に行うか (かかる時間が1件分に近いか)
+# - 応答の無いAPIでタイムアウトするか
+
+BOT_ID = "check-bot"
+
+
+class MockLineWorks(ThreadingHTTPServer):
+    """トークン・添付ファイル・メッセージのAPIを真似るサーバーです。呼び出された回数と送信されたメッセージを記録します"""
+    daemon_threads = True
+
+    def __init__(self, upload_delay: float, hang_seconds: float):
+        super().__init__(("127.0.0.1", 0), MockHandler)
+        self.upload_delay = upload_delay    # アップロード1回にかける時間 (秒)
+        self.hang_seconds = hang_seconds    # 送信先 "channels/hang" で応答を返さない時間 (秒)
+        self.rejected_file_ids = {}         # fileId -> メッセージの送信時に返すHTTPステータス
+        self.counts = {"token": 0, "attachments": 0, "upload": 0, "messages": 0}
+        self.messages = []                  # (送信先, 本文)
+        self.lock = threading.Lock()
+
+    @property
+    def base_url(self) -> str:
+        return f"http://127.0.0.1:{self.server_address[1]}"
+
+
+class MockHandler(BaseHTTPRequestHandler):
+    protocol_version = "HTTP/1.1"
+
+    def log_message(self, format, *args):
+        pass # 確認結果だけを表示する
+
+    def _reply(self, status: int, data: dict = None):
+        body = json.dumps(data or {}).encode("utf-8")
+        self.send_response(status)
+        self.send_header("Content-Type", "application/json")
+        self.send_header("Content-Length", str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def do_POST(self):
+        server = self.server
+        body = self.rfile.read(int(self.headers.get("Content-Length") or 0))
+        if self.path == "/auth/token":
+            with server.lock:
+                server.counts["token"] += 1
+            return self._reply(200, {"access_token": f"token-{server.counts['token']}", "expires_in": 86400})
+        if re.fullmatch(r"/api/bots/[^/]+/attachments", self.path):
+            with server.lock:
+                server.counts["attachments"] += 1
+                number = server.counts["attachments"]
+            return self._reply(200, {"uploadUrl": f"{server.base_url}/upload/{number}", "fileId": f"file-{number}"})
+        if self.path.startswith("/upload/"):
+            time.sleep(server.upload_delay)
+            with server.lock:
+                server.counts["upload"] += 1
+            return self._reply(200)
+        match = re.fullmatch(r"/api/bots/[^/]+/(.+)/messages", self.path)
+        if match:
+            destination, content = match.group(1), json.loads(body)["content"]
+            if destination == "channels/hang":
+                time.sleep(server.hang_seconds)
+            with server.lock:
+                status = server.rejected_file_ids.get(content.get("fileId"))
+                if status is None:
+                    server.counts["messages"] += 1
+                    server.messages.append((destination, content))
+            return self._reply(status or 201, {"code": "REJECTED"} if status else {})
+        self._reply(404)
+
+
+def _make_file(directory: str, name: str, size: int) -> str:
+    path = os.path.join(directory, name)
+    with open(path, "wb") as f:
+        f.write(os.urandom(size))
+    return path
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="lineworks_api.py のトークン・fileIdの再利用・同時アップロード・タイムアウトを確認します。")
+    parser.add_argument("--upload-delay", type=float, default=0.5, help="アップロード1回にかかる時間として待つ秒数")
+    parser.add_argument("--timeout", type=float, default=1.0, help="確認に使うAPI呼び出しのタイムアウト (秒)")
+    args = parser.parse_args(argv)
+
+    server = MockLineWorks(args.upload_delay, hang_seconds=args.timeout * 3)
+    threading.Thread(target=server.serve_forever, name="mock-lineworks", daemon=True).start()
+
+    sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+    import httpx
+    import lineworks_api
+    lineworks_api.BASE_AUTH_URL = f"{server.base_url}/auth"
+    lineworks_api.BASE_API_URL = f"{server.base_url}/api"
+    lineworks_api.API_TIMEOUT_SECONDS = args.timeout # HTTPクライアントは最初の呼び出しで作成するため、その前に変更する
+    lineworks_api._get_jwt = lambda client_id, service_account_id, privatekey: "check-jwt" # 秘密鍵での署名は行わない
+    credentials = {"client_id": "check-client", "client_secret": "secret", "service_account_id": "account", "privatekey": "key"}
+
+    failures = []
+
+    def check(ok: bool, message: str):
+        print(f"{'OK' if ok else 'NG'}: {message}")
+        if not ok:
+            failures.append(message)
+
+    with tempfile.TemporaryDirectory() as work_dir:
+        # 1. アクセストークンの使い回し
+        first = lineworks_api.get_access_token(credentials)
+        second = lineworks_api.get_access_token(credentials)
+        check(first == second and server.counts["token"] == 1, f"アクセストークンを使い回しました (取得 {server.counts['token']}回)")
+        token = first
+
+        # 2. 同じファイルの再送では fileId を再利用する
+        report = _make_file(work_dir, "report.pdf", 200 * 1024)
+        lineworks_api.send_file_message(report, BOT_ID, "channels/check", token)
+        lineworks_api.send_file_message(report, BOT_ID, "users/check", token)
+        sent = [content.get("fileId") for _, content in server.messages]
+        check(
+            server.counts["attachments"] == 1 and sent == ["file-1", "file-1"],
+            f"2回目の送信は fileId を再利用しました (アップロード {server.counts['attachments']}回, 送信した fileId {sent})"
+        )
+
+        # 3. 再利用した fileId が拒否された場合はアップロードし直す
+        for status in (400, 404, 410):
+            stale = f"file-{server.counts['attachments']}"
+            server.rejected_file_ids[stale] = status
+            uploads = server.counts["attachments"]
+            try:
+                lineworks_api.send_file_message(report, BOT_ID, "channels/check", token)
+                error = None
+            except Exception as e:
+                error = e
+            resent = server.messages[-1][1].get("fileId")
+            check(
+                error is None and server.counts["attachments"] == uploads + 1 and resent != stale,
+                f"HTTP {status} で拒否された fileId ({stale}) の代わりにアップロードし直して送信しました ({resent}{f', エラー: {error}' if error else ''})"
+            )
+
+        # 4. 複数ファイルのアップロードは同時に行う
+        files = [_make_file(work_dir, f"digest_{i}.pdf", 100 * 1024) for i in range(3)]
+        started = time.perf_counter()
+        lineworks_api.send_file_messages(files, BOT_ID, "channels/check", token)
+        elapsed = time.perf_counter() - started
+        sequential = args.upload_delay * len(files)
+        check(
+            elapsed < sequential * 0.75,
+            f"{len(files)}件のアップロードを {elapsed:.2f}秒で送信しました (順に行う場合 {sequential:.2f}秒以上)"
+        )
+        order = [content.get("fileId") for _, content in server.messages[-len(files):]]
+        check(len(set(order)) == len(files), f"ファイルメッセージを {len(files)}件送信しました ({order})")
+
+        # 5. 応答の無いAPIはタイムアウトする
+        content = {"content": {"type": "text", "text": "check"}}
+        started = time.perf_counter()
+        try:
+            lineworks_api.send_bot_message(content, BOT_ID, "channels/hang", token)
+            error = None
+        except Exception as e:
+            error = e
+        elapsed = time.perf_counter() - started
+        check(
+            isinstance(error, httpx.TimeoutException) and elapsed < args.timeout * 2,
+            f"応答の無いAPIの呼び出しが {elapsed:.2f}秒で {type(error).__name__} になりました (タイムアウト {args.timeout}秒)"
+        )
+        started = time.perf_counter()
+        try:
+            lineworks_api.run(lineworks_api.send_bot_message_async(content, BOT_ID, "channels/hang", token), timeout=args.timeout / 2)
+            error = None
+        except Exception as e:
+            error = e
+        elapsed = time.perf_counter() - started
+        check(
+            isinstance(error, TimeoutError) and elapsed < args.timeout,
+            f"同期の呼び出しが待つ時間の上限 ({args.timeout / 2}秒) で {type(error).__name__} になりました ({elapsed:.2f}秒)"
+        )
+
+    print(f"アップロードの記録: {lineworks_api.get_upload_metrics()}")
+    server.shutdown()
+    if failures:
+        sys.exit(1)
+    print("OK: すべての確認に合格しました。")
+
+
+if __name__ == "__main__":
+    main()
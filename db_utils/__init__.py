@@ -0,0 +1,1174 @@
+﻿"""
+データベース操作の共通モジュールです。
+
+PDFの生成 (WeasyPrint)、CSV/PDFファイルの出力 (pandas)、LINE WORKSへの通知は読み込みに時間がかかるため、
+サブモジュールに分けています。
+    db_utils.render : 報告書・下書きのHTML/PDF生成
+    db_utils.export : 承認済みレポートのCSV/PDFファイル出力とバッチ処理
+    db_utils.notify : LINE WORKSへの通知 (送信先ごとのキューから送信し、続いた通知は1通にまとめる)
+    db_utils.analytics : グラフ分析用の期間ごとの件数の集計とクロス集計 (キューブ)
+    db_utils.digest : 週報・月報のPDFの作成と自動作成のスケジューラー
+    db_utils.maintenance : 削除済みデータの完全削除・VACUUM・統計情報の更新 (1日1回の定期メンテナンス)
+    db_utils.archive : 古い承認済みレポートの年ごとのアーカイブDBへの移動と、アーカイブを含めた読み込み
+    db_utils.snapshot : 集計 (グラフ分析・週報月報) 用の読み取り専用スナップショット
+サブモジュールの関数も `from db_utils import generate_and_save_report_pdf` のように
+これまでどおりインポートできます。その場合も、実際に使われるまでサブモジュールは読み込まれません。
+"""
+import sqlite3
+import datetime
+import importlib
+import json
+import os
+import sys
+from typing import TYPE_CHECKING
+from auth import hash_password, hash_password_bounded, check_password, needs_rehash, check_login_rate, reset_login_rate, AuthBusyError # パスワードのハッシュ化とログイン試行の制限
+import threading
+import time
+import hashlib
+import zlib
+from collections import OrderedDict
+from dotenv import load_dotenv
+from report_schema import FIELDS, PENDING_STATUSES, APPROVAL_TRANSITIONS, STATUS_FIRST_APPROVED, STATUS_APPROVED, select_list, is_draft_key # 報告項目のスキーマ定義
+
+if TYPE_CHECKING:
+    import pandas as pd
+
+# .envファイルを読み込む
+load_dotenv()
+
+# --- サブモジュールの遅延読み込み ---
+# 名前 -> サブモジュール。db_utils.<名前> が初めて参照されたときにサブモジュールを読み込む
+_LAZY_ATTRIBUTES = {
+    "HTML_TEMPLATE": "render",
+    "DRAFT_HTML_TEMPLATE": "render",
+    "render_field_rows": "render",
+    "generate_report_html_content": "render",
+    "generate_draft_html_content": "render",
+    "generate_draft_pdf_bytes": "render",
+    "generate_and_save_report_csv": "export",
+    "generate_and_save_report_pdf": "export",
+    "process_approved_reports": "export",
+    "start_approval_batch_worker": "export",
+    "submit_job": "jobs",
+    "get_report_counts": "analytics",
+    "get_report_trend": "analytics",
+    "get_report_cube": "analytics",
+    "get_detail_cube": "analytics",
+    "generate_digest": "digest",
+    "start_digest_scheduler": "digest",
+    "run_maintenance": "maintenance",
+    "start_maintenance_scheduler": "maintenance",
+    "archive_reports": "archive",
+    "reports_source": "archive",
+    "iter_reports_sources": "archive",
+    "snapshot_connection": "snapshot",
+    "refresh_snapshot": "snapshot",
+}
+
+def __getattr__(name):
+    module_name = _LAZY_ATTRIBUTES.get(name)
+    if module_name is None:
+        raise AttributeError(f"module {__name__!r} has no attribute {name!r}")
+    return getattr(importlib.import_module(f"{__name__}.{module_name}"), name)
+
+DB_NAME = "incident_reports.db"
+# 他のプロセスが書き込み中の場合に待つ秒数 (複数プロセスで運用する場合のロック待ち)
+DB_BUSY_TIMEOUT_SECONDS = float(os.environ.get("DB_BUSY_TIMEOUT_SECONDS", 15))
+# ジャーナルモード。WALでは書き込み中も他のプロセスが読み込めるため、複数プロセスで同じDBを共有できる
+DB_JOURNAL_MODE = os.environ.get("DB_JOURNAL_MODE", "WAL")
+
+# 承認待ちステータスの条件式。部分インデックスを使わせるため、クエリとインデックスで同じリテラルを使う
+PENDING_STATUS_CONDITION = "status IN ({})".format(", ".join(f"'{status}'" for status in PENDING_STATUSES))
+
+# 削除されていないレポートのビュー。一覧・集計・出力はこのビューから読む (論理削除したレポートは含まれない)
+REPORTS_VIEW = "active_reports"
+
+# 承認待ち一覧で表示する列
+PENDING_SUMMARY_COLUMNS = ["id", "status", "occurrence_datetime", "job_type", "location", "content_category", "reporter_name", "level", "revision"]
+
+def get_db_connection():
+    """データベース接続を取得します"""
+    return sqlite3.connect(DB_NAME, timeout=DB_BUSY_TIMEOUT_SECONDS)
+
+# --- スキーママイグレーション ---
+# スキーマの変更は番号付きの手順として MIGRATIONS に追加し、適用済みの番号を PRAGMA user_version に記録します。
+# init_db() はプロセスごとに一度だけ確認し、スキーマが最新なら user_version を読むだけで終わります。
+# 各手順は、user_version を持たない既存のデータベースに適用しても問題がないように書きます。
+# コマンドラインからは `python migrate_db.py` で適用できます。
+
+def _migration_base_tables(cursor):
+    """reportsテーブルとusersテーブル (不足しているカラムの追加を含む)"""
+    # --- インシデント報告テーブル ---
+    cursor.execute('''
+        CREATE TABLE IF NOT EXISTS reports (
+            id INTEGER PRIMARY KEY AUTOINCREMENT,
+            occurrence_datetime DATETIME NOT NULL,
+            reporter_name TEXT NOT NULL,
+            job_type TEXT,
+            level TEXT,
+            location TEXT,
+            connection_with_accident TEXT,
+            years_of_experience TEXT,
+            years_since_joining TEXT,
+            patient_ID TEXT,
+            patient_name TEXT,
+            patient_gender TEXT,
+            patient_age INTEGER,
+            dementia_status TEXT,
+            patient_status_change_accident TEXT,
+            patient_status_change_patient_explanation TEXT,
+            patient_status_change_family_explanation TEXT,
+            content_category TEXT,
+            content_details TEXT,
+            content_details_shinsatsu TEXT,
+            content_details_shochi TEXT,
+            content_details_uketsuke TEXT,
+            content_details_houshasen TEXT,
+            content_details_rehabili TEXT,
+            content_details_kanjataio TEXT,
+            content_details_buhin TEXT,
+            injury_details TEXT,
+            injury_other_text TEXT,
+            cause_details TEXT,
+            manual_relation TEXT,
+            situation TEXT NOT NULL,
+            countermeasure TEXT NOT NULL,
+            created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+            status TEXT,
+            approver1 TEXT,
+            approved_at1 DATETIME,
+            approver2 TEXT,
+            approved_at2 DATETIME,
+            manager_comments TEXT,
+            revision INTEGER NOT NULL DEFAULT 0
+        )
+    ''')
+
+    # --- usersテーブル ---
+    cursor.execute('''
+        CREATE TABLE IF NOT EXISTS users (
+            id INTEGER PRIMARY KEY AUTOINCREMENT,
+            username TEXT UNIQUE NOT NULL,
+            password_hash TEXT NOT NULL,
+            role TEXT NOT NULL,
+            created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP
+        )
+    ''')
+
+    # --- テーブルスキーマのマイグレーション (reportsテーブル) ---
+    cursor.execute("PRAGMA table_info(reports)")
+    columns = [row[1] for row in cursor.fetchall()]
+
+    expected_columns_reports = {
+        "years_of_experience": "TEXT",
+        "years_since_joining": "TEXT",
+        "patient_gender": "TEXT",
+        "patient_age": "INTEGER",
+        "dementia_status": "TEXT",
+        "patient_status_change_accident": "TEXT",
+        "patient_status_change_patient_explanation": "TEXT",
+        "patient_status_change_family_explanation": "TEXT",
+        "status": "TEXT",
+        "approver1": "TEXT",
+        "approved_at1": "DATETIME",
+        "approver2": "TEXT",
+        "approved_at2": "DATETIME",
+        "manager_comments": "TEXT",
+        "content_details_shinsatsu": "TEXT",
+        "content_details_shochi": "TEXT",
+        "content_details_uketsuke": "TEXT",
+        "content_details_houshasen": "TEXT",
+        "content_details_rehabili": "TEXT",
+        "content_details_kanjataio": "TEXT",
+        "content_details_kiki": "TEXT",
+        "content_details_sonota": "TEXT",
+        "injury_details": "TEXT",
+        "injury_other_text": "TEXT",
+        "revision": "INTEGER NOT NULL DEFAULT 0"
+    }
+
+    for col_name, col_type in expected_columns_reports.items():
+        if col_name not in columns:
+            cursor.execute(f"ALTER TABLE reports ADD COLUMN {col_name} {col_type}")
+
+    # --- usersテーブルのマイグレーション ---
+    cursor.execute("PRAGMA table_info(users)")
+    user_columns = [row[1] for row in cursor.fetchall()]
+
+    expected_columns_users = {
+        "lineworks_id": "TEXT"
+    }
+
+    for col_name, col_type in expected_columns_users.items():
+        if col_name not in user_columns:
+            cursor.execute(f"ALTER TABLE users ADD COLUMN {col_name} {col_type}")
+
+def _migration_pending_index(cursor):
+    """承認待ち一覧用の部分インデックス"""
+    # 承認待ち (未読・承認中) のレポートだけを対象にした部分インデックス
+    cursor.execute(f"CREATE INDEX IF NOT EXISTS idx_reports_pending ON reports (occurrence_datetime DESC) WHERE {PENDING_STATUS_CONDITION}")
+
+def _migration_user_drafts(cursor):
+    """ユーザーごとの圧縮された下書きと自動保存の差分"""
+    # --- 下書きテーブル ---
+    cursor.execute('''
+        CREATE TABLE IF NOT EXISTS drafts (
+            id INTEGER PRIMARY KEY AUTOINCREMENT,
+            title TEXT,
+            data_json TEXT,
+            created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+            owner TEXT,
+            updated_at TIMESTAMP,
+            reporter_name TEXT,
+            payload BLOB
+        )
+    ''')
+    # 自動保存の差分 (変更のあった項目だけを圧縮して追記する)
+    cursor.execute('''
+        CREATE TABLE IF NOT EXISTS draft_deltas (
+            id INTEGER PRIMARY KEY AUTOINCREMENT,
+            draft_id INTEGER NOT NULL,
+            payload BLOB NOT NULL,
+            created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP
+        )
+    ''')
+
+    # --- draftsテーブルのマイグレーション ---
+    cursor.execute("PRAGMA table_info(drafts)")
+    draft_columns = [row[1] for row in cursor.fetchall()]
+
+    expected_columns_drafts = {
+        "owner": "TEXT",
+        "updated_at": "TIMESTAMP",
+        "reporter_name": "TEXT",
+        "payload": "BLOB"
+    }
+
+    for col_name, col_type in expected_columns_drafts.items():
+        if col_name not in draft_columns:
+            cursor.execute(f"ALTER TABLE drafts ADD COLUMN {col_name} {col_type}")
+    _migrate_legacy_drafts(cursor)
+
+    cursor.execute("CREATE INDEX IF NOT EXISTS idx_drafts_owner ON drafts (owner, updated_at DESC)")
+    cursor.execute("CREATE INDEX IF NOT EXISTS idx_drafts_updated_at ON drafts (updated_at)")
+    cursor.execute("CREATE INDEX IF NOT EXISTS idx_draft_deltas_draft_id ON draft_deltas (draft_id, id)")
+
+def _migration_jobs(cursor):
+    """PDF生成と通知を専用のワーカープロセスに渡すためのジョブキュー (db_utils.jobs)"""
+    cursor.execute('''
+        CREATE TABLE IF NOT EXISTS jobs (
+            id INTEGER PRIMARY KEY AUTOINCREMENT,
+            kind TEXT NOT NULL,
+            payload TEXT NOT NULL,
+            status TEXT NOT NULL DEFAULT 'pending',
+            attempts INTEGER NOT NULL DEFAULT 0,
+            worker TEXT,
+            error TEXT,
+            created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+            started_at TIMESTAMP,
+            finished_at TIMESTAMP
+        )
+    ''')
+    cursor.execute("CREATE INDEX IF NOT EXISTS idx_jobs_pending ON jobs (id) WHERE status = 'pending'")
+
+def _migration_occurrence_index(cursor):
+    """期間ごとの集計 (db_utils.analytics) 用のインデックス"""
+    # 絞り込みに使う列も含め、集計がテーブル本体を読まずにインデックスだけで済むようにする
+    cursor.execute("CREATE INDEX IF NOT EXISTS idx_reports_occurrence ON reports (occurrence_datetime, level, location, job_type)")
+
+def _migration_digests(cursor):
+    """週報・月報の作成と投稿の記録 (db_utils.digest)。同じ期間を二重に作成・投稿しないために使う"""
+    cursor.execute('''
+        CREATE TABLE IF NOT EXISTS digests (
+            id INTEGER PRIMARY KEY AUTOINCREMENT,
+            kind TEXT NOT NULL,
+            period_start TEXT NOT NULL,
+            period_end TEXT NOT NULL,
+            status TEXT NOT NULL DEFAULT 'running',
+            filepath TEXT,
+            report_count INTEGER,
+            started_at TIMESTAMP,
+            finished_at TIMESTAMP,
+            posted_at TIMESTAMP,
+            UNIQUE (kind, period_start)
+        )
+    ''')
+
+def _migration_report_events(cursor):
+    """レポートの変更履歴 (追記のみ)。変更された列だけを {列: [変更前, 変更後]} のJSONで保存する"""
+    cursor.execute('''
+        CREATE TABLE IF NOT EXISTS report_events (
+            id INTEGER PRIMARY KEY AUTOINCREMENT,
+            report_id INTEGER NOT NULL,
+            event TEXT NOT NULL,
+            actor TEXT,
+            revision INTEGER,
+            changes TEXT,
+            created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP
+        )
+    ''')
+    cursor.execute("CREATE INDEX IF NOT EXISTS idx_report_events_report ON report_events (report_id, id)")
+    cursor.execute("CREATE INDEX IF NOT EXISTS idx_report_events_created_at ON report_events (created_at)")
+    # 記録した履歴は変更・削除できないようにする
+    for statement in ("UPDATE", "DELETE"):
+        cursor.execute(
+            f"CREATE TRIGGER IF NOT EXISTS report_events_no_{statement.lower()} BEFORE {statement} ON report_events "
+            f"BEGIN SELECT RAISE(ABORT, 'report_events is append-only'); END"
+        )
+
+def _migration_soft_delete(cursor):
+    """レポート・下書きの論理削除と、定期メンテナンス (db_utils.maintenance) の記録"""
+    for table in ("reports", "drafts"):
+        cursor.execute(f"PRAGMA table_info({table})")
+        if "deleted_at" not in [row[1] for row in cursor.fetchall()]:
+            cursor.execute(f"ALTER TABLE {table} ADD COLUMN deleted_at TIMESTAMP")
+    cursor.execute(f"CREATE VIEW IF NOT EXISTS {REPORTS_VIEW} AS SELECT * FROM reports WHERE deleted_at IS NULL")
+
+    # 一覧・集計のインデックスを、削除されていない行だけの部分インデックスに作り直す
+    cursor.execute("DROP INDEX IF EXISTS idx_reports_pending")
+    cursor.execute(
+        f"CREATE INDEX idx_reports_pending ON reports (occurrence_datetime DESC) WHERE {PENDING_STATUS_CONDITION} AND deleted_at IS NULL"
+    )
+    cursor.execute("DROP INDEX IF EXISTS idx_reports_occurrence")
+    cursor.execute("CREATE INDEX idx_reports_occurrence ON reports (occurrence_datetime, level, location, job_type) WHERE deleted_at IS NULL")
+    cursor.execute("DROP INDEX IF EXISTS idx_drafts_owner")
+    cursor.execute("CREATE INDEX idx_drafts_owner ON drafts (owner, updated_at DESC) WHERE deleted_at IS NULL")
+    # 保存期間を過ぎた削除済みの行を探すためのインデックス (削除済みの行だけを含む)
+    cursor.execute("CREATE INDEX IF NOT EXISTS idx_reports_deleted_at ON reports (deleted_at) WHERE deleted_at IS NOT NULL")
+    cursor.execute("CREATE INDEX IF NOT EXISTS idx_drafts_deleted_at ON drafts (deleted_at) WHERE deleted_at IS NOT NULL")
+
+    cursor.execute('''
+        CREATE TABLE IF NOT EXISTS maintenance_runs (
+            id INTEGER PRIMARY KEY AUTOINCREMENT,
+            status TEXT NOT NULL DEFAULT 'running',
+            started_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+            finished_at TIMESTAMP,
+            purged_reports INTEGER,
+            purged_drafts INTEGER,
+            page_size INTEGER,
+            pages_before INTEGER,
+            pages_after INTEGER,
+            freelist_before INTEGER,
+            freelist_after INTEGER,
+            file_bytes_before INTEGER,
+            file_bytes_after INTEGER,
+            error TEXT
+        )
+    ''')
+
+def _migration_report_archives(cursor):
+    """年ごとのアーカイブDB (db_utils.archive) の一覧"""
+    cursor.execute('''
+        CREATE TABLE IF NOT EXISTS report_archives (
+            year INTEGER PRIMARY KEY,
+            filename TEXT NOT NULL,
+            report_count INTEGER NOT NULL DEFAULT 0,
+            archived_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP
+        )
+    ''')
+    cursor.execute("PRAGMA table_info(maintenance_runs)")
+    if "archived_reports" not in [row[1] for row in cursor.fetchall()]:
+        cursor.execute("ALTER TABLE maintenance_runs ADD COLUMN archived_reports INTEGER")
+
+# (バージョン, 説明, 手順) の順に並べます。適用済みの手順は変更せず、新しい手順を末尾に追加してください。
+MIGRATIONS = [
+    (1, "reports / users テーブル", _migration_base_tables),
+    (2, "承認待ちの部分インデックス", _migration_pending_index),
+    (3, "ユーザーごとの下書き", _migration_user_drafts),
+    (4, "バックグラウンド処理のジョブキュー", _migration_jobs),
+    (5, "期間ごとの集計用のインデックス", _migration_occurrence_index),
+    (6, "週報・月報の作成記録", _migration_digests),
+    (7, "レポートの変更履歴", _migration_report_events),
+    (8, "論理削除と定期メンテナンスの記録", _migration_soft_delete),
+    (9, "年ごとのアーカイブDBの一覧", _migration_report_archives),
+]
+SCHEMA_VERSION = MIGRATIONS[-1][0]
+
+_schema_checked = False
+_schema_lock = threading.Lock()
+
+def get_schema_version(conn) -> int:
+    """データベースに適用済みのマイグレーションのバージョンを返します"""
+    return conn.execute("PRAGMA user_version").fetchone()[0]
+
+def migrate_db() -> list:
+    """
+    未適用のマイグレーションを順に適用し、適用したバージョンのリストを返します。
+    手順ごとに BEGIN IMMEDIATE で書き込みロックを取ってからバージョンを確認するため、
+    複数のプロセスが同時に起動しても同じ手順が二重に実行されることはありません。
+    """
+    applied = []
+    with get_db_connection() as conn:
+        if get_schema_version(conn) >= SCHEMA_VERSION:
+            return applied
+        cursor = conn.cursor()
+        for version, description, step in MIGRATIONS:
+            cursor.execute("BEGIN IMMEDIATE")
+            try:
+                if get_schema_version(conn) >= version:
+                    conn.rollback()
+                    continue
+                step(cursor)
+                cursor.execute(f"PRAGMA user_version = {int(version)}")
+                conn.commit()
+            except Exception:
+                conn.rollback()
+                raise
+            print(f"DEBUG: migrate_db: マイグレーション {version} ({description}) を適用しました。")
+            applied.append(version)
+    return applied
+
+def init_db(force: bool = False):
+    """
+    データベースのスキーマを最新にします。
+    確認はプロセスごとに一度だけ行い、2回目以降の呼び出しは何もしません (force=True で再確認します)。
+    """
+    global _schema_checked
+    if _schema_checked and not force:
+        return
+    with _schema_lock:
+        if _schema_checked and not force:
+            return
+        migrate_db()
+        with get_db_connection() as conn:
+            # journal_modeはDBファイルに保存されるため、切り替えは最初の1回だけ実際に行われる
+            conn.execute(f"PRAGMA journal_mode={DB_JOURNAL_MODE}")
+        _schema_checked = True
+
+# --- ユーザー関連 ---
+
+def add_user(username, password, role='general'):
+    """新しいユーザーをデータベースに追加します。パスワードはハッシュ化されます。"""
+    with get_db_connection() as conn:
+        cursor = conn.cursor()
+        hashed_password = hash_password_bounded(password)
+        try:
+            cursor.execute("INSERT INTO users (username, password_hash, role) VALUES (?, ?, ?)",
+                           (username, hashed_password, role))
+            conn.commit()
+            invalidate_user_cache()
+            return True
+        except sqlite3.IntegrityError:
+            # usernameがUNIQUE制約に違反した場合（既に存在する）
+            return False
+
+def get_user_by_username(username):
+    """ユーザー名でユーザー情報を取得します。"""
+    with get_db_connection() as conn:
+        conn.row_factory = sqlite3.Row # カラム名をキーとしてアクセスできるようにする
+        cursor = conn.cursor()
+        cursor.execute("SELECT id, username, password_hash, role FROM users WHERE username = ?", (username,))
+        user_data = cursor.fetchone()
+        if user_data:
+            return dict(user_data)
+        return None
+
+def verify_password(plain_password, hashed_password):
+    """平文パスワードとハッシュ化されたパスワードを比較して検証します。"""
+    return check_password(plain_password, hashed_password)
+
+LOGIN_FAILED_MESSAGE = "ユーザー名またはパスワードが間違っています。"
+
+def authenticate_user(username, password, client: str = None):
+    """
+    ログイン認証を行います。試行回数の制限を超えている場合は、DBやbcryptを使わずにすぐ拒否します。
+    保存済みのハッシュのコストが現在の設定 (BCRYPT_ROUNDS) と異なる場合は、新しいコストで再ハッシュします。
+
+    Returns:
+        tuple: (成功した場合はユーザー情報の辞書、失敗した場合はNone, エラーメッセージ)
+    """
+    wait = check_login_rate(username, client)
+    if wait:
+        return None, f"ログインの試行回数が多すぎます。{int(wait) + 1}秒後に再度お試しください。"
+
+    user = get_user_by_username(username)
+    if not user:
+        return None, LOGIN_FAILED_MESSAGE
+    try:
+        if not verify_password(password, user['password_hash']):
+            return None, LOGIN_FAILED_MESSAGE
+    except AuthBusyError:
+        return None, "ログインが混み合っています。しばらくしてから再度お試しください。"
+
+    reset_login_rate(username)
+    if needs_rehash(user['password_hash']):
+        with get_db_connection() as conn:
+            conn.execute("UPDATE users SET password_hash = ? WHERE id = ?", (hash_password(password), user['id']))
+            conn.commit()
+        invalidate_user_cache()
+        print(f"DEBUG: authenticate_user: {user['username']} のパスワードを現在のコストで再ハッシュしました。")
+    return user, ""
+
+# --- レポート関連 ---
+
+# 集計に使う列。これらの列が変わった場合だけ、集計のキャッシュ (db_utils.analytics) に変更を知らせる
+ANALYTICS_COLUMNS = {"occurrence_datetime", "level", "location", "job_type", "content_category", "content_details"}
+
+def _reports_changed(occurrences: list = None):
+    """レポートの変更を集計のキャッシュに知らせます (発生日時が不明な場合はNone。集計を使っていないプロセスでは何もしません)"""
+    analytics = sys.modules.get(f"{__name__}.analytics")
+    if analytics is not None:
+        analytics.invalidate_report_counts(occurrences)
+
+# --- 変更履歴 (report_events) ---
+# レポートの作成・修正・状態遷移・削除を、レポートの更新と同じトランザクションで report_events に追記します。
+# changes には変更された列だけを保存します。作成時は行そのものが初期値のため保存せず、削除時は削除前の値を保存します。
+
+def _audit_value(value):
+    """値を、DBに保存される形 (変更の有無の比較とJSONへの変換ができる形) にそろえます"""
+    if isinstance(value, datetime.datetime):
+        return value.isoformat(" ")
+    if isinstance(value, datetime.date):
+        return value.isoformat()
+    if isinstance(value, (list, dict)):
+        return json.dumps(value, ensure_ascii=False)
+    if hasattr(value, "item"): # numpy の数値
+        return value.item()
+    return value
+
+def _read_report_columns(cursor, report_id: int, columns) -> dict:
+    """レポートの指定された列と revision の現在の値を返します。レポートが無い場合は None です"""
+    columns = [column for column in columns if column != "revision"] + ["revision"]
+    cursor.execute(f"SELECT {', '.join(columns)} FROM reports WHERE id = ?", (report_id,))
+    row = cursor.fetchone()
+    return dict(zip(columns, row)) if row is not None else None
+
+def _report_event(report_id: int, event: str, actor: str, before: dict, after: dict) -> tuple:
+    """report_events に追記する1行を作成します (before は更新前の値、after は更新した列と値)"""
+    changes = {}
+    for column, value in after.items():
+        value = _audit_value(value)
+        if before.get(column) != value:
+            changes[column] = [before.get(column), value]
+    encoded = json.dumps(changes, ensure_ascii=False, separators=(",", ":"), default=str) if changes else None
+    return report_id, event, actor, before.get("revision", 0) + 1, encoded
+
+def _record_report_events(cursor, rows: list):
+    if rows:
+        cursor.executemany("INSERT INTO report_events (report_id, event, actor, revision, changes) VALUES (?, ?, ?, ?, ?)", rows)
+
+def get_report_events(report_id: int = None, since: datetime.datetime = None, limit: int = None) -> list:
+    """
+    変更履歴を古い順に返します。report_id を指定した場合はそのレポートの履歴、
+    since を指定した場合はその日時 (UTC) 以降の履歴です。どちらもインデックスで絞り込みます。
+    changes は {列: [変更前, 変更後]} の辞書です。
+    """
+    conditions, params = [], []
+    if report_id is not None:
+        conditions.append("report_id = ?")
+        params.append(int(report_id))
+    if since is not None:
+        conditions.append("created_at >= ?")
+        params.append(since.strftime("%Y-%m-%d %H:%M:%S"))
+    sql = "SELECT id, report_id, event, actor, revision, changes, created_at FROM report_events"
+    if conditions:
+        sql += " WHERE " + " AND ".join(conditions)
+    # 期間だけで絞り込む場合は created_at のインデックスの順に読む (作成日時が同じ場合はID順)
+    sql += " ORDER BY created_at, id" if report_id is None and since is not None else " ORDER BY id"
+    if limit:
+        sql += f" LIMIT {int(limit)}"
+    with get_db_connection() as conn:
+        conn.row_factory = sqlite3.Row
+        rows = conn.execute(sql, params).fetchall()
+    return [dict(row, changes=json.loads(row["changes"]) if row["changes"] else {}) for row in rows]
+
+def get_report_by_id(report_id: int, labeled: bool = False, include_archive: bool = False):
+    """
+    IDで特定のインシデント報告を取得します。labeled=True の場合はキーが日本語ラベルになります。
+    include_archive=True の場合は、アーカイブ済みのレポートも探します (CSV/PDFの出力し直しなど)。
+    """
+    import pandas as pd
+    columns = select_list() if labeled else "*"
+    with get_db_connection() as conn:
+        df = pd.read_sql(f"SELECT {columns} FROM {REPORTS_VIEW} WHERE id = ?", conn, params=(report_id,))
+        if df.empty and include_archive:
+            from db_utils.archive import find_archived_report
+            source = find_archived_report(conn, report_id)
+            if source is not None:
+                df = pd.read_sql(f"SELECT {columns} FROM {source} WHERE id = ?", conn, params=(report_id,))
+        if not df.empty:
+            return df.iloc[0].to_dict()
+        return None
+
+def add_report(data: dict, status: str = '未読', created_at: datetime.datetime = None, actor: str = None):
+    """インシデント報告をデータベースに追加します (actor は変更履歴に記録する操作したユーザー)"""
+    data['status'] = status
+    if created_at:
+        data['created_at'] = created_at.isoformat()
+    # 新しい詳細項目をJSON文字列として保存
+    for key in ['content_details_shinsatsu', 'content_details_shochi', 'content_details_uketsuke', 'content_details_houshasen', 'content_details_rehabili', 'content_details_kanjataio', 'content_details_kiki', 'content_details_sonota', 'injury_details']:
+        if key in data and isinstance(data[key], list):
+            data[key] = json.dumps(data[key], ensure_ascii=False)
+    if 'injury_other_text' in data and data['injury_other_text'] is None:
+        data['injury_other_text'] = ""
+
+    with get_db_connection() as conn:
+        cursor = conn.cursor()
+        columns = ', '.join(data.keys())
+        placeholders = ', '.join(['?'] * len(data))
+        sql = f"INSERT INTO reports ({columns}) VALUES ({placeholders})"
+        cursor.execute(sql, tuple(data.values()))
+        report_id = cursor.lastrowid # 新しく挿入されたレポートのIDを取得
+        _record_report_events(cursor, [(report_id, "create", actor, 0, None)])
+        conn.commit()
+        _reports_changed([data.get('occurrence_datetime')])
+
+        # ステータスが「承認済み」の場合、CSVとPDFを生成
+        if data['status'] == '承認済み':
+            # 過去データ報告からの追加なのでapprover_idはNone、通知もしない
+            from db_utils.jobs import submit_job # CSV/PDFの生成と通知はジョブとして実行する
+            submit_job("export_report", {"report_id": report_id, "approver_id": None, "notify": False})
+
+def add_reports_many(records: list, actor: str = None) -> list:
+    """
+    検証済みの複数レポートを1つのトランザクションで executemany により追加します (一括取り込み用)。
+    add_report と異なり、CSV/PDFの生成は行いません。必要な場合は process_approved_reports に
+    戻り値のIDを渡してまとめて生成してください。
+
+    Returns:
+        list: 追加したレポートのID (records と同じ順)
+    """
+    if not records:
+        return []
+    # レコードごとに項目が欠けていても同じINSERT文を使えるよう、列はスキーマ定義順の和集合にそろえる
+    present = set().union(*(record.keys() for record in records))
+    columns = [field.column for field in FIELDS if field.column in present and field.column != "id"]
+    sql = f"INSERT INTO reports ({', '.join(columns)}) VALUES ({', '.join(['?'] * len(columns))})"
+
+    with get_db_connection() as conn:
+        cursor = conn.cursor()
+        # 書き込みロックを先に取得し、この間に他の接続が行を追加しないようにする
+        cursor.execute("BEGIN IMMEDIATE")
+        cursor.execute("SELECT COALESCE(MAX(id), 0) FROM reports")
+        last_id = cursor.fetchone()[0]
+        cursor.executemany(sql, [tuple(record.get(column) for column in columns) for record in records])
+        cursor.execute("SELECT id FROM reports WHERE id > ? ORDER BY id", (last_id,))
+        report_ids = [row[0] for row in cursor.fetchall()]
+        _record_report_events(cursor, [(report_id, "import", actor, 0, None) for report_id in report_ids])
+        conn.commit()
+    _reports_changed([record.get("occurrence_datetime") for record in records])
+    return report_ids
+
+# --- 承認ワークフロー (楽観的排他制御) ---
+
+REVISION_CONFLICT_MESSAGE = "このレポートは他のユーザーによって更新されています。最新の状態を確認してから再度操作してください。"
+
+def _now_jst():
+    return datetime.datetime.now(datetime.timezone(datetime.timedelta(hours=9)))
+
+def _compare_and_set_report(cursor, report_id: int, expected_revision: int, updates: dict) -> bool:
+    """
+    revisionが expected_revision と一致する場合だけレポートを更新し、revisionを1つ進めます。
+    他のユーザーが先に更新していた場合は何も変更せず False を返します。
+    """
+    set_clauses = [f"{key} = ?" for key in updates.keys()]
+    sql = f"UPDATE reports SET {', '.join(set_clauses)}, revision = revision + 1 WHERE id = ? AND revision = ?"
+    cursor.execute(sql, (*updates.values(), report_id, expected_revision))
+    return cursor.rowcount == 1
+
+def _plan_transition(current, action: str, actor: str, updates: dict):
+    """
+    現在の状態 (status, approver1) に対してアクションを適用した更新内容を返します。
+    遷移できない場合は (None, 理由) を返します。
+    """
+    new_status = APPROVAL_TRANSITIONS.get((action, current['status']))
+    if new_status is None:
+        return None, f"現在のステータス「{current['status']}」ではこの操作はできません。"
+
+    updates = dict(updates)
+    if action == "approve":
+        if current['status'] == STATUS_FIRST_APPROVED:
+            if current['approver1'] == actor:
+                return None, f"このレポートは既に {actor} によって承認されています。同一ユーザーによる連続承認はできません。"
+            updates.update({'approver2': actor, 'approved_at2': _now_jst()})
+        else:
+            updates.update({'approver1': actor, 'approved_at1': _now_jst()})
+    updates['status'] = new_status
+    return updates, None
+
+def _apply_transition(cursor, report_id: int, action: str, actor: str, expected_revision: int, updates: dict = None, events: list = None):
+    """
+    1件分の状態遷移を現在のトランザクション内で実行します。Returns: (更新内容 or None, メッセージ)
+    遷移した場合は変更履歴の行を events に追加します (呼び出し側がまとめて記録します)。
+    """
+    cursor.execute(f"SELECT status, approver1, revision FROM {REPORTS_VIEW} WHERE id = ?", (report_id,))
+    current = cursor.fetchone()
+    if current is None:
+        return None, "レポートが見つかりません。"
+    if current['revision'] != expected_revision:
+        return None, REVISION_CONFLICT_MESSAGE
+
+    planned, reason = _plan_transition(current, action, actor, updates or {})
+    if planned is None:
+        return None, reason
+    before = _read_report_columns(cursor, report_id, planned.keys())
+    if not _compare_and_set_report(cursor, report_id, expected_revision, planned):
+        return None, REVISION_CONFLICT_MESSAGE
+    if events is not None:
+        events.append(_report_event(report_id, action, actor, before, planned))
+    return planned, f"ステータスを「{planned['status']}」に更新しました。"
+
+def transition_report(report_id: int, action: str, actor: str, expected_revision: int, updates: dict = None, approver_id: int = None):
+    """
+    承認ワークフローの状態遷移 (approve / reject / resubmit) を実行します。
+    画面で読み込んだ時点の revision を expected_revision に渡してください。その後に他のユーザーが
+    更新していた場合は競合として何も変更しません。CSV/PDFの生成は遷移に成功した1回だけ行われます。
+
+    Returns:
+        tuple: (成功した場合True, 画面に表示するメッセージ)
+    """
+    report_id, expected_revision = int(report_id), int(expected_revision)
+    with get_db_connection() as conn:
+        conn.row_factory = sqlite3.Row
+        cursor = conn.cursor()
+        events = []
+        planned, message = _apply_transition(cursor, report_id, action, actor, expected_revision, updates, events)
+        if planned is None:
+            return False, message
+        _record_report_events(cursor, events)
+        conn.commit()
+    if ANALYTICS_COLUMNS & set(planned):
+        _reports_changed() # 差し戻し後の再提出で発生日時などが変わった場合
+
+    # ステータスが「承認済み」になった場合、CSVとPDFを生成 (競合に勝った1回だけ実行される)
+    if planned['status'] == STATUS_APPROVED:
+        from db_utils.jobs import submit_job
+        submit_job("export_report", {"report_id": report_id, "approver_id": approver_id, "notify": True})
+    return True, message
+
+def update_report_status_many(expected_revisions: dict, action: str, actor: str, updates: dict = None, approver_id: int = None, run_side_effects: bool = True):
+    """
+    複数レポートの状態遷移を1つのトランザクションでまとめて実行します (一括承認用)。
+    expected_revisions は {レポートID: 画面で読み込んだ時点のrevision} の辞書です。
+    競合などで遷移できなかったレポートはスキップし、その他のレポートだけを確定します。
+    承認済みになったレポートのCSV/PDF生成と通知は、バックグラウンドのバッチ処理にまとめて渡します。
+
+    Returns:
+        dict: {レポートID: (成功した場合True, メッセージ)}
+    """
+    results = {}
+    approved_ids = []
+    events = []
+    with get_db_connection() as conn:
+        conn.row_factory = sqlite3.Row
+        cursor = conn.cursor()
+        for report_id, expected_revision in expected_revisions.items():
+            report_id = int(report_id)
+            planned, message = _apply_transition(cursor, report_id, action, actor, int(expected_revision), updates, events)
+            results[report_id] = (planned is not None, message)
+            if planned is not None and planned['status'] == STATUS_APPROVED:
+                approved_ids.append(report_id)
+        _record_report_events(cursor, events) # 変更履歴は1回の executemany でまとめて記録する
+        conn.commit()
+    if updates and ANALYTICS_COLUMNS & set(updates):
+        _reports_changed()
+
+    if approved_ids and run_side_effects:
+        from db_utils.jobs import submit_job
+        submit_job("export_batch", {"report_ids": approved_ids, "approver_id": approver_id, "notify": True}, background=True)
+    return results
+
+def get_all_reports(labeled: bool = False, since=None, until=None):
+    """
+    全てのインシデント報告を取得します。
+    labeled=True の場合は、SQLの別名で列名を日本語ラベルにした表示用のDataFrameを返します
+    (報告IDは列として含まれます)。ページ側での列名変換は不要です。
+    since / until (発生日時、until は含まない) を指定した場合はその期間のレポートだけを返します。
+    期間がアーカイブ済みの年にかかる場合は、その年のアーカイブのレポートも含めます。
+    """
+    import pandas as pd
+    with get_db_connection() as conn:
+        source, where, params = REPORTS_VIEW, "", []
+        if since is not None or until is not None:
+            from db_utils.archive import period_clause, reports_source
+            source = reports_source(conn, since, until)
+            conditions, params = period_clause(since, until)
+            where = f"WHERE {' AND '.join(conditions)} "
+        if labeled:
+            sql = f"SELECT {select_list()} FROM {source} {where}ORDER BY occurrence_datetime DESC"
+            return pd.read_sql(sql, conn, params=params)
+        # index_col='id' を指定すると、DataFrameのインデックスがid列になる
+        df = pd.read_sql(f"SELECT * FROM {source} {where}ORDER BY occurrence_datetime DESC", conn, params=params, index_col='id')
+        return df
+
+def get_pending_approvals(limit: int = 50, offset: int = 0) -> "pd.DataFrame":
+    """
+    承認待ち (未読・承認中) のレポートを、一覧表示に必要な列だけ日本語ラベル付きで取得します。
+    部分インデックス idx_reports_pending を使うため、全履歴の件数には依存しません。
+    """
+    import pandas as pd
+    sql = (
+        f"SELECT {select_list(PENDING_SUMMARY_COLUMNS)} FROM {REPORTS_VIEW} "
+        f"WHERE {PENDING_STATUS_CONDITION} ORDER BY occurrence_datetime DESC LIMIT ? OFFSET ?"
+    )
+    with get_db_connection() as conn:
+        return pd.read_sql(sql, conn, params=(limit, offset))
+
+def count_pending() -> int:
+    """承認待ち (未読・承認中) のレポート件数を返します"""
+    with get_db_connection() as conn:
+        cursor = conn.cursor()
+        cursor.execute(f"SELECT COUNT(*) FROM {REPORTS_VIEW} WHERE {PENDING_STATUS_CONDITION}")
+        return cursor.fetchone()[0]
+
+def update_report(report_id: int, data: dict, expected_revision: int, actor: str = None):
+    """
+    指定されたIDのレポートを更新します (actor は変更履歴に記録する操作したユーザー)。
+    編集を始めた時点の revision を expected_revision に渡してください。その後に他のユーザーが
+    更新 (承認など) していた場合は競合として何も変更しません。
+
+    Returns:
+        tuple: (成功した場合True, 画面に表示するメッセージ)
+    """
+    report_id, expected_revision = int(report_id), int(expected_revision)
+    with get_db_connection() as conn:
+        cursor = conn.cursor()
+        cursor.execute("BEGIN IMMEDIATE") # 変更前の値を読んでから更新するまで、他の接続に書き込ませない
+        before = _read_report_columns(cursor, report_id, data.keys())
+        if before is None:
+            conn.rollback()
+            return False, "レポートが見つかりません。"
+        if not _compare_and_set_report(cursor, report_id, expected_revision, data):
+            conn.rollback()
+            return False, REVISION_CONFLICT_MESSAGE
+        _record_report_events(cursor, [_report_event(report_id, "update", actor, before, data)])
+        conn.commit()
+    if ANALYTICS_COLUMNS & set(data):
+        _reports_changed()
+    return True, f"報告ID: {report_id} を更新しました。"
+
+def _utc_now_text() -> str:
+    """CURRENT_TIMESTAMP と同じ形式 (UTC) の現在日時です"""
+    return datetime.datetime.now(datetime.timezone.utc).strftime("%Y-%m-%d %H:%M:%S")
+
+def _set_report_deleted(report_id: int, deleted_at, event: str, actor: str) -> bool:
+    with get_db_connection() as conn:
+        cursor = conn.cursor()
+        cursor.execute("BEGIN IMMEDIATE") # 変更前の値を読んでから更新するまで、他の接続に書き込ませない
+        before = _read_report_columns(cursor, report_id, ["deleted_at"])
+        if before is None or (before["deleted_at"] is None) == (deleted_at is None):
+            conn.rollback()
+            return False
+        cursor.execute("UPDATE reports SET deleted_at = ?, revision = revision + 1 WHERE id = ?", (deleted_at, report_id))
+        _record_report_events(cursor, [_report_event(report_id, event, actor, before, {"deleted_at": deleted_at})])
+        conn.commit()
+    _reports_changed()
+    return True
+
+def delete_report(report_id: int, actor: str = None) -> bool:
+    """
+    指定されたIDのレポートを削除します (論理削除)。一覧・集計からはすぐに除外され、
+    保存期間 (db_utils.maintenance.DELETED_REPORT_RETENTION_DAYS) を過ぎると定期メンテナンスで完全に削除されます。
+    """
+    return _set_report_deleted(int(report_id), _utc_now_text(), "delete", actor)
+
+def restore_report(report_id: int, actor: str = None) -> bool:
+    """削除したレポートを元に戻します (完全に削除される前に限ります)"""
+    return _set_report_deleted(int(report_id), None, "restore", actor)
+
+def get_deleted_reports() -> "pd.DataFrame":
+    """削除済み (完全に削除される前) のレポートの一覧を、削除日時の新しい順に返します"""
+    import pandas as pd
+    sql = (
+        "SELECT id, occurrence_datetime, reporter_name, level, content_category, deleted_at FROM reports "
+        "WHERE deleted_at IS NOT NULL ORDER BY deleted_at DESC"
+    )
+    with get_db_connection() as conn:
+        return pd.read_sql(sql, conn)
+
+# --- ユーザー管理関連 ---
+
+# --- ユーザー情報のキャッシュ ---
+# ユーザーは件数が少なく更新もまれなため、プロセス内にユーザー名をキーとして保持し、
+# ページの再実行のたびにDBを読まないようにします。ユーザーの追加・更新・削除で破棄し、
+# 他のプロセスで変更された場合に備えて USER_CACHE_TTL_SECONDS ごとに読み直します。
+
+USER_CACHE_TTL_SECONDS = 300
+USER_PROFILE_COLUMNS = ["id", "username", "role", "lineworks_id", "created_at"]
+_user_directory = None
+_user_directory_loaded_at = 0.0
+_user_directory_lock = threading.Lock()
+
+def _password_version(password_hash: str) -> str:
+    """パスワードのハッシュから作る短い識別子 (パスワードが変わるとログイントークンが無効になる)"""
+    return hashlib.sha256((password_hash or "").encode("utf-8")).hexdigest()[:16]
+
+def _get_user_directory() -> dict:
+    global _user_directory, _user_directory_loaded_at
+    with _user_directory_lock:
+        if _user_directory is None or time.monotonic() - _user_directory_loaded_at > USER_CACHE_TTL_SECONDS:
+            with get_db_connection() as conn:
+                conn.row_factory = sqlite3.Row
+                cursor = conn.cursor()
+                cursor.execute(f"SELECT {', '.join(USER_PROFILE_COLUMNS)}, password_hash FROM users ORDER BY username")
+                directory = {}
+                for row in cursor.fetchall():
+                    profile = {column: row[column] for column in USER_PROFILE_COLUMNS}
+                    profile['password_version'] = _password_version(row['password_hash'])
+                    directory[row['username']] = profile
+            _user_directory = directory
+            _user_directory_loaded_at = time.monotonic()
+        return _user_directory
+
+def invalidate_user_cache():
+    """ユーザー情報のキャッシュを破棄します (ユーザーを変更した後に呼び出します)"""
+    global _user_directory
+    with _user_directory_lock:
+        _user_directory = None
+
+def get_user_profile(username):
+    """ユーザー名からユーザー情報 (パスワードハッシュを除く) をキャッシュ経由で取得します。存在しない場合はNoneを返します。"""
+    profile = _get_user_directory().get(username)
+    return dict(profile) if profile else None
+
+def get_all_users():
+    """全てのユーザー情報を取得します（パスワードハッシュは含まない）"""
+    return [{column: profile[column] for column in USER_PROFILE_COLUMNS} for profile in _get_user_directory().values()]
+
+def update_user_role(user_id, new_role):
+    """ユーザーのロールを更新します"""
+    with get_db_connection() as conn:
+        cursor = conn.cursor()
+        cursor.execute("UPDATE users SET role = ? WHERE id = ?", (new_role, user_id))
+        conn.commit()
+    invalidate_user_cache()
+
+def update_user_password(user_id, new_password):
+    """ユーザーのパスワードをリセットします（ハッシュ化して保存）"""
+    with get_db_connection() as conn:
+        cursor = conn.cursor()
+        hashed_password = hash_password_bounded(new_password)
+        cursor.execute("UPDATE users SET password_hash = ? WHERE id = ?", (hashed_password, user_id))
+        conn.commit()
+    invalidate_user_cache()
+
+def delete_user(user_id):
+    """ユーザーを削除します"""
+    with get_db_connection() as conn:
+        cursor = conn.cursor()
+        cursor.execute("DELETE FROM users WHERE id = ?", (user_id,))
+        conn.commit()
+    invalidate_user_cache()
+
+def update_user_lineworks_id(user_id, lineworks_id):
+    """ユーザーのLINE WORKS IDを更新します"""
+    with get_db_connection() as conn:
+        cursor = conn.cursor()
+        cursor.execute("UPDATE users SET lineworks_id = ? WHERE id = ?", (lineworks_id, user_id))
+        conn.commit()
+    invalidate_user_cache()
+
+def get_user_lineworks_id_by_reporter_name(reporter_name):
+    """報告者名からLINE WORKS IDを取得します (ユーザー情報のキャッシュを使用します)"""
+    user = get_user_profile(reporter_name)
+    return user['lineworks_id'] if user and user['lineworks_id'] else None
+
+# --- 下書き関連 ---
+# 下書きはログインユーザーごとに保存し、フォーム項目 (report_schema.DRAFT_KEYS) だけを
+# zlibで圧縮したJSONとして drafts.payload に持ちます。
+# 自動保存では変更のあった項目だけを draft_deltas に追記し、件数が増えたら本体にまとめ直します。
+
+DRAFT_TTL_DAYS = 60                 # この日数更新されていない下書きは purge_stale_drafts で削除する
+DRAFT_DELTA_COMPACT_THRESHOLD = 20  # 差分がこの件数に達したら本体にまとめる
+
+def _pack_draft(data: dict) -> bytes:
+    return zlib.compress(json.dumps(data, cls=DateTimeEncoder, ensure_ascii=False).encode("utf-8"))
+
+def _unpack_draft(blob) -> dict:
+    return json.loads(zlib.decompress(blob).decode("utf-8")) if blob else {}
+
+def extract_draft_data(state) -> dict:
+    """session_stateなどから下書きに保存するフォーム項目だけを取り出します (日付・時刻は文字列に変換します)"""
+    data = {key: value for key, value in dict(state).items() if isinstance(key, str) and is_draft_key(key)}
+    return json.loads(json.dumps(data, cls=DateTimeEncoder, ensure_ascii=False))
+
+def diff_draft_data(previous: dict, current: dict) -> dict:
+    """前回保存した内容から変更のあった項目だけを返します"""
+    return {key: value for key, value in current.items() if previous.get(key) != value}
+
+def create_draft(owner: str, title: str, data: dict) -> int:
+    """下書きを新しく保存し、そのIDを返します"""
+    data = extract_draft_data(data)
+    with get_db_connection() as conn:
+        cursor = conn.cursor()
+        cursor.execute(
+            "INSERT INTO drafts (owner, title, reporter_name, payload, updated_at) VALUES (?, ?, ?, ?, CURRENT_TIMESTAMP)",
+            (owner, title, data.get("reporter_name") or None, _pack_draft(data))
+        )
+        conn.commit()
+        return cursor.lastrowid
+
+def save_draft_delta(draft_id: int, owner: str, changes: dict) -> bool:
+    """
+    下書きに変更のあった項目だけを差分として追記します (自動保存用)。
+    変更が無い場合は何も書き込みません。下書きが無い、または他のユーザーの下書きの場合は False を返します。
+    """
+    changes = extract_draft_data(changes)
+    with get_db_connection() as conn:
+        cursor = conn.cursor()
+        if not changes:
+            cursor.execute("SELECT 1 FROM drafts WHERE id = ? AND owner IS ? AND deleted_at IS NULL", (int(draft_id), owner))
+            return cursor.fetchone() is not None
+
+        set_clauses = "updated_at = CURRENT_TIMESTAMP"
+        params = []
+        if "reporter_name" in changes:
+            set_clauses += ", reporter_name = ?"
+            params.append(changes["reporter_name"] or None)
+        cursor.execute(f"UPDATE drafts SET {set_clauses} WHERE id = ? AND owner IS ? AND deleted_at IS NULL", (*params, int(draft_id), owner))
+        if cursor.rowcount != 1:
+            return False
+        cursor.execute("INSERT INTO draft_deltas (draft_id, payload) VALUES (?, ?)", (int(draft_id), _pack_draft(changes)))
+
+        cursor.execute("SELECT COUNT(*) FROM draft_deltas WHERE draft_id = ?", (int(draft_id),))
+        if cursor.fetchone()[0] >= DRAFT_DELTA_COMPACT_THRESHOLD:
+            _compact_draft(cursor, int(draft_id))
+        conn.commit()
+        return True
+
+def _read_draft_data(cursor, draft_id: int, payload) -> dict:
+    """本体の内容に差分を古い順に適用した、現在の下書き内容を返します"""
+    data = _unpack_draft(payload)
+    cursor.execute("SELECT payload FROM draft_deltas WHERE draft_id = ? ORDER BY id", (draft_id,))
+    for (delta,) in cursor.fetchall():
+        data.update(_unpack_draft(delta))
+    return data
+
+def _compact_draft(cursor, draft_id: int):
+    """差分を本体にまとめ、差分の行を削除します"""
+    cursor.execute("SELECT payload FROM drafts WHERE id = ?", (draft_id,))
+    row = cursor.fetchone()
+    if row is None:
+        return
+    data = _read_draft_data(cursor, draft_id, row[0])
+    cursor.execute("UPDATE drafts SET payload = ? WHERE id = ?", (_pack_draft(data), draft_id))
+    cursor.execute("DELETE FROM draft_deltas WHERE draft_id = ?", (draft_id,))
+
+def get_draft_summaries(owner: str, include_unowned: bool = False) -> "pd.DataFrame":
+    """
+    指定したユーザーの下書き一覧 (ID・タイトル・保存日時・更新日時・代表報告者名) を新しい順に返します。
+    下書きの中身は読み込みません。include_unowned=True の場合は所有者が不明な旧形式の下書きも含めます。
+    """
+    import pandas as pd
+    with get_db_connection() as conn:
+        sql = "SELECT id, title, created_at, updated_at, reporter_name FROM drafts WHERE deleted_at IS NULL AND (owner = ?"
+        sql += " OR owner IS NULL)" if include_unowned else ")"
+        return pd.read_sql(sql + " ORDER BY updated_at DESC", conn, params=(owner,))
+
+def load_draft(draft_id: int, owner: str = None):
+    """
+    下書きを差分も含めて読み込みます。owner を指定した場合はそのユーザーの下書きだけを返します。
+
+    Returns:
+        dict: {'id', 'title', 'owner', 'created_at', 'updated_at', 'data'} (見つからない場合は None)
+    """
+    with get_db_connection() as conn:
+        conn.row_factory = sqlite3.Row
+        cursor = conn.cursor()
+        sql = "SELECT id, title, owner, created_at, updated_at, payload FROM drafts WHERE id = ? AND deleted_at IS NULL"
+        params = [int(draft_id)]
+        if owner is not None:
+            sql += " AND (owner = ? OR owner IS NULL)"
+            params.append(owner)
+        cursor.execute(sql, params)
+        row = cursor.fetchone()
+        if row is None:
+            return None
+        draft = {key: row[key] for key in ("id", "title", "owner", "created_at", "updated_at")}
+        draft['data'] = _read_draft_data(cursor, row['id'], row['payload'])
+        return draft
+
+def delete_draft(draft_id: int, owner: str = None):
+    """
+    指定されたIDの下書きを削除します (論理削除)。owner を指定した場合はそのユーザーの下書きだけを削除します。
+    行と差分は定期メンテナンス (db_utils.maintenance) でまとめて完全に削除します。
+    """
+    with get_db_connection() as conn:
+        cursor = conn.cursor()
+        sql = "UPDATE drafts SET deleted_at = CURRENT_TIMESTAMP WHERE id = ? AND deleted_at IS NULL"
+        if owner is None:
+            cursor.execute(sql, (draft_id,))
+        else:
+            cursor.execute(sql + " AND (owner = ? OR owner IS NULL)", (draft_id, owner))
+        conn.commit()
+    _evict_draft_pdf(draft_id)
+
+def purge_stale_drafts(ttl_days: int = DRAFT_TTL_DAYS) -> int:
+    """
+    ttl_days 日以上更新されていない下書きを削除 (論理削除) し、削除した件数を返します。
+    定期メンテナンス (db_utils.maintenance) から呼び出し、行と差分は保存期間を過ぎてから完全に削除します。
+    """
+    with get_db_connection() as conn:
+        cursor = conn.cursor()
+        cursor.execute("BEGIN IMMEDIATE")
+        cursor.execute(
+            "SELECT id FROM drafts WHERE deleted_at IS NULL AND updated_at < datetime('now', ?)", (f"-{int(ttl_days)} days",)
+        )
+        stale_ids = [row[0] for row in cursor.fetchall()]
+        cursor.executemany("UPDATE drafts SET deleted_at = CURRENT_TIMESTAMP WHERE id = ?", [(draft_id,) for draft_id in stale_ids])
+        conn.commit()
+    for draft_id in stale_ids:
+        _evict_draft_pdf(draft_id)
+    if stale_ids:
+        print(f"DEBUG: purge_stale_drafts: {len(stale_ids)}件の古い下書きを削除しました。")
+    return len(stale_ids)
+
+def _migrate_legacy_drafts(cursor):
+    """
+    session_state全体をdata_jsonに保存していた旧形式の下書きを、
+    所有者付き・フォーム項目のみ・圧縮済みの形式に変換します。
+    """
+    cursor.execute("SELECT id, data_json FROM drafts WHERE payload IS NULL AND data_json IS NOT NULL")
+    for draft_id, data_json in cursor.fetchall():
+        try:
+            state = json.loads(data_json)
+        except json.JSONDecodeError:
+            state = {}
+        data = extract_draft_data(state)
+        cursor.execute(
+            "UPDATE drafts SET owner = COALESCE(owner, ?), reporter_name = ?, payload = ?, "
+            "updated_at = COALESCE(updated_at, created_at), data_json = NULL WHERE id = ?",
+            (state.get("username") or None, data.get("reporter_name") or None, _pack_draft(data), draft_id)
+        )
+
+# --- 下書きPDFのキャッシュ ---
+# 下書きPDFは印刷ボタンが押されたときにだけ生成し、(下書きID, 下書き内容のハッシュ) をキーに保持します。
+# 内容が変わればハッシュが変わるため作り直され、件数が上限を超えると最も古く使われたものから破棄します。
+
+DRAFT_PDF_CACHE_SIZE = 32
+_draft_pdf_cache = OrderedDict()
+_draft_pdf_cache_lock = threading.Lock()
+
+def _evict_draft_pdf(draft_id: int):
+    with _draft_pdf_cache_lock:
+        for key in [key for key in _draft_pdf_cache if key[0] == int(draft_id)]:
+            del _draft_pdf_cache[key]
+
+def get_draft_pdf_bytes(draft_id: int, owner: str = None):
+    """下書きのPDFを返します。同じ内容のPDFを生成済みの場合はキャッシュを使います。下書きが無い場合はNoneを返します。"""
+    draft = load_draft(draft_id, owner)
+    if not draft:
+        return None
+    content = json.dumps(draft['data'], ensure_ascii=False, sort_keys=True)
+    key = (int(draft_id), hashlib.sha256(content.encode("utf-8")).hexdigest())
+    with _draft_pdf_cache_lock:
+        if key in _draft_pdf_cache:
+            _draft_pdf_cache.move_to_end(key)
+            return _draft_pdf_cache[key]
+
+    # PDFの生成には時間がかかるため、ロックの外で行う
+    from db_utils.render import generate_draft_pdf_bytes
+    pdf_bytes = generate_draft_pdf_bytes(draft['data'], draft['title'], draft['created_at'])
+    with _draft_pdf_cache_lock:
+        _draft_pdf_cache[key] = pdf_bytes
+        _draft_pdf_cache.move_to_end(key)
+        while len(_draft_pdf_cache) > DRAFT_PDF_CACHE_SIZE:
+            _draft_pdf_cache.popitem(last=False)
+    return pdf_bytes
+
+class DateTimeEncoder(json.JSONEncoder):
+    """datetime, date, timeオブジェクトをJSONシリアライズ可能にするためのエンコーダー"""
+    def default(self, obj):
+        if isinstance(obj, (datetime.datetime, datetime.date, datetime.time)):
+            return obj.isoformat()
+        return super(DateTimeEncoder, self).default(obj)
\ No newline at end of file
@@ -0,0 +1,357 @@
+"""
+報告件数の集計 (グラフ分析ページ用) です。
+
+発生日時を日・週・月・年度の期間に分け、SQLの strftime でグループ化して件数を数えます
+(インデックス idx_reports_occurrence だけを読むため、報告の本文は読み込みません)。
+締まった期間 (現在の期間より前) の件数はプロセス内にキャッシュし、2回目以降は
+現在の期間 (まだ報告が増える期間) だけをDBから数え直します。
+締まった期間の件数とキューブには、アーカイブ済みの年 (db_utils.archive) の報告も含めます。
+集計は読み取り専用のスナップショット (db_utils.snapshot) から読むため、報告の書き込みとは競合しません
+(スナップショットの分だけ、集計に反映されるまでに最大 SNAPSHOT_MAX_AGE_SECONDS 秒かかります)。
+
+クロス集計とドリルダウンには ReportCube を使います。影響度レベル × 発生場所 × 内容分類 × 職種 × 年月 の
+組み合わせごとの件数の配列をデータの更新ごとに1回だけ作り、画面の操作ごとの集計はこの配列から行います。
+"""
+import datetime
+import itertools
+import threading
+import time
+from collections import OrderedDict
+import numpy as np
+from db_utils.archive import iter_reports_sources
+from db_utils.snapshot import current_snapshot, snapshot_connection
+from report_schema import CONTENT_CATEGORY_OPTIONS, JOB_TYPE_OPTIONS, LEVEL_OPTIONS, LOCATION_OPTIONS
+
+FISCAL_YEAR_START_MONTH = 4          # 年度の開始月
+ANALYTICS_CACHE_TTL_SECONDS = 300    # 他のプロセスでの変更に備えて、締まった期間もこの秒数ごとに数え直す
+ANALYTICS_CACHE_SIZE = 64            # キャッシュする (期間の種類, 絞り込み条件) の組み合わせの上限
+
+# 期間の種類 -> (表示名, 期間のキーを求めるSQLの式)。キーは文字列の順序が時間の順序と一致する形式にする
+BUCKETS = {
+    "day": ("日", "strftime('%Y-%m-%d', occurrence_datetime)"),
+    "week": ("週", "date(occurrence_datetime, 'weekday 0', '-6 days')"),   # 週の初め (月曜日) の日付
+    "month": ("月", "strftime('%Y-%m', occurrence_datetime)"),
+    "fiscal_year": ("年度", f"strftime('%Y', occurrence_datetime, 'start of month', '-{FISCAL_YEAR_START_MONTH - 1} months')"),
+}
+
+# 絞り込みに使える列 (SQLに列名を埋め込むため、ここにある列だけを受け付ける)
+TREND_FILTER_COLUMNS = ("level", "location", "job_type")
+
+_count_cache = OrderedDict()
+_count_cache_lock = threading.Lock()
+_data_revision = 0   # このプロセスでレポートが変更されるたびに増える (スナップショットを使わない場合のキューブの作り直しの判定に使う)
+
+
+def _bucket_start(bucket: str, now: datetime.datetime) -> datetime.datetime:
+    """now を含む期間 (現在の期間) の開始日時を返します"""
+    today = datetime.datetime(now.year, now.month, now.day)
+    if bucket == "day":
+        return today
+    if bucket == "week":
+        return today - datetime.timedelta(days=today.weekday())
+    if bucket == "month":
+        return today.replace(day=1)
+    year = now.year if now.month >= FISCAL_YEAR_START_MONTH else now.year - 1
+    return datetime.datetime(year, FISCAL_YEAR_START_MONTH, 1)
+
+
+def _next_bucket(bucket: str, key: str) -> str:
+    if bucket in ("day", "week"):
+        step = 1 if bucket == "day" else 7
+        return (datetime.date.fromisoformat(key) + datetime.timedelta(days=step)).isoformat()
+    if bucket == "month":
+        year, month = map(int, key.split("-"))
+        return f"{year + month // 12:04d}-{month % 12 + 1:02d}"
+    return f"{int(key) + 1:04d}"
+
+
+def _fill_gaps(bucket: str, counts: dict) -> list:
+    """最初の期間から最後の期間まで、報告の無い期間を0件として補い、古い順の [(キー, 件数)] を返します"""
+    if not counts:
+        return []
+    keys = sorted(counts)
+    try:
+        filled = []
+        key = keys[0]
+        while key <= keys[-1]:
+            filled.append((key, counts.get(key, 0)))
+            key = _next_bucket(bucket, key)
+        return filled
+    except ValueError:
+        # 想定外の形式の日時が含まれる場合は補わずに返す
+        return [(key, counts[key]) for key in keys]
+
+
+def _filter_clause(filters: dict):
+    """絞り込み条件を (WHERE句の条件のリスト, パラメータのリスト) にします。値は1つの値または値のリストです。"""
+    conditions, params = [], []
+    for column, value in sorted((filters or {}).items()):
+        if column not in TREND_FILTER_COLUMNS:
+            raise ValueError(f"絞り込みに使えない列です: {column}")
+        values = [value] if isinstance(value, str) else list(value or [])
+        if values:
+            conditions.append(f"{column} IN ({', '.join(['?'] * len(values))})")
+            params.extend(values)
+    return conditions, params
+
+
+def _cache_key(bucket: str, filters: dict) -> tuple:
+    return (bucket,) + tuple(
+        (column, (value,) if isinstance(value, str) else tuple(sorted(value)))
+        for column, value in sorted((filters or {}).items()) if value
+    )
+
+
+def _query_counts(bucket: str, filters: dict, since: str = None, until: str = None) -> dict:
+    """期間のキー -> 件数 を返します (since 以上 until 未満の発生日時に限定できます)"""
+    conditions, params = _filter_clause(filters)
+    if since is not None:
+        conditions.append("occurrence_datetime >= ?")
+        params.append(since)
+    if until is not None:
+        conditions.append("occurrence_datetime < ?")
+        params.append(until)
+    where = f"WHERE {' AND '.join(conditions)}" if conditions else ""
+    counts = {}
+    with snapshot_connection() as conn:
+        # 締まった期間 (since を指定しない) はアーカイブ済みの年も数える (ATTACH の上限の年数ずつ数えて足し合わせる)
+        for source in iter_reports_sources(conn, since, until):
+            sql = f"SELECT {BUCKETS[bucket][1]} AS bucket, COUNT(*) FROM {source} {where} GROUP BY bucket"
+            for key, count in conn.execute(sql, params).fetchall():
+                if key is not None:
+                    counts[key] = counts.get(key, 0) + count
+    return counts
+
+
+def get_report_counts(bucket: str = "month", filters: dict = None, now: datetime.datetime = None) -> list:
+    """
+    期間ごとの報告件数を、古い順の [(期間のキー, 件数)] で返します。報告の無い期間は0件として含みます。
+
+    Args:
+        bucket (str): "day" / "week" / "month" / "fiscal_year"
+        filters (dict): 絞り込み条件。例: {"level": ["3a", "3b"], "location": "2F診察室"}
+        now (datetime): 現在の期間を決める日時 (省略時は現在時刻)
+    """
+    if bucket not in BUCKETS:
+        raise ValueError(f"不明な期間の種類です: {bucket}")
+    boundary = _bucket_start(bucket, now or datetime.datetime.now()).strftime("%Y-%m-%d %H:%M:%S")
+    key = _cache_key(bucket, filters)
+
+    with _count_cache_lock:
+        entry = _count_cache.get(key)
+        if entry and (entry["boundary"] != boundary or time.monotonic() - entry["loaded_at"] > ANALYTICS_CACHE_TTL_SECONDS):
+            entry = None
+        if entry:
+            _count_cache.move_to_end(key)
+            closed = entry["closed"]
+
+    if not entry:
+        # 期間が切り替わった、または期限切れの場合は、締まった期間をまとめて数え直す
+        closed = _query_counts(bucket, filters, until=boundary)
+        with _count_cache_lock:
+            _count_cache[key] = {"boundary": boundary, "closed": closed, "loaded_at": time.monotonic()}
+            _count_cache.move_to_end(key)
+            while len(_count_cache) > ANALYTICS_CACHE_SIZE:
+                _count_cache.popitem(last=False)
+
+    counts = dict(closed)
+    for bucket_key, count in _query_counts(bucket, filters, since=boundary).items():
+        counts[bucket_key] = counts.get(bucket_key, 0) + count
+    return _fill_gaps(bucket, counts)
+
+
+def get_report_trend(bucket: str = "month", filters: dict = None, rolling: int = 0, now: datetime.datetime = None) -> list:
+    """
+    get_report_counts の結果に移動平均を加え、古い順の [{"bucket", "count", "rolling_mean"}] で返します。
+    rolling_mean は直近 rolling 期間の平均です (rolling が0または期間が足りない場合はNone)。
+    """
+    series = get_report_counts(bucket, filters, now)
+    trend = []
+    for i, (bucket_key, count) in enumerate(series):
+        rolling_mean = None
+        if rolling and i + 1 >= rolling:
+            rolling_mean = sum(c for _, c in series[i + 1 - rolling:i + 1]) / rolling
+        trend.append({"bucket": bucket_key, "count": count, "rolling_mean": rolling_mean})
+    return trend
+
+
+def invalidate_report_counts(occurrences: list = None):
+    """
+    レポートの追加・変更・削除をキャッシュに反映します (db_utils の更新関数から呼び出されます)。
+    occurrences には変更のあったレポートの発生日時を渡します。すべて現在の期間に含まれる場合は
+    キャッシュをそのまま使い、締まった期間が含まれる場合やNoneの場合はその条件のキャッシュを破棄します。
+    """
+    global _data_revision
+    with _count_cache_lock:
+        _data_revision += 1
+        if occurrences is None:
+            _count_cache.clear()
+            return
+        earliest = min((str(value) for value in occurrences if value is not None), default=None)
+        if earliest is None:
+            return
+        for key in [key for key, entry in _count_cache.items() if earliest < entry["boundary"]]:
+            del _count_cache[key]
+
+
+# --- 多次元集計 (キューブ) ---
+
+UNKNOWN_MEMBER = "(未入力)"
+
+# 次元 -> (表示名, 値の並び順)。データにだけある値は並び順の後ろに追加する
+CUBE_DIMENSIONS = {
+    "level": ("影響度レベル", LEVEL_OPTIONS),
+    "location": ("発生場所", LOCATION_OPTIONS),
+    "content_category": ("内容分類", CONTENT_CATEGORY_OPTIONS),
+    "job_type": ("職種", JOB_TYPE_OPTIONS),
+    "month": ("年月", ()),
+}
+# 職種ごとのインシデント内容 (content_details は1件に複数の値を ", " 区切りで持つため別のキューブにする)
+DETAIL_CUBE_DIMENSIONS = {
+    "job_type": ("職種", JOB_TYPE_OPTIONS),
+    "content_detail": ("インシデント内容", ()),
+}
+
+_cube_cache = {}
+_cube_cache_lock = threading.Lock()
+_cube_generations = itertools.count(1)
+
+
+class ReportCube:
+    """
+    次元ごとの値の一覧 (members) と、値の組み合わせごとの件数の配列 (counts) です。
+    絞り込み (selection) は {次元: 値 または 値のリスト} の辞書で指定し、指定しない次元はすべての値を合計します。
+    集計は配列の合計だけで行うため、報告の件数に関係なく一定の時間で終わります。
+    """
+
+    def __init__(self, dimensions: dict, members: dict, counts, revision: int):
+        self.dimensions = dimensions
+        self.members = members
+        self.counts = counts
+        self.revision = revision
+        self.generation = next(_cube_generations)   # 作り直すたびに変わる番号 (グラフのキャッシュのキーに使う)
+        self._positions = {dim: {member: i for i, member in enumerate(values)} for dim, values in members.items()}
+
+    def label(self, dimension: str) -> str:
+        return self.dimensions[dimension][0]
+
+    def _select(self, selection: dict):
+        """selection に一致する部分の配列を、次元の順序を保ったまま返します"""
+        indexes = []
+        for dim in self.dimensions:
+            value = (selection or {}).get(dim)
+            if value is None or (not isinstance(value, str) and not value):
+                indexes.append(np.arange(len(self.members[dim])))
+                continue
+            values = [value] if isinstance(value, str) else value
+            indexes.append(np.array([self._positions[dim][v] for v in values if v in self._positions[dim]], dtype=int))
+        return self.counts[np.ix_(*indexes)], indexes
+
+    def total(self, selection: dict = None) -> int:
+        """selection に一致する報告の件数"""
+        return int(self._select(selection)[0].sum())
+
+    def series(self, dimension: str, selection: dict = None, drop_zero: bool = True) -> list:
+        """1つの次元の値ごとの件数を [(値, 件数)] で返します (値の並びは次元の並び順)"""
+        sub, indexes = self._select(selection)
+        axis = list(self.dimensions).index(dimension)
+        other_axes = tuple(i for i in range(sub.ndim) if i != axis)
+        totals = sub.sum(axis=other_axes)
+        members = [self.members[dimension][i] for i in indexes[axis]]
+        return [(member, int(count)) for member, count in zip(members, totals) if count or not drop_zero]
+
+    def pivot(self, rows: str, columns: str, selection: dict = None, drop_zero: bool = True):
+        """
+        2つの次元のクロス集計を返します。
+        Returns:
+            tuple: (行の値のリスト, 列の値のリスト, 件数の2次元配列)
+        """
+        if rows == columns:
+            raise ValueError("行と列には異なる次元を指定してください")
+        sub, indexes = self._select(selection)
+        dims = list(self.dimensions)
+        row_axis, column_axis = dims.index(rows), dims.index(columns)
+        other_axes = tuple(i for i in range(sub.ndim) if i not in (row_axis, column_axis))
+        matrix = sub.sum(axis=other_axes)
+        if row_axis > column_axis:
+            matrix = matrix.T
+        row_members = [self.members[rows][i] for i in indexes[row_axis]]
+        column_members = [self.members[columns][i] for i in indexes[column_axis]]
+        if drop_zero:
+            row_mask, column_mask = matrix.sum(axis=1) > 0, matrix.sum(axis=0) > 0
+            matrix = matrix[row_mask][:, column_mask]
+            row_members = [m for m, keep in zip(row_members, row_mask) if keep]
+            column_members = [m for m, keep in zip(column_members, column_mask) if keep]
+        return row_members, column_members, matrix
+
+
+def _members(dimensions: dict, groups: dict) -> dict:
+    """次元ごとの値の一覧 (定義済みの並び順 + データにだけある値)"""
+    members = {}
+    for axis, (dim, (_, order)) in enumerate(dimensions.items()):
+        found = {key[axis] for key in groups}
+        if dim == "month":
+            # 報告の無い月も含め、最初の月から最後の月まで連続させる
+            months = sorted(found - {UNKNOWN_MEMBER})
+            values = [key for key, _ in _fill_gaps("month", dict.fromkeys(months, 0))]
+            members[dim] = values + ([UNKNOWN_MEMBER] if UNKNOWN_MEMBER in found else [])
+            continue
+        values = [value for value in order if value]
+        members[dim] = values + sorted(found - set(values) - {UNKNOWN_MEMBER}) + ([UNKNOWN_MEMBER] if UNKNOWN_MEMBER in found else [])
+    return members
+
+
+def _to_cube(dimensions: dict, groups: dict, revision: int) -> ReportCube:
+    members = _members(dimensions, groups)
+    positions = [{member: i for i, member in enumerate(members[dim])} for dim in dimensions]
+    counts = np.zeros([len(members[dim]) for dim in dimensions], dtype=np.int64)
+    for key, count in groups.items():
+        counts[tuple(position[value] for position, value in zip(positions, key))] += count
+    return ReportCube(dimensions, members, counts, revision)
+
+
+def _build_report_cube(revision: int) -> ReportCube:
+    columns = [BUCKETS["month"][1] if dim == "month" else dim for dim in CUBE_DIMENSIONS]
+    groups = {}
+    with snapshot_connection() as conn:
+        for source in iter_reports_sources(conn):
+            sql = f"SELECT {', '.join(columns)}, COUNT(*) FROM {source} GROUP BY {', '.join(str(i + 1) for i in range(len(columns)))}"
+            for *key, count in conn.execute(sql).fetchall():
+                key = tuple(str(value) if value not in (None, "") else UNKNOWN_MEMBER for value in key)
+                groups[key] = groups.get(key, 0) + count
+    return _to_cube(CUBE_DIMENSIONS, groups, revision)
+
+
+def _build_detail_cube(revision: int) -> ReportCube:
+    groups = {}
+    with snapshot_connection() as conn:
+        for source in iter_reports_sources(conn):
+            for job_type, details, count in conn.execute(f"SELECT job_type, content_details, COUNT(*) FROM {source} GROUP BY 1, 2").fetchall():
+                job_type = job_type or UNKNOWN_MEMBER
+                for detail in {item.strip() for item in (details or "").split(",")} - {""}:
+                    groups[(job_type, detail)] = groups.get((job_type, detail), 0) + count
+    return _to_cube(DETAIL_CUBE_DIMENSIONS, groups, revision)
+
+
+def _get_cube(name: str, builder) -> ReportCube:
+    snapshot = current_snapshot()
+    with _cube_cache_lock:
+        entry = _cube_cache.get(name)
+        # スナップショットから読む場合は、スナップショットが作り直されたときだけキューブを作り直す
+        revision = snapshot or _data_revision
+        if entry and entry["cube"].revision == revision and time.monotonic() - entry["loaded_at"] <= ANALYTICS_CACHE_TTL_SECONDS:
+            return entry["cube"]
+    cube = builder(revision)
+    with _cube_cache_lock:
+        _cube_cache[name] = {"cube": cube, "loaded_at": time.monotonic()}
+    return cube
+
+
+def get_report_cube() -> ReportCube:
+    """影響度レベル × 発生場所 × 内容分類 × 職種 × 年月 のキューブを返します (データが変わるまで同じものを使います)"""
+    return _get_cube("reports", _build_report_cube)
+
+
+def get_detail_cube() -> ReportCube:
+    """職種 × インシデント内容 のキューブを返します"""
+    return _get_cube("details", _build_detail_cube)
@@ -0,0 +1,275 @@
+"""
+古い承認済みレポートの年ごとのアーカイブです。
+
+発生年が今年より ARCHIVE_AFTER_YEARS 年より前の承認済みレポートを、年ごとのDBファイル
+(incident_reports_archive_YYYY.db。DB_NAME と同じ場所、または ARCHIVE_DIR) の reports テーブルへ移します。
+移したレポートは現在のDBから削除するため、日常の画面 (一覧・承認・修正) が読むデータは直近の年だけになります。
+アーカイブの一覧は report_archives テーブルにあり、定期メンテナンス (db_utils.maintenance) が毎日確認します。
+
+期間を指定して読む処理 (検索・集計・週報月報・出力) は reports_source() の FROM 句を使います。
+期間がアーカイブ済みの年にかかる場合だけ、その年のアーカイブを ATTACH して UNION ALL でつなぎます。
+期間を限らない集計は iter_reports_sources() で MAX_ATTACHED_ARCHIVES 年分ずつ集計して足し合わせ、
+IDでの読み込みは find_archived_report() でアーカイブを1つずつ探します。
+
+    python archive_reports.py              (手動で実行する場合)
+"""
+import datetime
+import os
+import re
+import db_utils
+from db_utils import REPORTS_VIEW, get_db_connection
+from report_schema import STATUS_APPROVED
+
+ARCHIVE_AFTER_YEARS = int(os.environ.get("ARCHIVE_AFTER_YEARS", 3))  # 発生年がこの年数より前の承認済みレポートをアーカイブする
+ARCHIVE_DIR = os.environ.get("ARCHIVE_DIR", "").strip()              # アーカイブDBの保存先 (空の場合は DB_NAME と同じ場所)
+MAX_ATTACHED_ARCHIVES = 9   # 1つの接続に ATTACH できるDBの上限 (SQLiteの既定は10。現在のDBの分を除く)
+
+
+# --- 期間とファイル名 ---
+
+def archive_path(year: int) -> str:
+    """year 年のアーカイブDBのパスを返します (例: incident_reports_archive_2021.db)"""
+    directory, name = os.path.split(db_utils.DB_NAME)
+    return os.path.join(ARCHIVE_DIR or directory, f"{os.path.splitext(name)[0]}_archive_{int(year)}.db")
+
+
+def archive_cutoff(today: datetime.date = None, years: int = None) -> datetime.date:
+    """この日付より前に発生した承認済みレポートがアーカイブの対象です (年の初め)"""
+    today = today or datetime.date.today()
+    return datetime.date(today.year - (ARCHIVE_AFTER_YEARS if years is None else years), 1, 1)
+
+
+def _datetime_text(value) -> str:
+    """発生日時と比較できる文字列 (DBに保存されている形式) にします"""
+    if isinstance(value, datetime.datetime):
+        return value.strftime("%Y-%m-%d %H:%M:%S")
+    if isinstance(value, datetime.date):
+        return value.isoformat()
+    return str(value)
+
+
+def period_clause(since=None, until=None):
+    """発生日時が since 以上 until 未満の条件を (WHERE句の条件のリスト, パラメータのリスト) にします"""
+    conditions, params = [], []
+    if since is not None:
+        conditions.append("occurrence_datetime >= ?")
+        params.append(_datetime_text(since))
+    if until is not None:
+        conditions.append("occurrence_datetime < ?")
+        params.append(_datetime_text(until))
+    return conditions, params
+
+
+# --- アーカイブを含めた読み込み ---
+
+def archived_years(conn, since=None, until=None) -> list:
+    """発生日時が [since, until) の期間にかかるアーカイブの [(年, ファイル名)] を古い順に返します"""
+    first = int(_datetime_text(since)[:4]) if since is not None else 0
+    last = 9999
+    if until is not None:
+        until = _datetime_text(until)
+        last = int(until[:4]) - (1 if until[4:] in ("-01-01", "-01-01 00:00:00") else 0) # 年の初めまでならその年は含まない
+    return conn.execute("SELECT year, filename FROM report_archives WHERE year BETWEEN ? AND ? ORDER BY year", (first, last)).fetchall()
+
+
+def _table_columns(conn, schema: str) -> list:
+    return [row[1] for row in conn.execute(f"PRAGMA {schema}.table_info(reports)")]
+
+
+def _attach_archives(conn, years: list) -> list:
+    """years のアーカイブを conn に ATTACH し、新しく ATTACH したスキーマ名のリストを返します"""
+    attached = {row[1] for row in conn.execute("PRAGMA database_list")}
+    directory = os.path.dirname(archive_path(0))
+    added = []
+    for year, filename in years:
+        schema = f"archive_{int(year)}"
+        if schema not in attached:
+            conn.execute(f"ATTACH DATABASE ? AS {schema}", (os.path.join(directory, filename),))
+            added.append(schema)
+    return added
+
+
+def _union_source(conn, years: list, include_current: bool = True) -> str:
+    """years のアーカイブ (ATTACH 済み) と、include_current の場合は現在のDBのレポートを UNION ALL でつないだ FROM 句を返します"""
+    columns = _table_columns(conn, "main")
+    selects = [f"SELECT {', '.join(columns)} FROM {REPORTS_VIEW}"] if include_current else []
+    for year, _ in years:
+        schema = f"archive_{int(year)}"
+        # アーカイブした後に追加された列は NULL として読む
+        existing = set(_table_columns(conn, schema))
+        selects.append(f"SELECT {', '.join(c if c in existing else f'NULL AS {c}' for c in columns)} FROM {schema}.reports")
+    return f"({' UNION ALL '.join(selects)})"
+
+
+def reports_source(conn, since=None, until=None) -> str:
+    """
+    発生日時が [since, until) のレポートを読むための FROM 句を返します (since を省略した場合は最初から)。
+    期間にかかるアーカイブだけを conn に ATTACH し、現在のDBのレポートと UNION ALL でつなぎます。
+    期間がアーカイブにかからない場合は REPORTS_VIEW をそのまま返すため、アーカイブのファイルは開きません。
+    期間の条件は呼び出し側の WHERE 句に書きます (SQLiteがそれぞれのテーブルの発生日時のインデックスに適用します)。
+    一度に ATTACH できるのは MAX_ATTACHED_ARCHIVES 年分までです。期間を限らない集計には iter_reports_sources() を使います。
+    """
+    years = archived_years(conn, since, until)
+    if not years:
+        return REPORTS_VIEW
+    if len(years) > MAX_ATTACHED_ARCHIVES:
+        raise ValueError(f"一度に読めるアーカイブは{MAX_ATTACHED_ARCHIVES}年分までです。期間を短くしてください。")
+    _attach_archives(conn, years)
+    return _union_source(conn, years)
+
+
+def iter_reports_sources(conn, since=None, until=None):
+    """
+    reports_source() と同じレポートを読む FROM 句を、MAX_ATTACHED_ARCHIVES 年分ずつに分けて順に返します。
+    アーカイブが何年分あっても使えます。集計 (COUNT・GROUP BY) はそれぞれの FROM 句で実行し、結果を足し合わせてください。
+    現在のDBのレポートは最初の FROM 句にだけ含まれます。次の FROM 句を受け取る前に、前の問い合わせを読み終えてください
+    (前の分のアーカイブは DETACH します)。
+    """
+    years = archived_years(conn, since, until)
+    if not years:
+        yield REPORTS_VIEW
+        return
+    for start in range(0, len(years), MAX_ATTACHED_ARCHIVES):
+        batch = years[start:start + MAX_ATTACHED_ARCHIVES]
+        added = _attach_archives(conn, batch)
+        try:
+            yield _union_source(conn, batch, include_current=start == 0)
+        finally:
+            for schema in added:
+                conn.execute(f"DETACH DATABASE {schema}")
+
+
+def find_archived_report(conn, report_id: int):
+    """
+    アーカイブ済みのレポートを、新しい年のアーカイブから1つずつ ATTACH して探します
+    (ATTACH の上限に関係なく、何年分でも探せます)。
+    見つかった場合はそのアーカイブを読む FROM 句 (ATTACH したまま) を、見つからない場合は None を返します。
+    """
+    for year, filename in reversed(archived_years(conn)):
+        added = _attach_archives(conn, [(year, filename)])
+        if conn.execute(f"SELECT 1 FROM archive_{int(year)}.reports WHERE id = ?", (report_id,)).fetchone():
+            return _union_source(conn, [(year, filename)], include_current=False)
+        for schema in added:
+            conn.execute(f"DETACH DATABASE {schema}")
+    return None
+
+
+def get_archives() -> list:
+    """アーカイブの一覧 (年・ファイル名・件数・最後にアーカイブした日時) を古い順に返します"""
+    with get_db_connection() as conn:
+        rows = conn.execute("SELECT year, filename, report_count, archived_at FROM report_archives ORDER BY year").fetchall()
+    return [dict(zip(("year", "filename", "report_count", "archived_at"), row)) for row in rows]
+
+
+# --- アーカイブへの移動 ---
+
+def _archive_condition(year: int) -> tuple:
+    return (
+        "deleted_at IS NULL AND status = ? AND occurrence_datetime >= ? AND occurrence_datetime < ?",
+        (STATUS_APPROVED, f"{year:04d}-01-01", f"{year + 1:04d}-01-01")
+    )
+
+
+def _prepare_archive_table(cursor):
+    """アーカイブDB (archive) に、現在のDBと同じ列の reports テーブルと発生日時のインデックスを作ります"""
+    cursor.execute("SELECT sql FROM main.sqlite_master WHERE type = 'table' AND name = 'reports'")
+    create_sql = re.sub(r'^CREATE TABLE\s+"?reports"?', "CREATE TABLE IF NOT EXISTS archive.reports", cursor.fetchone()[0])
+    cursor.execute(create_sql)
+    # 前回のアーカイブの後に追加された列をアーカイブ側にも追加する
+    existing = {row[1] for row in cursor.execute("PRAGMA archive.table_info(reports)").fetchall()}
+    for _, name, column_type, *_ in cursor.execute("PRAGMA main.table_info(reports)").fetchall():
+        if name not in existing:
+            cursor.execute(f"ALTER TABLE archive.reports ADD COLUMN {name} {column_type}")
+    cursor.execute("CREATE INDEX IF NOT EXISTS archive.idx_reports_occurrence ON reports (occurrence_datetime, level, location, job_type)")
+
+
+def archive_year(year: int, actor: str = "maintenance") -> int:
+    """
+    year 年に発生した承認済みレポートをアーカイブDBへ移し、移した件数を返します。
+    2つのファイルへのコミットはまとめて保証されない (WALモードの現在のDBが先に確定し得る) ため、
+    アーカイブへの書き込みをコミットしてから、別のトランザクションで現在のDBから削除します。
+    途中で停止した場合は両方に同じレポートが残るだけで、もう一度実行すると同じIDの行を上書きし、
+    現在のDBから削除し直します。
+    """
+    year = int(year)
+    condition, params = _archive_condition(year)
+    conn = get_db_connection()
+    try:
+        conn.isolation_level = None # ATTACH / DETACH はトランザクションの外で実行する
+        conn.execute("ATTACH DATABASE ? AS archive", (archive_path(year),))
+        cursor = conn.cursor()
+        # 1. アーカイブへの書き込み (このトランザクションで書き込むのはアーカイブDBだけ)
+        cursor.execute("BEGIN IMMEDIATE")
+        try:
+            _prepare_archive_table(cursor)
+            cursor.execute(f"SELECT id, revision FROM main.reports WHERE {condition}", params)
+            rows = cursor.fetchall()
+            if rows:
+                columns = _table_columns(conn, "main")
+                # 移動も変更履歴の1件として数え、アーカイブ側の revision を1つ進める
+                selected = ["revision + 1" if column == "revision" else column for column in columns]
+                cursor.execute(
+                    f"INSERT OR REPLACE INTO archive.reports ({', '.join(columns)}) "
+                    f"SELECT {', '.join(selected)} FROM main.reports WHERE {condition}", params
+                )
+            cursor.execute("COMMIT")
+        except Exception:
+            cursor.execute("ROLLBACK")
+            raise
+
+        # 2. 現在のDBからの削除 (このトランザクションで書き込むのは現在のDBだけ)
+        moved, changed = [], []
+        if rows:
+            cursor.execute("BEGIN IMMEDIATE")
+            try:
+                for report_id, revision in rows:
+                    # 1. の後に更新されたレポートは削除しない (アーカイブ側の古い写しは 3. で消す)
+                    cursor.execute(f"DELETE FROM main.reports WHERE id = ? AND revision = ? AND {condition}", (report_id, revision, *params))
+                    (moved if cursor.rowcount else changed).append((report_id, revision))
+                db_utils._record_report_events(
+                    cursor, [db_utils._report_event(report_id, "archive", actor, {"revision": revision}, {}) for report_id, revision in moved]
+                )
+                cursor.execute("SELECT COUNT(*) FROM archive.reports")
+                cursor.execute(
+                    "INSERT INTO report_archives (year, filename, report_count) VALUES (?, ?, ?) "
+                    "ON CONFLICT (year) DO UPDATE SET report_count = excluded.report_count, archived_at = CURRENT_TIMESTAMP",
+                    (year, os.path.basename(archive_path(year)), cursor.fetchone()[0] - len(changed))
+                )
+                cursor.execute("COMMIT")
+            except Exception:
+                cursor.execute("ROLLBACK")
+                raise
+
+        # 3. 2. で削除しなかったレポートのアーカイブ側の写しを消す (現在のDBの行が正しい)
+        if changed:
+            cursor.executemany("DELETE FROM archive.reports WHERE id = ?", [(report_id,) for report_id, _ in changed])
+        conn.execute("DETACH DATABASE archive")
+    finally:
+        conn.close()
+    if moved:
+        print(f"DEBUG: archive: {year}年の承認済みレポート{len(moved)}件を {archive_path(year)} に移しました。")
+    return len(moved)
+
+
+def archive_reports(today: datetime.date = None, years: int = None) -> dict:
+    """
+    発生年が archive_cutoff() より前の承認済みレポートを年ごとにアーカイブし、{年: 件数} を返します。
+    対象が無い場合は発生日時のインデックスを1回読むだけで終わります。
+    """
+    cutoff = archive_cutoff(today, years)
+    with get_db_connection() as conn:
+        rows = conn.execute(
+            f"SELECT DISTINCT CAST(strftime('%Y', occurrence_datetime) AS INTEGER) FROM {REPORTS_VIEW} "
+            "WHERE occurrence_datetime < ? AND status = ?",
+            (cutoff.isoformat(), STATUS_APPROVED)
+        ).fetchall()
+    archived = {}
+    for (year,) in sorted(rows):
+        if year is None:
+            continue
+        count = archive_year(year)
+        if count:
+            archived[year] = count
+    if archived:
+        db_utils._reports_changed()
+    return archived
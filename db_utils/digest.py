@@ -0,0 +1,356 @@
+"""
+週報・月報 (期間の集計PDF) の作成です。
+
+前の週 (月曜日～日曜日) または前の月の報告をSQLで集計し、件数の推移・影響度レベルの内訳・
+多い内容分類・レベル3a以上の一覧をまとめたPDFを共有フォルダに保存して、LINE WORKSのチャンネルに1回だけ投稿します。
+作成済みの期間は digests テーブルに記録するため、複数のプロセスでスケジューラーを動かしても二重には作成されません。
+
+    python generate_digest.py --kind monthly         (手動で作成する場合)
+    start_digest_scheduler()                         (app.py が起動時に呼び出し、期間が締まったら自動で作成)
+"""
+import datetime
+import html
+import os
+import threading
+import time
+from db_utils import get_db_connection
+from db_utils.archive import reports_source
+from db_utils.snapshot import snapshot_connection
+from report_schema import LEVEL_OPTIONS
+
+# 保存先 (共有フォルダ)。環境変数で変更できます
+REPORT_DIGEST_DIR = os.environ.get("REPORT_DIGEST_DIR", "\\\\192.168.11.200\\share\\ネット端末共有\\インシデント・アクシデント報告\\集計")
+# 自動で作成する種類 (カンマ区切り。空にすると自動作成しない)
+DIGEST_SCHEDULE = [kind.strip() for kind in os.environ.get("DIGEST_SCHEDULE", "weekly,monthly").split(",") if kind.strip()]
+DIGEST_RUN_HOUR = int(os.environ.get("DIGEST_RUN_HOUR", 8))   # 期間が締まった翌日のこの時刻以降に作成する (前日分の報告の入力を待つ)
+DIGEST_CHECK_INTERVAL_SECONDS = 30 * 60                          # スケジューラーが作成の要否を確認する間隔
+DIGEST_STALE_SECONDS = 30 * 60                                   # 作成中のまま、この秒数を過ぎたものは作成し直す
+
+DIGEST_KINDS = {"weekly": "週報", "monthly": "月報"}
+SERIOUS_LEVELS = ("3a", "3b", "4", "5")   # 一覧に載せる影響度レベル
+TOP_CATEGORY_COUNT = 10
+
+
+# --- 期間 ---
+
+def digest_period(kind: str, today: datetime.date = None):
+    """today の前の週 (月曜日～日曜日) または前の月を (開始日, 終了日の翌日) で返します"""
+    today = today or datetime.date.today()
+    if kind == "weekly":
+        end = today - datetime.timedelta(days=today.weekday())
+        return end - datetime.timedelta(days=7), end
+    if kind == "monthly":
+        end = today.replace(day=1)
+        return (end - datetime.timedelta(days=1)).replace(day=1), end
+    raise ValueError(f"不明な集計の種類です: {kind}")
+
+
+def digest_title(kind: str, start: datetime.date, end: datetime.date) -> str:
+    last = end - datetime.timedelta(days=1)
+    if kind == "monthly":
+        return f"{start.year}年{start.month}月 インシデント月報"
+    return f"{start.year}年{start.month}月{start.day}日～{last.month}月{last.day}日 インシデント週報"
+
+
+# --- 集計 ---
+
+def _range_params(start: datetime.date, end: datetime.date) -> tuple:
+    return (f"{start.isoformat()} 00:00:00", f"{end.isoformat()} 00:00:00")
+
+
+def collect_digest(start: datetime.date, end: datetime.date) -> dict:
+    """
+    期間の集計をSQLで行い、PDFに載せる内容を辞書で返します (発生日時のインデックスで期間を絞り込みます)。
+    集計は読み取り専用のスナップショットから読みます。期間の終了より前に作られたスナップショットは使いません。
+    """
+    period = "occurrence_datetime >= ? AND occurrence_datetime < ?"
+    params = _range_params(start, end)
+    previous_start = start - (end - start) if (end - start).days <= 7 else (start - datetime.timedelta(days=1)).replace(day=1)
+    since_end = (datetime.datetime.now() - datetime.datetime.combine(end, datetime.time())).total_seconds()
+    with snapshot_connection(max_age=max(since_end, 0)) as conn:
+        source = reports_source(conn, previous_start, end) # 期間がアーカイブ済みの年にかかる場合だけアーカイブも読む
+        cursor = conn.cursor()
+        cursor.execute(f"SELECT COUNT(*) FROM {source} WHERE {period}", params)
+        total = cursor.fetchone()[0]
+        cursor.execute(f"SELECT COUNT(*) FROM {source} WHERE {period}", _range_params(previous_start, start))
+        previous_total = cursor.fetchone()[0]
+        cursor.execute(f"SELECT strftime('%Y-%m-%d', occurrence_datetime) AS day, COUNT(*) FROM {source} WHERE {period} GROUP BY day", params)
+        by_day = dict(cursor.fetchall())
+        cursor.execute(f"SELECT COALESCE(level, ''), COUNT(*) FROM {source} WHERE {period} GROUP BY 1", params)
+        by_level = dict(cursor.fetchall())
+        cursor.execute(
+            f"SELECT COALESCE(content_category, ''), COUNT(*) AS n FROM {source} WHERE {period} GROUP BY 1 ORDER BY n DESC LIMIT ?",
+            params + (TOP_CATEGORY_COUNT,)
+        )
+        top_categories = cursor.fetchall()
+        cursor.execute(
+            f"SELECT COALESCE(location, ''), COUNT(*) AS n FROM {source} WHERE {period} GROUP BY 1 ORDER BY n DESC LIMIT 5", params
+        )
+        top_locations = cursor.fetchall()
+        cursor.execute(
+            f"SELECT id, occurrence_datetime, level, location, content_category, job_type, status, situation FROM {source} "
+            f"WHERE {period} AND level IN ({', '.join(['?'] * len(SERIOUS_LEVELS))}) ORDER BY occurrence_datetime",
+            params + SERIOUS_LEVELS
+        )
+        columns = [column[0] for column in cursor.description]
+        serious = [dict(zip(columns, row)) for row in cursor.fetchall()]
+
+    days = []
+    day = start
+    while day < end:
+        days.append((day, by_day.get(day.isoformat(), 0)))
+        day += datetime.timedelta(days=1)
+    levels = [(level, by_level.pop(level)) for level in LEVEL_OPTIONS if level in by_level]
+    levels += sorted(by_level.items())
+    return {
+        "total": total, "previous_total": previous_total, "days": days, "levels": levels,
+        "top_categories": top_categories, "top_locations": top_locations, "serious": serious,
+    }
+
+
+# --- PDF ---
+
+DIGEST_CSS = """
+@page { size: A4; margin: 18mm 15mm; @bottom-center { content: counter(page) " / " counter(pages); font-size: 9px; color: #777; } }
+body { font-family: 'Segoe UI', 'Meiryo', 'Yu Gothic', sans-serif; color: #333; font-size: 11px; line-height: 1.5; }
+h1 { color: #0056b3; font-size: 20px; border-bottom: 2px solid #0056b3; padding-bottom: 4px; }
+h2 { color: #0056b3; font-size: 15px; border-bottom: 1px solid #ddd; padding-bottom: 3px; margin-top: 18px; }
+.page { page-break-before: always; }
+.summary { display: flex; gap: 12px; }
+.summary div { border: 1px solid #ddd; border-radius: 6px; padding: 8px 14px; background: #f7f9fc; }
+.summary strong { display: block; font-size: 20px; color: #0056b3; }
+table { width: 100%; border-collapse: collapse; margin-top: 6px; }
+th, td { border: 1px solid #ddd; padding: 4px 6px; text-align: left; vertical-align: top; }
+th { background: #eef3fa; }
+td.number { text-align: right; width: 60px; }
+.bar { background: #6b9bd1; height: 10px; }
+.footer { margin-top: 20px; font-size: 9px; color: #777; text-align: right; }
+"""
+
+DIGEST_HTML_TEMPLATE = """<!DOCTYPE html>
+<html lang="ja">
+<head><meta charset="UTF-8"><title>{title}</title></head>
+<body>
+    <h1>{title}</h1>
+    <p>対象期間: {period}</p>
+    <div class="summary">
+        <div>報告件数<strong>{total}件</strong></div>
+        <div>前の期間<strong>{previous_total}件</strong></div>
+        <div>レベル3a以上<strong>{serious_count}件</strong></div>
+    </div>
+
+    <h2>日別の報告件数</h2>
+    {trend_chart}
+
+    <h2>影響度レベルの内訳</h2>
+    {level_table}
+
+    <div class="page">
+        <h2>多い内容分類 (上位{top_category_count}件)</h2>
+        {category_table}
+        <h2>多い発生場所 (上位5件)</h2>
+        {location_table}
+    </div>
+
+    <div class="page">
+        <h2>影響度レベル3a以上の報告</h2>
+        {serious_table}
+    </div>
+
+    <div class="footer">作成日時: {generated_at}</div>
+</body>
+</html>
+"""
+
+
+def _svg_bar_chart(days: list, width: int = 680, height: int = 200) -> str:
+    """日別件数の棒グラフをSVGで返します (画像の生成に追加のライブラリを使わない)"""
+    if not days:
+        return "<p>対象期間の報告はありません。</p>"
+    left, bottom, top = 30, 30, 10
+    maximum = max(max(count for _, count in days), 1)
+    slot = (width - left) / len(days)
+    parts = [f'<svg xmlns="http://www.w3.org/2000/svg" width="{width}" height="{height}" viewBox="0 0 {width} {height}">']
+    parts.append(f'<line x1="{left}" y1="{height - bottom}" x2="{width}" y2="{height - bottom}" stroke="#999"/>')
+    parts.append(f'<text x="{left - 4}" y="{top + 4}" font-size="9" text-anchor="end">{maximum}</text>')
+    label_every = max(1, len(days) // 10)
+    for i, (day, count) in enumerate(days):
+        bar_height = (height - bottom - top) * count / maximum
+        x = left + i * slot
+        parts.append(f'<rect x="{x + slot * 0.15:.1f}" y="{height - bottom - bar_height:.1f}" width="{slot * 0.7:.1f}" height="{bar_height:.1f}" fill="#6b9bd1"/>')
+        if count:
+            parts.append(f'<text x="{x + slot / 2:.1f}" y="{height - bottom - bar_height - 2:.1f}" font-size="8" text-anchor="middle">{count}</text>')
+        if i % label_every == 0:
+            parts.append(f'<text x="{x + slot / 2:.1f}" y="{height - bottom + 12}" font-size="8" text-anchor="middle">{day.month}/{day.day}</text>')
+    parts.append("</svg>")
+    return "".join(parts)
+
+
+def _count_table(label: str, rows: list, total: int) -> str:
+    if not rows:
+        return "<p>対象期間の報告はありません。</p>"
+    lines = [f"<table><tr><th>{html.escape(label)}</th><th>件数</th><th>割合</th></tr>"]
+    for name, count in rows:
+        share = count / total * 100 if total else 0
+        lines.append(
+            f"<tr><td>{html.escape(str(name) or '(未入力)')}</td><td class=\"number\">{count}</td>"
+            f"<td><div class=\"bar\" style=\"width: {share:.0f}%\"></div>{share:.1f}%</td></tr>"
+        )
+    lines.append("</table>")
+    return "".join(lines)
+
+
+def _serious_table(reports: list) -> str:
+    if not reports:
+        return "<p>対象期間にレベル3a以上の報告はありません。</p>"
+    lines = ["<table><tr><th>報告ID</th><th>発生日時</th><th>レベル</th><th>発生場所</th><th>内容分類</th><th>職種</th><th>状況 (抜粋)</th></tr>"]
+    for report in reports:
+        situation = str(report.get("situation") or "")
+        excerpt = situation[:80] + ("…" if len(situation) > 80 else "")
+        cells = [report["id"], str(report["occurrence_datetime"] or "")[:16], report["level"], report["location"],
+                 report["content_category"], report["job_type"], excerpt]
+        lines.append("<tr>" + "".join(f"<td>{html.escape(str(cell or ''))}</td>" for cell in cells) + "</tr>")
+    lines.append("</table>")
+    return "".join(lines)
+
+
+def generate_digest_html(kind: str, start: datetime.date, end: datetime.date, data: dict) -> str:
+    """集計結果からPDF用のHTMLを生成します (スタイルは DIGEST_CSS として別に適用します)"""
+    last = end - datetime.timedelta(days=1)
+    return DIGEST_HTML_TEMPLATE.format(
+        title=html.escape(digest_title(kind, start, end)),
+        period=f"{start:%Y年%m月%d日} ～ {last:%Y年%m月%d日}",
+        total=data["total"],
+        previous_total=data["previous_total"],
+        serious_count=len(data["serious"]),
+        trend_chart=_svg_bar_chart(data["days"]),
+        level_table=_count_table("影響度レベル", data["levels"], data["total"]),
+        top_category_count=TOP_CATEGORY_COUNT,
+        category_table=_count_table("内容分類", data["top_categories"], data["total"]),
+        location_table=_count_table("発生場所", data["top_locations"], data["total"]),
+        serious_table=_serious_table(data["serious"]),
+        generated_at=datetime.datetime.now().strftime("%Y年%m月%d日 %H時%M分"),
+    )
+
+
+# --- 作成と投稿 (digestsテーブルで1回だけ行う) ---
+
+def _claim_digest(kind: str, start: datetime.date, end: datetime.date, force: bool):
+    """この期間の作成を開始できる場合は digests の行IDを返します。作成済み・他のプロセスで作成中の場合は None を返します。"""
+    with get_db_connection() as conn:
+        cursor = conn.cursor()
+        cursor.execute("BEGIN IMMEDIATE")
+        cursor.execute(
+            "SELECT id, status, started_at < datetime('now', ?) FROM digests WHERE kind = ? AND period_start = ?",
+            (f"-{DIGEST_STALE_SECONDS} seconds", kind, start.isoformat())
+        )
+        row = cursor.fetchone()
+        if row is None:
+            cursor.execute(
+                "INSERT INTO digests (kind, period_start, period_end, status, started_at) VALUES (?, ?, ?, 'running', CURRENT_TIMESTAMP)",
+                (kind, start.isoformat(), end.isoformat())
+            )
+            digest_id = cursor.lastrowid
+        elif force or row[1] == "failed" or (row[1] == "running" and row[2]):
+            cursor.execute("UPDATE digests SET status = 'running', started_at = CURRENT_TIMESTAMP WHERE id = ?", (row[0],))
+            digest_id = row[0]
+        else:
+            digest_id = None
+        conn.commit()
+    return digest_id
+
+
+def _claim_post(digest_id: int) -> bool:
+    """投稿済みの印を付けます。まだ投稿されていなかった場合だけ True を返します (投稿は1回だけ)"""
+    with get_db_connection() as conn:
+        cursor = conn.cursor()
+        cursor.execute("UPDATE digests SET posted_at = CURRENT_TIMESTAMP WHERE id = ? AND posted_at IS NULL", (digest_id,))
+        conn.commit()
+        return cursor.rowcount == 1
+
+
+def generate_digest(kind: str = "monthly", today: datetime.date = None, notify: bool = True, force: bool = False):
+    """
+    週報・月報のPDFを作成して共有フォルダに保存し、notify=True ならチャンネルに投稿します。
+    作成したPDFのパスを返します。作成済み (または他のプロセスで作成中) の場合は何もせず None を返します。
+    force=True の場合は作成済みでもPDFを作り直します (投稿済みの場合は再投稿しません)。
+    """
+    start, end = digest_period(kind, today)
+    digest_id = _claim_digest(kind, start, end, force)
+    if digest_id is None:
+        print(f"DEBUG: generate_digest: {digest_title(kind, start, end)} は作成済みのためスキップします。")
+        return None
+
+    try:
+        from db_utils.render import write_pdf # PDFを作成するときだけWeasyPrintを読み込む
+        data = collect_digest(start, end)
+        os.makedirs(REPORT_DIGEST_DIR, exist_ok=True)
+        filepath = os.path.join(REPORT_DIGEST_DIR, f"digest_{kind}_{start.isoformat()}.pdf")
+        write_pdf(generate_digest_html(kind, start, end, data), filepath, css_text=DIGEST_CSS)
+    except Exception:
+        with get_db_connection() as conn:
+            conn.execute("UPDATE digests SET status = 'failed' WHERE id = ?", (digest_id,))
+            conn.commit()
+        raise
+
+    with get_db_connection() as conn:
+        conn.execute(
+            "UPDATE digests SET status = 'done', filepath = ?, report_count = ?, finished_at = CURRENT_TIMESTAMP WHERE id = ?",
+            (filepath, data["total"], digest_id)
+        )
+        conn.commit()
+    print(f"DEBUG: generate_digest: {filepath} を作成しました ({data['total']}件)。")
+
+    if notify and _claim_post(digest_id):
+        from db_utils.notify import notify_digest_pdf
+        if not notify_digest_pdf(filepath, digest_title(kind, start, end)):
+            # 投稿できなかった場合は、次回 (再実行時) に投稿できるよう印を戻す
+            with get_db_connection() as conn:
+                conn.execute("UPDATE digests SET posted_at = NULL WHERE id = ?", (digest_id,))
+                conn.commit()
+    return filepath
+
+
+# --- スケジューラー ---
+
+def due_digests(now: datetime.datetime = None) -> list:
+    """作成する時刻を過ぎているのに、まだ作成されていない種類のリストを返します"""
+    now = now or datetime.datetime.now()
+    due = []
+    for kind in DIGEST_SCHEDULE:
+        start, end = digest_period(kind, now.date())
+        if now < datetime.datetime.combine(end, datetime.time(DIGEST_RUN_HOUR)):
+            continue
+        with get_db_connection() as conn:
+            row = conn.execute("SELECT status FROM digests WHERE kind = ? AND period_start = ?", (kind, start.isoformat())).fetchone()
+        if row is None or row[0] != "done":
+            due.append(kind) # 他のプロセスで作成中の場合は generate_digest がスキップする
+    return due
+
+
+_scheduler = None
+_scheduler_lock = threading.Lock()
+
+
+def _run_scheduler(interval: float):
+    from db_utils.jobs import submit_job
+    while True:
+        try:
+            for kind in due_digests():
+                # JOB_RUNNER=queue の場合はジョブワーカーが作成する (PDFの作成を画面のプロセスで行わない)
+                submit_job("digest", {"kind": kind})
+        except Exception as e:
+            print(f"ERROR: digest scheduler: {e}")
+        time.sleep(interval)
+
+
+def start_digest_scheduler(interval: float = DIGEST_CHECK_INTERVAL_SECONDS):
+    """週報・月報を自動で作成するスレッドを開始します (プロセスごとに1つだけ。DIGEST_SCHEDULE が空の場合は開始しません)"""
+    global _scheduler
+    if not DIGEST_SCHEDULE:
+        return None
+    with _scheduler_lock:
+        if _scheduler is None:
+            _scheduler = threading.Thread(target=_run_scheduler, args=(interval,), name="digest-scheduler", daemon=True)
+            _scheduler.start()
+    return _scheduler
@@ -0,0 +1,148 @@
+"""
+承認済みレポートのCSV/PDFファイル出力と、承認後のバッチ処理です。
+pandas と WeasyPrint を使うため、ファイルを出力するときだけこのモジュールを読み込みます。
+"""
+import os
+import datetime
+import threading
+import pandas as pd
+from report_schema import FIELDS
+from db_utils import get_report_by_id
+from db_utils.render import generate_report_html_content, write_pdf
+
+# CSV/PDFの保存先 (共有フォルダ)。環境変数で変更できます (負荷テストなどで共有フォルダに書き込まない場合)
+REPORT_CSV_DIR = os.environ.get("REPORT_CSV_DIR", "\\\\192.168.11.200\\share\\ネット端末共有\\インシデント・アクシデント報告\\CSV")
+REPORT_PDF_DIR = os.environ.get("REPORT_PDF_DIR", "\\\\192.168.11.200\\share\\ネット端末共有\\インシデント・アクシデント報告\\レポート")
+
+def generate_and_save_report_csv(report_data: dict, approver_id: int = None):
+    """レポートデータをCSV形式で生成し、ファイルとして保存します。保存に成功した場合はファイルパスを返します。"""
+    if not report_data:
+        print("DEBUG: generate_and_save_report_csv: report_data is empty.")
+        return
+
+    output_dir = REPORT_CSV_DIR # CSVの保存先パス (環境変数 REPORT_CSV_DIR で変更できます)
+    
+    print(f"DEBUG: generate_and_save_report_csv: Determined output_dir: {output_dir}")
+
+    try:
+        os.makedirs(output_dir, exist_ok=True)
+        print(f"DEBUG: generate_and_save_report_csv: Directory created/exists: {output_dir}")
+    except Exception as e:
+        print(f"ERROR: generate_and_save_report_csv: Failed to create directory {output_dir}: {e}")
+        return
+
+    # ファイル名を発生日で生成
+    occurrence_date_str = "unknown_date"
+    if report_data.get('occurrence_datetime'):
+        try:
+            occurrence_dt = datetime.datetime.fromisoformat(report_data['occurrence_datetime'])
+            occurrence_date_str = occurrence_dt.strftime("%Y-%m-%d")
+        except (ValueError, TypeError):
+            pass # 変換できない場合はデフォルト値を使用
+
+    filename = f"{occurrence_date_str}_report_{report_data.get('id', 'unknown')}.csv"
+    filepath = os.path.join(output_dir, filename)
+    print(f"DEBUG: generate_and_save_report_csv: Constructed filepath: {filepath}")
+
+    # DataFrameに変換してCSVとして保存 (列の並びはスキーマ定義に合わせる。システム項目は出力しない)
+    columns = [field.column for field in FIELDS if field.column in report_data and field.group != "system"]
+    df = pd.DataFrame([report_data], columns=columns)
+    try:
+        df.to_csv(filepath, index=False, encoding='utf-8-sig') # Excelで開けるようにutf-8-sig
+        print(f"DEBUG: CSVレポートを保存しました: {filepath}")
+        return filepath
+    except Exception as e:
+        print(f"ERROR: generate_and_save_report_csv: Failed to save CSV to {filepath}: {e}")
+
+def generate_and_save_report_pdf(report_data: dict, approver_id: int = None, send_notification: bool = True):
+    """レポートデータをPDF形式で生成し、ファイルとして保存します。保存に成功した場合はファイルパスを返します。"""
+    if not report_data:
+        print("DEBUG: generate_and_save_report_pdf: report_data is empty.")
+        return
+
+    output_dir = REPORT_PDF_DIR # PDFの保存先パス
+    # ユーザーごとのパス設定を考慮する場合は、generate_and_save_report_csvと同様のロジックを追加
+
+    print(f"DEBUG: generate_and_save_report_pdf: Determined output_dir: {output_dir}")
+
+    try:
+        os.makedirs(output_dir, exist_ok=True)
+        print(f"DEBUG: generate_and_save_report_pdf: Directory created/exists: {output_dir}")
+    except Exception as e:
+        print(f"ERROR: generate_and_save_report_pdf: Failed to create directory {output_dir}: {e}")
+        return
+
+    # ファイル名を発生日で生成
+    occurrence_date_str = "unknown_date"
+    if report_data.get('occurrence_datetime'):
+        try:
+            occurrence_dt = datetime.datetime.fromisoformat(report_data['occurrence_datetime'])
+            occurrence_date_str = occurrence_dt.strftime("%Y-%m-%d")
+        except (ValueError, TypeError):
+            pass # 変換できない場合はデフォルト値を使用
+
+    filename = f"{occurrence_date_str}_report_{report_data.get('id', 'unknown')}.pdf"
+    filepath = os.path.join(output_dir, filename)
+    print(f"DEBUG: generate_and_save_report_pdf: Constructed filepath: {filepath}")
+
+    # HTMLコンテンツを生成
+    html_content = generate_report_html_content(report_data)
+
+    try:
+        write_pdf(html_content, filepath)
+        print(f"DEBUG: PDFレポートを保存しました: {filepath}")
+        saved_path = filepath
+
+        if send_notification:
+            # --- LINE WORKSへの自動投稿 ---
+            from db_utils.notify import notify_report_pdf # 通知するときだけLINE WORKSのモジュールを読み込む
+            notify_report_pdf(filepath)
+        return saved_path
+
+    except Exception as e:
+        print(f"ERROR: generate_and_save_report_pdf: Failed to save PDF to {filepath}: {e}")
+
+# --- 承認後のCSV/PDF生成と通知のバッチ処理 ---
+
+def process_approved_reports(report_ids: list, approver_id: int = None, notify: bool = True, raise_on_error: bool = False):
+    """
+    承認済みになった複数レポートのCSV/PDFを生成し、LINE WORKSのチャンネルには
+    レポートごとではなく1通のまとめメッセージだけを送信します。
+    notify=False の場合 (過去データの取り込みなど) はファイルの生成だけを行います。
+    raise_on_error=True の場合 (ジョブキューで再実行する場合)、保存に失敗したレポートがあれば
+    通知せずに RuntimeError を送出します (再実行ではファイルを上書きし、まとめて1回だけ通知します)。
+    """
+    saved_reports, failed_ids = [], []
+    for report_id in report_ids:
+        report = get_report_by_id(report_id, include_archive=True) # アーカイブ済みのレポートも出力し直せる
+        if not report:
+            continue
+        csv_path = generate_and_save_report_csv(report, approver_id)
+        if generate_and_save_report_pdf(report, approver_id, send_notification=False) and csv_path:
+            saved_reports.append(report)
+        else:
+            failed_ids.append(report_id)
+
+    if failed_ids and raise_on_error:
+        raise RuntimeError(f"CSV/PDFの保存に失敗したレポートがあります (ID: {', '.join(map(str, failed_ids))})")
+    if not saved_reports or not notify:
+        return
+
+    from db_utils.notify import notify_approved_reports
+    notify_approved_reports(saved_reports)
+
+def start_approval_batch_worker(report_ids: list, approver_id: int = None, notify: bool = True) -> threading.Thread:
+    """
+    process_approved_reports をバックグラウンドスレッドで実行し、画面の応答を待たせないようにします。
+    JOB_RUNNER=queue の場合はワーカープロセスのジョブとして登録し、None を返します。
+    """
+    from db_utils.jobs import JOB_RUNNER, enqueue_job
+    if JOB_RUNNER == "queue":
+        enqueue_job("export_batch", {"report_ids": list(report_ids), "approver_id": approver_id, "notify": notify})
+        return None
+    worker = threading.Thread(
+        target=process_approved_reports, args=(list(report_ids), approver_id, notify),
+        name="approval-batch-worker", daemon=True
+    )
+    worker.start()
+    return worker
@@ -0,0 +1,178 @@
+"""
+承認後のCSV/PDF生成と通知をジョブとして実行します。
+
+JOB_RUNNER=thread (既定)
+    これまでどおり、Streamlitのプロセス内で実行します (start_streamlit.bat の単一プロセス運用)。
+JOB_RUNNER=queue
+    jobsテーブルに登録するだけで戻り、ワーカープロセス (job_worker.py) が順に実行します。
+    複数のStreamlitプロセスで運用する場合 (launch_workers.py) に使用し、
+    WeasyPrintによるPDF生成とLINE WORKSへの通知を画面のプロセスから切り離します。
+"""
+import json
+import os
+import socket
+import threading
+import time
+from db_utils import get_db_connection
+
+JOB_RUNNER = os.environ.get("JOB_RUNNER", "thread")
+JOB_MAX_ATTEMPTS = 3          # 失敗したジョブを再実行する回数の上限
+JOB_STALE_SECONDS = 15 * 60   # 実行中のまま、この秒数を過ぎたジョブはワーカーが停止したものとして再実行する
+
+
+def _export_report(report_id: int, approver_id: int = None, notify: bool = True):
+    from db_utils import get_report_by_id
+    from db_utils.export import generate_and_save_report_csv, generate_and_save_report_pdf
+    report = get_report_by_id(report_id, include_archive=True)
+    if not report:
+        return
+    # 出力関数は失敗しても例外を出さずに None を返す。ジョブキューの場合はここで例外にして finish_job に
+    # 失敗を記録させ、再実行させる (CSVが失敗した場合はPDFの通知を送らずに再実行する)。
+    # スレッドで実行する場合は承認の操作の中から呼ばれるため、これまでどおりログに残すだけにする
+    retry = JOB_RUNNER == "queue"
+    if not generate_and_save_report_csv(report, approver_id) and retry:
+        raise RuntimeError(f"レポート (ID: {report_id}) のCSVを保存できませんでした")
+    if not generate_and_save_report_pdf(report, approver_id, send_notification=notify) and retry:
+        raise RuntimeError(f"レポート (ID: {report_id}) のPDFを保存または通知できませんでした")
+
+
+def _export_batch(report_ids: list, approver_id: int = None, notify: bool = True):
+    from db_utils.export import process_approved_reports
+    # 再実行されるのはジョブキューの場合だけのため、スレッドで実行する場合はこれまでどおり保存できた分を通知する
+    process_approved_reports(report_ids, approver_id, notify, raise_on_error=JOB_RUNNER == "queue")
+
+
+def _digest(kind: str):
+    from db_utils.digest import generate_digest
+    generate_digest(kind)
+
+
+def _maintenance():
+    from db_utils.maintenance import run_maintenance
+    run_maintenance()
+
+
+# ジョブの種類 -> 実行する関数 (payloadはキーワード引数として渡す)
+JOB_HANDLERS = {
+    "export_report": _export_report,  # 1件のCSV/PDF生成 (notify=True ならPDFをチャンネルに投稿)
+    "export_batch": _export_batch,    # 複数件のCSV/PDF生成とまとめ通知
+    "digest": _digest,                # 週報・月報のPDF作成と投稿 (作成済みの期間は何もしない)
+    "maintenance": _maintenance,      # 削除済みデータの完全削除とVACUUM (今日実行済みなら何もしない)
+}
+
+
+def run_job(kind: str, payload: dict):
+    """ジョブを現在のスレッドで実行します"""
+    JOB_HANDLERS[kind](**payload)
+
+
+def submit_job(kind: str, payload: dict, background: bool = False):
+    """
+    ジョブを実行します。JOB_RUNNER=queue の場合はjobsテーブルに登録してすぐに戻ります。
+    それ以外の場合はこのプロセスで実行し、background=True ならスレッドで実行します。
+    """
+    if kind not in JOB_HANDLERS:
+        raise ValueError(f"不明なジョブの種類です: {kind}")
+    if JOB_RUNNER == "queue":
+        return enqueue_job(kind, payload)
+    if background:
+        worker = threading.Thread(target=run_job, args=(kind, payload), name=f"job-{kind}", daemon=True)
+        worker.start()
+        return None
+    run_job(kind, payload)
+    return None
+
+
+# --- ジョブキュー (jobsテーブル) ---
+
+def enqueue_job(kind: str, payload: dict) -> int:
+    """ジョブをjobsテーブルに登録し、ジョブIDを返します"""
+    with get_db_connection() as conn:
+        cursor = conn.cursor()
+        cursor.execute("INSERT INTO jobs (kind, payload) VALUES (?, ?)", (kind, json.dumps(payload, ensure_ascii=False)))
+        conn.commit()
+        return cursor.lastrowid
+
+
+def claim_job(worker: str):
+    """
+    最も古い待機中のジョブを実行中にして (id, kind, payload) を返します。無い場合は None を返します。
+    BEGIN IMMEDIATE で書き込みロックを取ってから選ぶため、複数のワーカーが同じジョブを取ることはありません。
+    """
+    with get_db_connection() as conn:
+        cursor = conn.cursor()
+        cursor.execute("BEGIN IMMEDIATE")
+        cursor.execute("SELECT id, kind, payload FROM jobs WHERE status = 'pending' ORDER BY id LIMIT 1")
+        row = cursor.fetchone()
+        if row is None:
+            conn.rollback()
+            return None
+        cursor.execute(
+            "UPDATE jobs SET status = 'running', worker = ?, attempts = attempts + 1, started_at = CURRENT_TIMESTAMP WHERE id = ?",
+            (worker, row[0])
+        )
+        conn.commit()
+    return row[0], row[1], json.loads(row[2])
+
+
+def finish_job(job_id: int, error: str = None):
+    """ジョブの結果を記録します。失敗した場合は、上限回数まで待機中に戻して再実行させます。"""
+    with get_db_connection() as conn:
+        if error is None:
+            conn.execute("UPDATE jobs SET status = 'done', error = NULL, finished_at = CURRENT_TIMESTAMP WHERE id = ?", (job_id,))
+        else:
+            conn.execute(
+                "UPDATE jobs SET status = CASE WHEN attempts < ? THEN 'pending' ELSE 'failed' END, "
+                "error = ?, finished_at = CURRENT_TIMESTAMP WHERE id = ?",
+                (JOB_MAX_ATTEMPTS, error, job_id)
+            )
+        conn.commit()
+
+
+def requeue_stale_jobs(stale_seconds: int = JOB_STALE_SECONDS) -> int:
+    """実行中のまま止まっているジョブ (ワーカーの強制終了など) を待機中に戻し、件数を返します"""
+    with get_db_connection() as conn:
+        cursor = conn.cursor()
+        cursor.execute(
+            "UPDATE jobs SET status = 'pending' WHERE status = 'running' AND started_at < datetime('now', ?)",
+            (f"-{int(stale_seconds)} seconds",)
+        )
+        conn.commit()
+        return cursor.rowcount
+
+
+def purge_finished_jobs(days: int = 30) -> int:
+    """完了してから days 日以上経過したジョブを削除し、件数を返します"""
+    with get_db_connection() as conn:
+        cursor = conn.cursor()
+        cursor.execute("DELETE FROM jobs WHERE status = 'done' AND finished_at < datetime('now', ?)", (f"-{int(days)} days",))
+        conn.commit()
+        return cursor.rowcount
+
+
+def run_worker(poll_interval: float = 1.0, once: bool = False, stop_event: threading.Event = None):
+    """
+    jobsテーブルのジョブを順に実行します (job_worker.py から呼び出します)。
+    once=True の場合は、待機中のジョブが無くなった時点で終了します。
+    """
+    worker = f"{socket.gethostname()}:{os.getpid()}"
+    requeued = requeue_stale_jobs()
+    if requeued:
+        print(f"DEBUG: run_worker: 停止していた{requeued}件のジョブを再実行します。")
+    while not (stop_event and stop_event.is_set()):
+        job = claim_job(worker)
+        if job is None:
+            if once:
+                return
+            time.sleep(poll_interval)
+            continue
+        job_id, kind, payload = job
+        started = time.perf_counter()
+        try:
+            run_job(kind, payload)
+        except Exception as e:
+            print(f"ERROR: run_worker: ジョブ {job_id} ({kind}) が失敗しました: {e}")
+            finish_job(job_id, error=str(e))
+        else:
+            finish_job(job_id)
+            print(f"DEBUG: run_worker: ジョブ {job_id} ({kind}) を{time.perf_counter() - started:.1f}秒で実行しました。")
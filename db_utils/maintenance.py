@@ -0,0 +1,227 @@
+"""
+データベースの定期メンテナンスです (1日1回、MAINTENANCE_HOUR 時以降に実行します)。
+
+1. 論理削除してから保存期間を過ぎたレポート・下書きを完全に削除します (レポートの削除前の値は変更履歴に残します)。
+   長期間更新されていない下書き (DRAFT_TTL_DAYS) はここで論理削除します。
+   古い承認済みレポートは年ごとのアーカイブDBへ移します (db_utils.archive)。
+2. 空いたページをDBファイルから切り詰めます (PRAGMA incremental_vacuum)。
+   auto_vacuum が INCREMENTAL になっていないDBでは、初回だけ設定を変えて VACUUM します。
+3. クエリプランナーの統計情報を更新し (ANALYZE)、WALファイルを切り詰めます。
+4. 実行前後のページ数・空きページ数・ファイルサイズを maintenance_runs テーブルに記録します。
+実行済みの日は maintenance_runs に記録するため、複数のプロセスでスケジューラーを動かしても1日1回だけ実行されます。
+
+    python maintain_db.py                  (手動で実行する場合)
+    start_maintenance_scheduler()          (app.py が起動時に呼び出す)
+"""
+import datetime
+import os
+import sqlite3
+import threading
+import time
+import db_utils
+from db_utils import get_db_connection
+
+DELETED_REPORT_RETENTION_DAYS = int(os.environ.get("DELETED_REPORT_RETENTION_DAYS", 30))  # 削除したレポートを復元できる日数
+DELETED_DRAFT_RETENTION_DAYS = int(os.environ.get("DELETED_DRAFT_RETENTION_DAYS", 7))     # 削除した下書きを残しておく日数
+# この時刻以降にその日のメンテナンスを実行する (空にすると自動実行しない)
+_maintenance_hour = os.environ.get("MAINTENANCE_HOUR", "3").strip()
+MAINTENANCE_HOUR = int(_maintenance_hour) if _maintenance_hour else None
+MAINTENANCE_CHECK_INTERVAL_SECONDS = 30 * 60   # スケジューラーが実行の要否を確認する間隔
+MAINTENANCE_STALE_SECONDS = 2 * 60 * 60        # 実行中のまま、この秒数を過ぎたものは停止したものとして実行し直す
+
+
+# --- DBファイルの状態 ---
+
+def database_stats(conn) -> dict:
+    """ページサイズ・ページ数・空きページ数と、DBファイル (WALを含む) の大きさを返します"""
+    path = db_utils.DB_NAME
+    file_bytes = sum(os.path.getsize(name) for name in (path, path + "-wal") if os.path.exists(name))
+    return {
+        "page_size": conn.execute("PRAGMA page_size").fetchone()[0],
+        "pages": conn.execute("PRAGMA page_count").fetchone()[0],
+        "freelist": conn.execute("PRAGMA freelist_count").fetchone()[0],
+        "file_bytes": file_bytes,
+    }
+
+
+# --- 完全削除 ---
+
+def purge_deleted_reports(retention_days: int = DELETED_REPORT_RETENTION_DAYS) -> int:
+    """論理削除してから retention_days 日を過ぎたレポートを完全に削除し、件数を返します"""
+    with get_db_connection() as conn:
+        conn.row_factory = sqlite3.Row
+        cursor = conn.cursor()
+        cursor.execute("BEGIN IMMEDIATE")
+        cursor.execute(
+            "SELECT * FROM reports WHERE deleted_at IS NOT NULL AND deleted_at < datetime('now', ?)", (f"-{int(retention_days)} days",)
+        )
+        events = []
+        for row in cursor.fetchall():
+            before = {key: row[key] for key in row.keys() if key != "id" and row[key] is not None}
+            events.append(db_utils._report_event(row["id"], "purge", "maintenance", before, dict.fromkeys(before)))
+        cursor.executemany("DELETE FROM reports WHERE id = ?", [(event[0],) for event in events])
+        db_utils._record_report_events(cursor, events) # 完全に削除した値は変更履歴にだけ残る
+        conn.commit()
+    return len(events)
+
+
+def purge_deleted_drafts(retention_days: int = DELETED_DRAFT_RETENTION_DAYS) -> int:
+    """論理削除してから retention_days 日を過ぎた下書きと、その差分を完全に削除し、件数を返します"""
+    with get_db_connection() as conn:
+        cursor = conn.cursor()
+        cursor.execute("BEGIN IMMEDIATE")
+        cursor.execute(
+            "SELECT id FROM drafts WHERE deleted_at IS NOT NULL AND deleted_at < datetime('now', ?)", (f"-{int(retention_days)} days",)
+        )
+        draft_ids = [(row[0],) for row in cursor.fetchall()]
+        cursor.executemany("DELETE FROM draft_deltas WHERE draft_id = ?", draft_ids)
+        cursor.executemany("DELETE FROM drafts WHERE id = ?", draft_ids)
+        conn.commit()
+    for (draft_id,) in draft_ids:
+        db_utils._evict_draft_pdf(draft_id)
+    return len(draft_ids)
+
+
+# --- VACUUM と統計情報 ---
+
+def compact_database():
+    """空いたページをファイルから切り詰め、統計情報を更新し、WALファイルを切り詰めます"""
+    conn = get_db_connection()
+    try:
+        conn.isolation_level = None # VACUUM はトランザクションの外で実行する必要がある
+        if conn.execute("PRAGMA auto_vacuum").fetchone()[0] != 2:
+            # auto_vacuum の変更は VACUUM で反映される (初回だけDB全体を書き直す)
+            print("DEBUG: maintenance: auto_vacuum を INCREMENTAL に変更するため、VACUUM を実行します。")
+            conn.execute("PRAGMA auto_vacuum = INCREMENTAL")
+            conn.execute("VACUUM")
+        else:
+            conn.execute("PRAGMA incremental_vacuum")
+        conn.execute("ANALYZE")
+        conn.execute("PRAGMA optimize")
+        conn.execute("PRAGMA wal_checkpoint(TRUNCATE)")
+    finally:
+        conn.close()
+
+
+# --- 1日1回の実行 ---
+
+def _claim_run(force: bool):
+    """今日のメンテナンスを開始できる場合は maintenance_runs の行IDを返します。実行済み・実行中の場合は None を返します。"""
+    with get_db_connection() as conn:
+        cursor = conn.cursor()
+        cursor.execute("BEGIN IMMEDIATE")
+        cursor.execute(
+            "SELECT COUNT(*) FROM maintenance_runs WHERE date(started_at, 'localtime') = date('now', 'localtime') "
+            "AND (status = 'done' OR (status = 'running' AND started_at >= datetime('now', ?)))",
+            (f"-{MAINTENANCE_STALE_SECONDS} seconds",)
+        )
+        if cursor.fetchone()[0] and not force:
+            conn.rollback()
+            return None
+        cursor.execute("INSERT INTO maintenance_runs (status, started_at) VALUES ('running', CURRENT_TIMESTAMP)")
+        run_id = cursor.lastrowid
+        conn.commit()
+    return run_id
+
+
+def run_maintenance(force: bool = False, report_retention_days: int = None, draft_retention_days: int = None):
+    """
+    メンテナンスを実行し、記録した結果を辞書で返します。保存期間を省略した場合は環境変数の設定を使います。
+    今日すでに実行済み (または他のプロセスで実行中) の場合は何もせず None を返します (force=True で実行します)。
+    """
+    run_id = _claim_run(force)
+    if run_id is None:
+        print("DEBUG: maintenance: 今日のメンテナンスは実行済みのためスキップします。")
+        return None
+
+    started = time.perf_counter()
+    try:
+        with get_db_connection() as conn:
+            before = database_stats(conn)
+        purged_reports = purge_deleted_reports(DELETED_REPORT_RETENTION_DAYS if report_retention_days is None else report_retention_days)
+        db_utils.purge_stale_drafts() # 長期間更新されていない下書きは論理削除し、保存期間を過ぎてから完全に削除する
+        purged_drafts = purge_deleted_drafts(DELETED_DRAFT_RETENTION_DAYS if draft_retention_days is None else draft_retention_days)
+        from db_utils.archive import archive_reports
+        archived_reports = sum(archive_reports().values())
+        compact_database()
+        with get_db_connection() as conn:
+            after = database_stats(conn)
+    except Exception as e:
+        with get_db_connection() as conn:
+            conn.execute(
+                "UPDATE maintenance_runs SET status = 'failed', error = ?, finished_at = CURRENT_TIMESTAMP WHERE id = ?", (str(e), run_id)
+            )
+            conn.commit()
+        raise
+
+    result = {
+        "purged_reports": purged_reports, "purged_drafts": purged_drafts, "archived_reports": archived_reports, "page_size": after["page_size"],
+        "pages_before": before["pages"], "pages_after": after["pages"],
+        "freelist_before": before["freelist"], "freelist_after": after["freelist"],
+        "file_bytes_before": before["file_bytes"], "file_bytes_after": after["file_bytes"],
+    }
+    with get_db_connection() as conn:
+        conn.execute(
+            f"UPDATE maintenance_runs SET status = 'done', finished_at = CURRENT_TIMESTAMP, "
+            f"{', '.join(f'{column} = ?' for column in result)} WHERE id = ?",
+            (*result.values(), run_id)
+        )
+        conn.commit()
+    if purged_reports:
+        db_utils._reports_changed()
+    print(
+        f"DEBUG: maintenance: レポート{purged_reports}件・下書き{purged_drafts}件を完全に削除し、レポート{archived_reports}件をアーカイブしました。"
+        f" ページ数 {before['pages']} → {after['pages']} (空き {before['freelist']} → {after['freelist']}),"
+        f" ファイル {before['file_bytes'] / 1024:.0f}KB → {after['file_bytes'] / 1024:.0f}KB ({time.perf_counter() - started:.1f}秒)"
+    )
+    return result
+
+
+def get_maintenance_history(limit: int = 30) -> list:
+    """最近のメンテナンスの記録 (ファイルサイズ・ページ数の推移の確認用) を新しい順に返します"""
+    with get_db_connection() as conn:
+        conn.row_factory = sqlite3.Row
+        rows = conn.execute("SELECT * FROM maintenance_runs ORDER BY id DESC LIMIT ?", (int(limit),)).fetchall()
+    return [dict(row) for row in rows]
+
+
+# --- スケジューラー ---
+
+def maintenance_due(now: datetime.datetime = None) -> bool:
+    """今日のメンテナンスを実行する時刻を過ぎていて、まだ実行されていない場合に True を返します"""
+    now = now or datetime.datetime.now()
+    if MAINTENANCE_HOUR is None or now.hour < MAINTENANCE_HOUR:
+        return False
+    with get_db_connection() as conn:
+        row = conn.execute(
+            "SELECT COUNT(*) FROM maintenance_runs WHERE status = 'done' AND date(started_at, 'localtime') = ?", (now.date().isoformat(),)
+        ).fetchone()
+    return row[0] == 0 # 他のプロセスで実行中の場合は run_maintenance がスキップする
+
+
+_scheduler = None
+_scheduler_lock = threading.Lock()
+
+
+def _run_scheduler(interval: float):
+    from db_utils.jobs import submit_job
+    while True:
+        try:
+            if maintenance_due():
+                # JOB_RUNNER=queue の場合はジョブワーカーが実行する (VACUUM を画面のプロセスで行わない)
+                submit_job("maintenance", {})
+        except Exception as e:
+            print(f"ERROR: maintenance scheduler: {e}")
+        time.sleep(interval)
+
+
+def start_maintenance_scheduler(interval: float = MAINTENANCE_CHECK_INTERVAL_SECONDS):
+    """定期メンテナンスを実行するスレッドを開始します (プロセスごとに1つだけ。MAINTENANCE_HOUR が空の場合は開始しません)"""
+    global _scheduler
+    if MAINTENANCE_HOUR is None:
+        return None
+    with _scheduler_lock:
+        if _scheduler is None:
+            _scheduler = threading.Thread(target=_run_scheduler, args=(interval,), name="maintenance-scheduler", daemon=True)
+            _scheduler.start()
+    return _scheduler
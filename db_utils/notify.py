@@ -0,0 +1,281 @@
+"""
+LINE WORKSへの通知の振り分けです。
+通知は publish(通知の種類, ...) で登録し、RULES に従って送信先ごとのキューから送信します。
+
+- 送信先 (チャンネル・個人) ごとにキューと送信用のスレッドがあり、遅い送信先が他の送信先の通知を待たせません。
+- 同じ種類の通知が NOTIFY_COALESCE_SECONDS 以内に続いた場合は、1通にまとめて送ります (例: 「新規報告 (3件)」)。
+- Streamlitのセッション (スレッド) から同時に呼び出しても安全です。まとめるのは同じプロセス内の通知だけです。
+
+LINE WORKSのモジュールは requests と jwt を読み込むため、実際に送信するときだけ読み込みます。
+"""
+import os
+import time
+import atexit
+import datetime
+import threading
+from collections import deque, namedtuple
+
+NOTIFY_COALESCE_SECONDS = float(os.environ.get("NOTIFY_COALESCE_SECONDS", "5"))  # 同じ種類の通知をまとめる時間
+NOTIFY_COALESCE_MAX = 20            # 1通にまとめる通知の数の上限
+NOTIFY_IDLE_SECONDS = 60            # 送信用のスレッドは、この秒数通知が無ければ終了する
+NOTIFY_FLUSH_TIMEOUT = 60           # プロセス終了時に未送信の通知を待つ秒数
+
+# --- 送信先 ---
+# 名前 -> (チャンネルIDの環境変数, Bot IDの環境変数)。Bot IDが未設定の場合は LW_API_20_BOT_ID を使う
+CHANNELS = {
+    "channel": ("LW_API_20_CHANNEL_ID", "LW_API_20_BOT_ID"),                            # PDFの投稿先
+    "approval_channel": ("LW_API_20_APPROVAL_CHANNEL_ID", "LW_API_20_APPROVAL_BOT_ID"),  # 承認グループ
+}
+REPORTER = "reporter"               # publish の user_id で指定した個人宛て
+
+# --- 通知の種類と送信先 ---
+# title: 1通目の見出し (まとめた場合は件数を付ける), footer: 末尾の案内, separator: まとめた本文の区切り,
+# coalesce: まとめるか, timestamp: 先頭に送信時刻を付けるか
+Rule = namedtuple("Rule", "destinations title footer separator coalesce timestamp", defaults=("", "\n\n", True, False))
+
+RULES = {
+    "report_submitted": Rule(
+        ("approval_channel",), "【新規インシデント報告】",
+        "以下のリンクから承認管理ページにアクセスしてください。\nhttps://incident.kco-sports.com/"
+    ),
+    "report_resubmitted": Rule(
+        ("approval_channel",), "【再提出インシデント報告】", "差し戻し後の修正が完了しました。再承認をお願いします。"
+    ),
+    "report_rejected": Rule((REPORTER,), "【インシデント報告 差し戻し通知】", "修正後、再提出をお願いします。"),
+    "report_pdf": Rule(
+        ("channel",), "【新規インシデント報告】", "新しいインシデント報告のPDFを投稿します。ご確認お願いいたします。", timestamp=True
+    ),
+    "reports_approved": Rule(
+        ("channel",), "【承認済みインシデント報告】", "PDFは共有フォルダに保存されています。", separator="\n", timestamp=True
+    ),
+    "digest_pdf": Rule(("channel",), "", coalesce=False, timestamp=True),
+}
+
+
+class _Message:
+    """キューに入れる1件の通知です。送信が終わると done がセットされ、result に成否が入ります"""
+
+    def __init__(self, event_type: str, text: str, file_path: str):
+        self.event_type = event_type
+        self.text = text
+        self.file_path = file_path
+        self.created = time.monotonic()
+        self.done = threading.Event()
+        self.result = False
+
+
+_queues = {}                        # 送信先のキー -> deque(_Message)。キーは ("channel", 名前) または ("user", ID)
+_condition = threading.Condition()
+_in_flight = 0                      # 送信中の通知の数
+_flushing = False                   # True の間は、まとめるために待たずにすぐ送信する
+_stats = {"published": 0, "messages": 0, "coalesced": 0, "failed": 0}
+
+
+def _now_jst_text() -> str:
+    return datetime.datetime.now(datetime.timezone(datetime.timedelta(hours=9))).strftime("%Y-%m-%d %H:%M:%S")
+
+
+def _channel_settings(name: str):
+    """環境変数から送信先のチャンネルIDとBot IDを読み込みます (strip()で空白を除去)。未設定の場合は None です。"""
+    channel_env, bot_env = CHANNELS[name]
+    channel_id = (os.environ.get(channel_env) or "").strip() or None
+    bot_id = (os.environ.get(bot_env) or "").strip() or (os.environ.get("LW_API_20_BOT_ID") or "").strip() or None
+    return channel_id, bot_id
+
+
+def _destination_keys(event_type: str, user_id: str = None) -> list:
+    keys = []
+    for destination in RULES[event_type].destinations:
+        if destination == REPORTER:
+            if user_id:
+                keys.append(("user", user_id))
+        elif all(_channel_settings(destination)):
+            keys.append(("channel", destination))
+    return keys
+
+
+def is_routed(event_type: str, user_id: str = None) -> bool:
+    """この種類の通知の送信先が1つ以上設定されている場合に True を返します"""
+    return bool(_destination_keys(event_type, user_id))
+
+
+def publish(event_type: str, text: str = "", file_path: str = None, user_id: str = None, wait: bool = False, timeout: float = None):
+    """
+    通知を登録します。送信はバックグラウンドで行うため、通常はすぐに戻ります。
+    text はこの通知の本文 (見出し・末尾の案内は RULES から付けます)、file_path は続けて送るファイル、
+    user_id は個人宛ての通知の送信先です。
+    wait=True の場合は送信が終わるまで待ち、すべての送信先に送信できたら True を返します。
+    送信先が1つも設定されていない場合は False を返します。
+    """
+    keys = _destination_keys(event_type, user_id)
+    if not keys:
+        print(f"DEBUG: notify: {event_type} の送信先が設定されていないため、LINE WORKSへの通知をスキップします。")
+        return False
+
+    messages = []
+    with _condition:
+        _stats["published"] += 1
+        for key in keys:
+            message = _Message(event_type, text, file_path)
+            messages.append(message)
+            if key not in _queues:
+                _queues[key] = deque()
+                threading.Thread(target=_worker, args=(key,), name=f"notify-{key[0]}-{key[1]}", daemon=True).start()
+            _queues[key].append(message)
+        _condition.notify_all()
+
+    if not wait:
+        return None
+    deadline = None if timeout is None else time.monotonic() + timeout
+    for message in messages:
+        remaining = None if deadline is None else max(0.0, deadline - time.monotonic())
+        if not message.done.wait(remaining):
+            return False
+    return all(message.result for message in messages)
+
+
+def flush(timeout: float = NOTIFY_FLUSH_TIMEOUT) -> bool:
+    """キューに残っている通知を (まとめるために待たずに) すべて送信し、送信し終えたら True を返します"""
+    global _flushing
+    deadline = time.monotonic() + timeout
+    with _condition:
+        _flushing = True
+        _condition.notify_all()
+        try:
+            while any(_queues.values()) or _in_flight:
+                remaining = deadline - time.monotonic()
+                if remaining <= 0:
+                    return False
+                _condition.wait(remaining)
+            return True
+        finally:
+            _flushing = False
+
+
+def get_notify_stats() -> dict:
+    """このプロセスで登録した通知の数・実際に送ったメッセージの数・まとめた通知の数などを返します"""
+    with _condition:
+        stats = dict(_stats)
+        stats["queued"] = sum(len(queue) for queue in _queues.values())
+    return stats
+
+
+# --- 送信用のスレッド ---
+
+def _take_batch(queue: deque) -> list:
+    """キューの先頭の通知と、それとまとめる同じ種類の通知を取り出します (_condition を取得した状態で呼び出す)"""
+    first = queue.popleft()
+    batch = [first]
+    if RULES[first.event_type].coalesce:
+        rest = deque()
+        while queue:
+            message = queue.popleft()
+            if message.event_type == first.event_type and len(batch) < NOTIFY_COALESCE_MAX:
+                batch.append(message)
+            else:
+                rest.append(message)
+        queue.extend(rest)
+    return batch
+
+
+def _worker(key: tuple):
+    global _in_flight
+    idle_until = None
+    while True:
+        with _condition:
+            queue = _queues[key]
+            if not queue:
+                now = time.monotonic()
+                idle_until = idle_until or now + NOTIFY_IDLE_SECONDS
+                if now >= idle_until:
+                    del _queues[key]
+                    _condition.notify_all()
+                    return
+                _condition.wait(idle_until - now)
+                continue
+            idle_until = None
+            first = queue[0]
+            if RULES[first.event_type].coalesce and not _flushing:
+                remaining = first.created + NOTIFY_COALESCE_SECONDS - time.monotonic()
+                if remaining > 0:
+                    _condition.wait(remaining) # 同じ種類の通知が続くのを待つ
+                    continue
+            batch = _take_batch(queue)
+            _in_flight += len(batch)
+
+        try:
+            success = _send_batch(key, batch)
+        except Exception as e:
+            print(f"ERROR: notify: {key[1]} への通知に失敗しました: {e}")
+            success = False
+        with _condition:
+            _in_flight -= len(batch)
+            _stats["messages"] += 1
+            _stats["coalesced"] += len(batch) - 1
+            if not success:
+                _stats["failed"] += 1
+            _condition.notify_all()
+        for message in batch:
+            message.result = success
+            message.done.set()
+
+
+def format_message(event_type: str, texts: list) -> str:
+    """同じ種類の通知の本文をまとめ、見出しと末尾の案内を付けたメッセージを作成します"""
+    rule = RULES[event_type]
+    head = []
+    if rule.timestamp:
+        head.append(_now_jst_text())
+    if rule.title:
+        head.append(rule.title if len(texts) == 1 else f"{rule.title} ({len(texts)}件)")
+    blocks = ["\n".join(head), rule.separator.join(text for text in texts if text), rule.footer]
+    return "\n\n".join(block for block in blocks if block)
+
+
+def _send_batch(key: tuple, batch: list) -> bool:
+    """まとめたメッセージを送り、続けて添付ファイルを順に送ります"""
+    text = format_message(batch[0].event_type, [message.text for message in batch])
+    if key[0] == "user":
+        import lineworks_bot
+        if not lineworks_bot.send_text_message_to_user(text, key[1]):
+            return False
+        return all(lineworks_bot.send_line_works_file(m.file_path, key[1]) for m in batch if m.file_path)
+
+    import lineworks_bot_room
+    channel_id, bot_id = _channel_settings(key[1])
+    print(f"DEBUG: LINE WORKSチャンネル ({channel_id}) に{len(batch)}件の通知を送信します...")
+    text_sent = lineworks_bot_room.send_text_message_to_channel(text_message=text, channel_id=channel_id, bot_id=bot_id)
+    files = [m.file_path for m in batch if m.file_path]
+    if not files:
+        return bool(text_sent)
+    # ファイルは事前メッセージの送信に失敗しても投稿する (これまでどおり)。複数の場合はアップロードを同時に行う
+    if len(files) == 1:
+        return bool(lineworks_bot_room.send_file_to_channel(file_path=files[0], channel_id=channel_id, bot_id=bot_id))
+    return bool(lineworks_bot_room.send_files_to_channel(files, channel_id, bot_id=bot_id))
+
+
+atexit.register(flush) # CLIやワーカーの終了時に、まとめるために待っている通知を送信する
+
+
+# --- 通知の種類ごとの呼び出し口 ---
+
+def notify_report_pdf(filepath: str):
+    """新しい報告のPDFを、事前メッセージを付けてチャンネルに投稿します (続けて投稿された報告とまとめて送ります)"""
+    return publish("report_pdf", file_path=filepath)
+
+
+def notify_digest_pdf(filepath: str, title: str) -> bool:
+    """週報・月報のPDFを、事前メッセージを付けてチャンネルに投稿します。投稿が終わるまで待ち、成功した場合は True を返します。"""
+    success = publish("digest_pdf", text=f"{title}を作成しました。ご確認お願いいたします。", file_path=filepath, wait=True)
+    print(f"DEBUG: {title}のLINE WORKSへの投稿に{'成功' if success else '失敗'}しました。")
+    return bool(success)
+
+
+def notify_approved_reports(reports: list):
+    """承認済みになったレポートをチャンネルに通知します (続けて承認されたレポートとまとめて1通で送ります)"""
+    for report in reports:
+        occurrence = str(report.get('occurrence_datetime') or '')[:16]
+        publish(
+            "reports_approved",
+            text=f"・報告ID {report.get('id')}: {occurrence} {report.get('content_category') or ''} (レベル{report.get('level') or '-'})"
+        )
@@ -0,0 +1,211 @@
+"""
+報告書・下書きのHTMLとPDFを生成します。
+WeasyPrintの読み込みには時間がかかるため、PDFを生成するときだけこのモジュールを読み込みます。
+"""
+import datetime
+import threading
+from weasyprint import CSS, HTML # PDF生成のためにWeasyPrintをインポート
+from report_schema import fields_in_group
+from report_form import summarize_content_details, summarize_causes # 報告フォームの共通定義
+
+# 解析済みのスタイルシート (CSSの文字列 -> weasyprint.CSS)。同じスタイルのPDFを作るたびにCSSを解析し直さない
+_stylesheet_cache = {}
+_stylesheet_lock = threading.Lock()
+
+
+def get_stylesheet(css_text: str) -> CSS:
+    """CSSの文字列を解析したスタイルシートを返します (2回目以降はキャッシュを使います)"""
+    with _stylesheet_lock:
+        stylesheet = _stylesheet_cache.get(css_text)
+        if stylesheet is None:
+            stylesheet = _stylesheet_cache[css_text] = CSS(string=css_text)
+        return stylesheet
+
+
+def write_pdf(html_content: str, target=None, css_text: str = None):
+    """HTMLからPDFを生成します。target を省略した場合はPDFのバイト列を返します。css_text はキャッシュしたスタイルシートとして適用します。"""
+    stylesheets = [get_stylesheet(css_text)] if css_text else None
+    return HTML(string=html_content).write_pdf(target, stylesheets=stylesheets)
+
+
+def _format_saved_at(created_at) -> str:
+    """下書きの保存日時 (SQLiteのTIMESTAMP文字列) を表示用の形式にします"""
+    try:
+        return datetime.datetime.fromisoformat(str(created_at)).strftime('%Y年%m月%d日 %H時%M分')
+    except ValueError:
+        return str(created_at)
+
+# --- HTMLテンプレートの定義 ---
+HTML_TEMPLATE = """
+<!DOCTYPE html>
+<html lang="ja">
+<head>
+    <meta charset="UTF-8">
+    <meta name="viewport" content="width=device-width, initial-scale=1.0">
+    <title>インシデント報告書 - ID: {id}</title>
+    <style>
+        body {{ font-family: 'Segoe UI', Tahoma, Geneva, Verdana, sans-serif; line-height: 1.6; color: #333; margin: 20px; background-color: #f4f4f4; }}
+        .container {{ max-width: 800px; margin: auto; background: #fff; padding: 30px; border-radius: 8px; box-shadow: 0 2px 10px rgba(0,0,0,0.1); }}
+        h1, h2, h3 {{ color: #0056b3; border-bottom: 2px solid #eee; padding-bottom: 5px; margin-top: 20px; }}
+        .section {{ margin-bottom: 20px; }}
+        .field {{ margin-bottom: 10px; }}
+        .field strong {{ display: inline-block; width: 150px; color: #555; }}
+        .situation, .countermeasure {{ border: 1px solid #ddd; padding: 15px; border-radius: 5px; background-color: #f9f9f9; white-space: pre-wrap; }}
+        .footer {{ text-align: center; margin-top: 30px; font-size: 0.8em; color: #777; }}
+    </style>
+</head>
+<body>
+    <div class="container">
+        <h1>インシデント報告書</h1>
+        <div class="section">
+            <h2>基本情報</h2>
+{basic_fields}
+        </div>
+
+        <div class="section">
+            <h2>患者情報</h2>
+{patient_fields}
+        </div>
+
+        <div class="section">
+            <h2>インシデントの詳細</h2>
+{incident_fields}
+        </div>
+
+        <div class="section">
+            <h2>状況と対策</h2>
+            <h3>発生の状況と直後の対応</h3>
+            <div class="situation">{situation}</div>
+            <h3>今後の対策</h3>
+            <div class="countermeasure">{countermeasure}</div>
+        </div>
+
+        <div class="footer">
+            <p>報告書生成日時: {created_at}</p>
+        </div>
+    </div>
+</body>
+</html>
+"""
+
+def render_field_rows(data: dict, group: str, wrap_span: bool = False) -> str:
+    """スキーマ定義の表示グループに従って、PDF用の項目行 (<div class="field">) を生成します"""
+    rows = []
+    for field in fields_in_group(group):
+        value = data.get(field.column, "N/A")
+        if wrap_span:
+            value = f"<span>{value}</span>"
+        rows.append(f'            <div class="field"><strong>{field.caption}:</strong> {value}</div>')
+    return "\n".join(rows)
+
+def generate_report_html_content(report_data: dict) -> str:
+    """レポートデータからHTMLコンテンツを生成します"""
+    # 辞書内のNone値を空文字列に変換して、format()でエラーが出ないようにする
+    formatted_data = {k: v if v is not None else "N/A" for k, v in report_data.items()}
+    
+    # 日付/時刻のフォーマット
+    if 'occurrence_datetime' in formatted_data and formatted_data['occurrence_datetime'] != "N/A":
+        try:
+            dt_obj = datetime.datetime.fromisoformat(formatted_data['occurrence_datetime'])
+            formatted_data['occurrence_datetime'] = dt_obj.strftime("%Y年%m月%d日 %H時%M分")
+        except (ValueError, TypeError):
+            pass # 変換できない場合はデフォルト値を使用
+
+    if 'created_at' in formatted_data and formatted_data['created_at'] != "N/A":
+        try:
+            dt_obj = datetime.datetime.fromisoformat(formatted_data['created_at'])
+            # UTCとして認識させ、JSTに変換
+            dt_obj = dt_obj.replace(tzinfo=datetime.timezone.utc)
+            jst_timezone = datetime.timezone(datetime.timedelta(hours=9))
+            dt_obj_jst = dt_obj.astimezone(jst_timezone)
+            formatted_data['created_at'] = dt_obj_jst.strftime("%Y年%m月%d日 %H時%M分%S秒")
+        except (ValueError, TypeError):
+            pass # 変換できない場合はそのまま
+
+    for group in ("basic", "patient", "incident"):
+        formatted_data[f"{group}_fields"] = render_field_rows(formatted_data, group)
+
+    return HTML_TEMPLATE.format(**formatted_data)
+
+# --- 下書き用HTMLテンプレートの定義 ---
+DRAFT_HTML_TEMPLATE = """
+<!DOCTYPE html>
+<html lang="ja">
+<head>
+    <meta charset="UTF-8">
+    <meta name="viewport" content="width=device-width, initial-scale=1.0">
+    <title>インシデント報告書（下書き）</title>
+    <style>
+        body {{ font-family: 'Segoe UI', Tahoma, Geneva, Verdana, sans-serif; line-height: 1.4; /* 行間を詰める */ color: #333; margin: 10px; /* 余白を減らす */ background-color: #f4f4f4; font-size: 12px; /* フォントサイズを小さく */ }}
+        .container {{ max-width: 780px; /* 幅を少し狭める */ margin: auto; background: #fff; padding: 20px; /* パディングを減らす */ border-radius: 8px; box-shadow: 0 2px 10px rgba(0,0,0,0.1); }}
+        h1, h2, h3 {{ color: #0056b3; border-bottom: 1px solid #eee; /* ボーダーを細く */ padding-bottom: 3px; /* パディングを減らす */ margin-top: 15px; /* マージンを減らす */ margin-bottom: 5px; /* マージンを減らす */ }}
+        .section {{ margin-bottom: 15px; /* マージンを減らす */ }}
+        .field {{ margin-bottom: 5px; /* マージンを減らす */ }}
+        .field strong {{ display: inline-block; width: 120px; /* 幅を減らす */ color: #555; vertical-align: top; }}
+        .field span {{ display: inline-block; max-width: calc(100% - 130px); /* 幅を増やす */ word-wrap: break-word; }}
+        .situation, .countermeasure {{ border: 1px solid #ddd; padding: 10px; /* パディングを減らす */ border-radius: 5px; background-color: #f9f9f9; white-space: pre-wrap; font-size: 11px; /* テキストエリアのフォントサイズも小さく */ }}
+        .footer {{ text-align: center; margin-top: 20px; /* マージンを減らす */ font-size: 0.7em; color: #777; }}
+    </style>
+</head>
+<body>
+    <div class="container">
+        <h1>インシデント報告書（下書き）</h1>
+        <!-- 基本情報と患者情報は削除 -->
+
+        <div class="section">
+            <h2>インシデントの詳細</h2>
+{incident_fields}
+        </div>
+
+        <div class="section">
+            <h2>状況と対策</h2>
+            <h3>発生の状況と直後の対応</h3>
+            <div class="situation">{situation}</div>
+            <h3>今後の対策</h3>
+            <div class="countermeasure">{countermeasure}</div>
+        </div>
+
+        <div class="footer">
+            <p>下書きタイトル: {draft_title}</p>
+            <p>下書き生成日時: {created_at}</p>
+        </div>
+    </div>
+</body>
+</html>
+"""
+
+def generate_draft_html_content(draft_data: dict, draft_title: str, created_at: str) -> str:
+    """下書きデータからHTMLコンテンツを生成します"""
+    # 辞書内のNone値を空文字列に変換して、format()でエラーが出ないようにする
+    formatted_data = {k: v if v is not None else "N/A" for k, v in draft_data.items()}
+
+    # 日付/時刻のフォーマット
+    if 'occurrence_date' in formatted_data and formatted_data['occurrence_date'] != "N/A":
+        try:
+            # occurrence_dateとoccurrence_timeを結合してdatetimeオブジェクトを作成
+            occurrence_date_obj = datetime.date.fromisoformat(formatted_data['occurrence_date'])
+            occurrence_time_obj = datetime.time.fromisoformat(formatted_data.get('occurrence_time'))
+            occurrence_datetime_obj = datetime.datetime.combine(occurrence_date_obj, occurrence_time_obj)
+            formatted_data['occurrence_datetime'] = occurrence_datetime_obj.strftime("%Y年%m月%d日 %H時%M分")
+        except (ValueError, TypeError):
+            formatted_data['occurrence_datetime'] = "N/A" # 変換できない場合はN/A
+
+    # インシデント内容と発生原因の要約 (報告フォームと同じ形式)
+    formatted_data['content_details'] = summarize_content_details(draft_data)
+    formatted_data['cause_details'] = summarize_causes(draft_data)
+
+    # その他のフィールドのデフォルト値設定
+    formatted_data.setdefault('situation', "")
+    formatted_data.setdefault('countermeasure', "")
+    formatted_data['draft_title'] = draft_title
+    formatted_data['created_at'] = _format_saved_at(created_at) # 下書き保存日時
+
+    formatted_data['incident_fields'] = render_field_rows(formatted_data, "incident", wrap_span=True)
+
+    # HTMLテンプレートにデータを埋め込む
+    return DRAFT_HTML_TEMPLATE.format(**formatted_data)
+
+def generate_draft_pdf_bytes(draft_data: dict, draft_title: str, created_at: str) -> bytes:
+    """下書きデータからPDFのバイトストリームを生成します"""
+    html_content = generate_draft_html_content(draft_data, draft_title, created_at)
+    return write_pdf(html_content)
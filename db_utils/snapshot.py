@@ -0,0 +1,145 @@
+"""
+集計用の読み取り専用スナップショットです。
+
+グラフ分析・週報月報の集計は、報告の書き込みを受ける incident_reports.db ではなく、
+SQLiteのバックアップAPIで作ったコピー (incident_reports_snapshot_<作成時刻>.db) から読みます。
+コピーは mode=ro&immutable=1 で開くため、集計の読み込みは書き込み側のロックやWALに一切触れません。
+
+- スナップショットは SNAPSHOT_MAX_AGE_SECONDS 秒より古くなったら作り直します (読み込み時に確認します)。
+  半分の時間を過ぎた時点でバックグラウンドで作り直し始めるため、通常は集計が作成を待つことはありません。
+- 作り直しは新しいファイル名で作成してから切り替えます。開いている接続は古いファイルを読み続け、
+  古いファイルは次の作成時に削除します (他のプロセスが開いている場合は、その次の機会に削除します)。
+- SNAPSHOT_MAX_AGE_SECONDS を空または0にすると、スナップショットを使わずに現在のDBから読みます。
+"""
+import glob
+import os
+import sqlite3
+import threading
+import time
+from urllib.request import pathname2url
+import db_utils
+from db_utils import get_db_connection
+
+# スナップショットの古さの上限 (秒)。空または0の場合はスナップショットを使わない
+SNAPSHOT_MAX_AGE_SECONDS = float(os.environ.get("SNAPSHOT_MAX_AGE_SECONDS", "300").strip() or 0) or None
+SNAPSHOT_DIR = os.environ.get("SNAPSHOT_DIR", "").strip()   # スナップショットの保存先 (空の場合は DB_NAME と同じ場所)
+SNAPSHOT_KEEP = 2   # 残しておくスナップショットの数 (他のプロセスが直前のものを開いている場合に備える)
+
+_current = None                     # (パス, 作成時刻 (time.time())) このプロセスで使っているスナップショット
+_lock = threading.Lock()
+_refresh_lock = threading.Lock()    # 作成は1つのスレッドだけが行う
+_refreshing = False                 # バックグラウンドで作成中
+_stats = {"refreshes": 0, "last_refresh_seconds": None}
+
+
+def _snapshot_pattern() -> str:
+    directory, name = os.path.split(db_utils.DB_NAME)
+    return os.path.join(SNAPSHOT_DIR or directory, f"{os.path.splitext(name)[0]}_snapshot_*.db")
+
+
+def _created_at(path: str) -> float:
+    """ファイル名の作成時刻 (エポックミリ秒) を time.time() の値にします"""
+    return int(os.path.basename(path).rsplit("_", 1)[1].split(".")[0]) / 1000
+
+
+def _find_latest():
+    """他のプロセスが作成したものも含め、最新のスナップショットを (パス, 作成時刻) で返します"""
+    paths = sorted(glob.glob(_snapshot_pattern()))
+    return (paths[-1], _created_at(paths[-1])) if paths else None
+
+
+def _remove_old(keep: str):
+    for path in sorted(glob.glob(_snapshot_pattern()))[:-SNAPSHOT_KEEP]:
+        if path != keep:
+            try:
+                os.remove(path)
+            except OSError:
+                pass # 他のプロセスが開いている (Windows) 場合は次の作成時に削除する
+
+
+def refresh_snapshot() -> str:
+    """現在のDBのスナップショットを新しく作成し、そのパスを返します"""
+    global _current
+    with _refresh_lock:
+        created = time.time()
+        started = time.perf_counter()
+        path = _snapshot_pattern().replace("*", f"{int(created * 1000):015d}")
+        temporary = path + ".tmp"
+        source = get_db_connection()
+        target = sqlite3.connect(temporary)
+        try:
+            source.backup(target) # 1回のステップでコピーするため、コピーの内容は開始時点のDBと一致する
+            # immutable で開くため、WALを使わないジャーナルモードにしておく
+            target.execute("PRAGMA journal_mode = DELETE")
+        finally:
+            target.close()
+            source.close()
+        os.replace(temporary, path)
+        with _lock:
+            _current = (path, created)
+            _stats["refreshes"] += 1
+            _stats["last_refresh_seconds"] = time.perf_counter() - started
+        _remove_old(path)
+    print(f"DEBUG: snapshot: 集計用のスナップショットを作成しました ({path}, {_stats['last_refresh_seconds']:.2f}秒)。")
+    return path
+
+
+def _refresh_in_background():
+    global _refreshing
+    try:
+        refresh_snapshot()
+    except Exception as e:
+        print(f"ERROR: snapshot: スナップショットの作成に失敗しました: {e}")
+    finally:
+        with _lock:
+            _refreshing = False
+
+
+def current_snapshot(max_age: float = None):
+    """
+    max_age 秒 (省略時は SNAPSHOT_MAX_AGE_SECONDS) より新しいスナップショットのパスを返します。
+    無い場合は作成してから返します。スナップショットを使わない設定の場合は None を返します。
+    """
+    global _current, _refreshing
+    if SNAPSHOT_MAX_AGE_SECONDS is None:
+        return None
+    max_age = SNAPSHOT_MAX_AGE_SECONDS if max_age is None else min(max_age, SNAPSHOT_MAX_AGE_SECONDS)
+    with _lock:
+        current = _current
+    if current is not None and not os.path.exists(current[0]):
+        current = None # 他のプロセスが新しいものを作成して削除した
+    if current is None or time.time() - current[1] > max_age / 2:
+        latest = _find_latest() # 他のプロセスが新しいものを作成していればそれを使う
+        if latest and (current is None or latest[1] > current[1]) and os.path.exists(latest[0]):
+            with _lock:
+                _current = current = latest
+    age = time.time() - current[1] if current else None
+    if age is None or age > max_age:
+        return refresh_snapshot()
+    if age > SNAPSHOT_MAX_AGE_SECONDS / 2:
+        with _lock:
+            start = not _refreshing
+            _refreshing = True
+        if start:
+            threading.Thread(target=_refresh_in_background, name="snapshot-refresh", daemon=True).start()
+    return current[0]
+
+
+def snapshot_connection(max_age: float = None):
+    """
+    集計用の読み取り専用接続を返します (スナップショットを使わない設定の場合は現在のDBへの接続です)。
+    max_age には、これより古いデータでは困る場合 (週報・月報など) に許容する古さ (秒) を指定します。
+    """
+    path = current_snapshot(max_age)
+    if path is None:
+        return get_db_connection()
+    return sqlite3.connect(f"file:{pathname2url(os.path.abspath(path))}?mode=ro&immutable=1", uri=True)
+
+
+def get_snapshot_info() -> dict:
+    """使っているスナップショットのパス・古さ (秒)・このプロセスでの作成回数などを返します"""
+    with _lock:
+        info = dict(_stats)
+        info["path"] = _current[0] if _current else None
+        info["age_seconds"] = time.time() - _current[1] if _current else None
+    return info
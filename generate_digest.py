@@ -0,0 +1,23 @@
+import argparse
+import datetime
+from db_utils import init_db
+from db_utils.digest import DIGEST_KINDS, digest_period, digest_title, generate_digest
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="週報・月報 (期間の集計PDF) を作成し、LINE WORKSのチャンネルに投稿します。")
+    parser.add_argument("--kind", choices=list(DIGEST_KINDS), default="monthly", help="weekly: 前の週 / monthly: 前の月")
+    parser.add_argument("--date", type=datetime.date.fromisoformat, default=None, help="基準日 (YYYY-MM-DD)。この日の前の週・月を集計します (省略時は今日)")
+    parser.add_argument("--no-notify", action="store_true", help="チャンネルに投稿しない")
+    parser.add_argument("--force", action="store_true", help="作成済みの期間もPDFを作り直す (投稿済みの場合は再投稿しません)")
+    args = parser.parse_args(argv)
+
+    init_db()
+    start, end = digest_period(args.kind, args.date)
+    filepath = generate_digest(args.kind, args.date, notify=not args.no_notify, force=args.force)
+    if filepath:
+        print(f"{digest_title(args.kind, start, end)}を作成しました: {filepath}")
+    else:
+        print(f"{digest_title(args.kind, start, end)}は作成済みです (作り直す場合は --force を指定してください)。")
+
+if __name__ == "__main__":
+    main()
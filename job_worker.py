@@ -0,0 +1,24 @@
+import argparse
+from db_utils import init_db
+from db_utils.jobs import run_worker, purge_finished_jobs
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(
+        description="承認後のCSV/PDF生成とLINE WORKSへの通知を実行するワーカーです (JOB_RUNNER=queue で運用する場合に起動します)。"
+    )
+    parser.add_argument("--poll", type=float, default=1.0, help="待機中のジョブが無い場合に確認する間隔 (秒)")
+    parser.add_argument("--once", action="store_true", help="待機中のジョブをすべて実行したら終了する")
+    args = parser.parse_args(argv)
+
+    init_db()
+    purged = purge_finished_jobs()
+    if purged:
+        print(f"完了済みのジョブを{purged}件削除しました。")
+    print("ジョブワーカーを開始しました。")
+    try:
+        run_worker(poll_interval=args.poll, once=args.once)
+    except KeyboardInterrupt:
+        print("ジョブワーカーを終了します。")
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,222 @@
+import argparse
+import asyncio
+import hashlib
+import os
+import secrets
+import signal
+import subprocess
+import sys
+import threading
+import time
+import urllib.request
+
+# 複数プロセスでの起動
+# ----------------------------------------------------------------------
+# 1つのStreamlitプロセスでは、bcrypt・pandas・WeasyPrintの処理がGILで直列になるため、
+# 同じ app.py を複数のStreamlitプロセス (ワーカー) で起動し、その前に置いたプロキシで振り分けます。
+#
+#   ブラウザ -> プロキシ (--port, 既定 8501) -> Streamlitワーカー (--base-port から連番)
+#                                              -> ジョブワーカー (job_worker.py: PDF生成・通知)
+#
+# Streamlitのセッション (WebSocket・アップロードしたファイル・画像など) はプロセスごとにメモリで管理されるため、
+# プロキシはブラウザごとの振り分け用Cookie (ROUTE_COOKIE) で振り分け先を固定します (スティッキーセッション)。
+# 接続元のIPアドレスでは、外部のリバースプロキシやトンネルの後ろに置いた場合に全員が同じワーカーになるためです。
+# プロキシはリクエストのヘッダーだけを読み、その後はTCPの中継だけを行うため、WebSocketの接続もそのまま中継されます。
+# 外部のプロキシが接続を使い回しても別のブラウザのリクエストが混ざらないよう、WebSocket以外の
+# リクエストは1回ごとに接続を閉じさせます。DBはWALモードで全プロセスから共有します。
+# ----------------------------------------------------------------------
+
+APP_DIR = os.path.dirname(os.path.abspath(__file__))
+HEALTH_TIMEOUT_SECONDS = 60
+RESTART_CHECK_SECONDS = 5
+ROUTE_COOKIE = "incident_worker"    # 振り分け先を固定するCookieの名前 (値はブラウザごとのランダムな文字列)
+HEADER_TIMEOUT_SECONDS = 30         # リクエストのヘッダーを待つ時間
+MAX_HEADER_BYTES = 64 * 1024       # これより長いヘッダーはHTTPとして読まない
+
+
+def start_streamlit_worker(port: int, env: dict) -> subprocess.Popen:
+    """Streamlitワーカーを127.0.0.1の指定ポートで起動します (外部からはプロキシ経由でのみ接続します)"""
+    command = [
+        sys.executable, "-m", "streamlit", "run", "app.py",
+        "--server.port", str(port), "--server.address", "127.0.0.1", "--server.headless", "true",
+    ]
+    return subprocess.Popen(command, cwd=APP_DIR, env=env)
+
+
+def start_job_worker(env: dict) -> subprocess.Popen:
+    return subprocess.Popen([sys.executable, "job_worker.py"], cwd=APP_DIR, env=env)
+
+
+def wait_until_healthy(ports: list, timeout: float = HEALTH_TIMEOUT_SECONDS) -> list:
+    """各ワーカーのヘルスチェック (/_stcore/health) が応答するまで待ち、応答しなかったポートを返します"""
+    deadline = time.monotonic() + timeout
+    waiting = list(ports)
+    while waiting and time.monotonic() < deadline:
+        for port in list(waiting):
+            try:
+                with urllib.request.urlopen(f"http://127.0.0.1:{port}/_stcore/health", timeout=2) as response:
+                    if response.status == 200:
+                        waiting.remove(port)
+            except OSError:
+                pass
+        if waiting:
+            time.sleep(0.5)
+    return waiting
+
+
+# --- スティッキーセッションのTCPプロキシ ---
+
+class StickyProxy:
+    """ブラウザごとの振り分け用Cookieのハッシュで振り分け先のワーカーを固定するプロキシです"""
+
+    def __init__(self, backend_ports: list):
+        self.backend_ports = backend_ports
+
+    def candidates(self, route_key: str) -> list:
+        """振り分け先の候補を優先順に返します (固定先が停止している場合は次のワーカーに接続します)"""
+        start = int(hashlib.sha1(route_key.encode("utf-8")).hexdigest(), 16) % len(self.backend_ports)
+        return self.backend_ports[start:] + self.backend_ports[:start]
+
+    @staticmethod
+    def _route_cookie(lines: list):
+        for line in lines:
+            name, _, value = line.partition(b":")
+            if name.strip().lower() == b"cookie":
+                for item in value.split(b";"):
+                    key, _, cookie_value = item.strip().partition(b"=")
+                    if key == ROUTE_COOKIE.encode("ascii") and cookie_value:
+                        return cookie_value.decode("ascii", "replace")
+        return None
+
+    @staticmethod
+    def _close_after_response(lines: list) -> list:
+        """WebSocket以外のリクエストは、応答後にワーカーが接続を閉じるようにします"""
+        headers = {line.partition(b":")[0].strip().lower(): line.partition(b":")[2].strip().lower() for line in lines[1:]}
+        if b"upgrade" in headers and b"upgrade" in headers.get(b"connection", b""):
+            return lines
+        kept = [line for line in lines[1:] if line.partition(b":")[0].strip().lower() not in (b"connection", b"keep-alive")]
+        return [lines[0], *kept, b"Connection: close"]
+
+    async def _read_request_head(self, client_reader: asyncio.StreamReader):
+        """リクエストのヘッダーを (ヘッダーの行のリスト, 読んだバイト列) で返します (HTTPでない場合は行のリストが None)"""
+        try:
+            head = await asyncio.wait_for(client_reader.readuntil(b"\r\n\r\n"), HEADER_TIMEOUT_SECONDS)
+        except asyncio.IncompleteReadError as e:
+            return None, e.partial
+        except (asyncio.LimitOverrunError, asyncio.TimeoutError, ConnectionError):
+            return None, b""
+        return head[:-4].split(b"\r\n"), head
+
+    async def _pipe(self, reader: asyncio.StreamReader, writer: asyncio.StreamWriter, set_cookie: bytes = None):
+        try:
+            if set_cookie:
+                # 最初の応答のヘッダーに振り分け用のCookieを追加する
+                head = await reader.readuntil(b"\r\n\r\n")
+                writer.write(head[:-2] + set_cookie + b"\r\n\r\n")
+            while True:
+                data = await reader.read(65536)
+                if not data:
+                    break
+                writer.write(data)
+                await writer.drain()
+        except (ConnectionError, asyncio.CancelledError, asyncio.IncompleteReadError, asyncio.LimitOverrunError):
+            pass
+        finally:
+            writer.close()
+
+    async def handle(self, client_reader: asyncio.StreamReader, client_writer: asyncio.StreamWriter):
+        lines, head = await self._read_request_head(client_reader)
+        set_cookie = None
+        if lines is None:
+            # HTTPとして読めない接続は、接続元のIPアドレスで振り分ける
+            route_key = (client_writer.get_extra_info("peername") or ("unknown",))[0]
+        else:
+            route_key = self._route_cookie(lines[1:])
+            if route_key is None:
+                route_key = secrets.token_hex(8)
+                set_cookie = f"Set-Cookie: {ROUTE_COOKIE}={route_key}; Path=/; HttpOnly; SameSite=Lax".encode("ascii")
+            head = b"\r\n".join(self._close_after_response(lines)) + b"\r\n\r\n"
+        for port in self.candidates(route_key):
+            try:
+                backend_reader, backend_writer = await asyncio.open_connection("127.0.0.1", port)
+                break
+            except OSError:
+                continue
+        else:
+            client_writer.close()
+            return
+        backend_writer.write(head)
+        await asyncio.gather(
+            self._pipe(client_reader, backend_writer),
+            self._pipe(backend_reader, client_writer, set_cookie),
+        )
+
+    async def serve(self, host: str, port: int):
+        server = await asyncio.start_server(self.handle, host, port, limit=MAX_HEADER_BYTES)
+        async with server:
+            await server.serve_forever()
+
+
+def supervise(processes: dict, start_functions: dict):
+    """停止した子プロセスを再起動します (プロキシとは別のスレッドで実行します)"""
+    while True:
+        time.sleep(RESTART_CHECK_SECONDS)
+        for name, process in list(processes.items()):
+            if process.poll() is not None:
+                print(f"{name} が終了しました (終了コード {process.returncode})。再起動します。")
+                processes[name] = start_functions[name]()
+
+
+def _raise_keyboard_interrupt(signum, frame):
+    raise KeyboardInterrupt
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="インシデント報告システムを複数のStreamlitワーカーで起動します。")
+    parser.add_argument("--workers", type=int, default=max(2, min(4, os.cpu_count() or 2)), help="Streamlitワーカーの数")
+    parser.add_argument("--host", default="0.0.0.0", help="プロキシが待ち受けるアドレス")
+    parser.add_argument("--port", type=int, default=8501, help="プロキシが待ち受けるポート (ブラウザから接続するポート)")
+    parser.add_argument("--base-port", type=int, default=8601, help="Streamlitワーカーのポートの開始番号")
+    parser.add_argument("--no-job-worker", action="store_true", help="ジョブワーカーを起動しない (別のPCで job_worker.py を動かす場合など)")
+    args = parser.parse_args(argv)
+
+    # スキーマの確認とWALへの切り替えは、ワーカーを起動する前にここで1回だけ行う
+    from db_utils import init_db
+    init_db()
+
+    env = dict(os.environ)
+    env["JOB_RUNNER"] = "queue" # PDF生成と通知はジョブワーカーに任せる
+    if not env.get("SESSION_SECRET", "").strip():
+        # 未設定の場合、各ワーカーはDBと同じ場所に保存した鍵のファイルを共有する (auth.SESSION_SECRET_FILE)
+        print("SESSION_SECRETが設定されていないため、DBと同じ場所に保存した署名鍵を全てのワーカーで使います。")
+
+    ports = [args.base_port + i for i in range(args.workers)]
+    start_functions = {f"Streamlitワーカー (ポート {port})": (lambda port=port: start_streamlit_worker(port, env)) for port in ports}
+    if not args.no_job_worker:
+        start_functions["ジョブワーカー"] = lambda: start_job_worker(env)
+    processes = {name: start() for name, start in start_functions.items()}
+
+    unhealthy = wait_until_healthy(ports)
+    if unhealthy:
+        print(f"警告: 次のポートのワーカーが応答しません: {', '.join(map(str, unhealthy))}")
+    print(f"{args.workers}個のワーカーを起動しました。http://{args.host}:{args.port} で接続できます。")
+
+    threading.Thread(target=supervise, args=(processes, start_functions), name="supervisor", daemon=True).start()
+    # サービスとして停止された場合 (SIGTERM) も、Ctrl+Cと同じく子プロセスを終了させる
+    signal.signal(signal.SIGTERM, _raise_keyboard_interrupt)
+    try:
+        asyncio.run(StickyProxy(ports).serve(args.host, args.port))
+    except KeyboardInterrupt:
+        print("終了します。")
+    finally:
+        for process in processes.values():
+            process.terminate()
+        for process in processes.values():
+            try:
+                process.wait(timeout=10)
+            except subprocess.TimeoutExpired:
+                process.kill()
+
+
+if __name__ == "__main__":
+    main()
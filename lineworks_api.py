@@ -0,0 +1,332 @@
+"""
+LINE WORKS API (Bot) の共通処理です。lineworks_bot.py (個人宛て) と lineworks_bot_room.py (チャンネル宛て) から使います。
+
+- API呼び出しは httpx の非同期クライアント1つで行い、接続を使い回します。
+  すべての呼び出しにタイムアウトがあり、応答の無い接続で画面 (Streamlitのスレッド) が止まり続けることはありません。
+- 非同期の処理は専用のスレッドのイベントループで実行します。同期の関数 (get_access_token, send_bot_message など) は
+  そのイベントループで実行して結果を待つだけなので、これまでどおりどのスレッドからも呼び出せます。
+- 複数ファイルのアップロード (send_file_messages) は同時に行います。
+  (複数の送信先への送信は db_utils.notify が送信先ごとのキューとスレッドで行います)
+- アクセストークンは有効期限まで使い回します。
+- 添付ファイルはファイルの内容のハッシュ (SHA-256) ごとに fileId を覚えておき、
+  同じファイルを再送するとき (再送信・週報・複数の送信先) はアップロードを省略します。
+- アップロードはファイル全体をメモリに読み込まず、少しずつ読みながら送信します。
+"""
+import os
+import json
+import time
+import uuid
+import asyncio
+import hashlib
+import threading
+import urllib.parse
+from collections import OrderedDict
+from datetime import datetime
+
+import httpx
+import jwt
+from dotenv import load_dotenv
+
+# .envファイルを読み込む
+load_dotenv()
+
+BASE_API_URL = "https://www.worksapis.com/v1.0"
+BASE_AUTH_URL = "https://auth.worksmobile.com/oauth2/v2.0"
+
+# タイムアウト (秒)。API呼び出し1回ごとの上限で、ファイルのアップロードだけは長めにする
+API_TIMEOUT_SECONDS = float(os.environ.get("LW_API_TIMEOUT_SECONDS", "10"))
+UPLOAD_TIMEOUT_SECONDS = float(os.environ.get("LW_UPLOAD_TIMEOUT_SECONDS", "60"))
+CONNECT_TIMEOUT_SECONDS = 5
+CALL_TIMEOUT_SECONDS = 180      # 同期の関数が結果を待つ時間の上限 (トークン取得・アップロード・送信の合計)
+MAX_CONNECTIONS = 10            # 同時に使う接続の数の上限
+
+# アップロードしたファイルの fileId を再利用する期間 (秒)。
+# LINE WORKSはアップロードされた添付ファイルを一定時間後に破棄するため、それより短くしてください
+FILE_ID_TTL_SECONDS = int(os.environ.get("LW_FILE_ID_TTL_SECONDS", str(6 * 3600)))
+FILE_ID_CACHE_SIZE = 128        # 覚えておく fileId の数の上限
+UPLOAD_CHUNK_SIZE = 64 * 1024   # ハッシュ計算・アップロードで一度に読む大きさ (バイト)
+TOKEN_REFRESH_MARGIN_SECONDS = 300  # アクセストークンの有効期限のこの秒数前に取り直す
+
+_token_cache = {}               # (client_id, scope) -> (access_token, 有効期限の time.monotonic())
+_file_id_cache = OrderedDict()  # (bot_id, ファイル名, SHA-256) -> (fileId, アップロードした time.monotonic())
+_cache_lock = threading.Lock()
+_metrics = {
+    "uploads": 0,               # 実際にアップロードした回数
+    "reused": 0,                # 覚えておいた fileId を再利用した回数
+    "uploaded_bytes": 0,
+    "upload_seconds": 0.0,      # アップロード (URL取得 + 送信) にかかった時間の合計
+    "hash_seconds": 0.0,        # ハッシュ計算にかかった時間の合計
+    "last_upload_seconds": None,
+}
+
+_loop = None                    # API呼び出し用のイベントループ (専用のスレッドで動かす)
+_client = None                  # イベントループ内で使う httpx.AsyncClient
+_loop_lock = threading.Lock()
+
+
+# --- イベントループとHTTPクライアント ---
+
+def _get_loop() -> asyncio.AbstractEventLoop:
+    """API呼び出し用のイベントループを返します (最初の呼び出しでスレッドを開始します)"""
+    global _loop
+    with _loop_lock:
+        if _loop is None:
+            loop = asyncio.new_event_loop()
+            threading.Thread(target=loop.run_forever, name="lineworks-api", daemon=True).start()
+            _loop = loop
+    return _loop
+
+
+def _get_client() -> httpx.AsyncClient:
+    """接続を使い回すHTTPクライアントを返します (イベントループのスレッドからだけ呼び出す)"""
+    global _client
+    if _client is None:
+        _client = httpx.AsyncClient(
+            timeout=httpx.Timeout(API_TIMEOUT_SECONDS, connect=CONNECT_TIMEOUT_SECONDS),
+            limits=httpx.Limits(max_connections=MAX_CONNECTIONS),
+        )
+    return _client
+
+
+def run(coroutine, timeout: float = CALL_TIMEOUT_SECONDS):
+    """
+    コルーチンをAPI呼び出し用のイベントループで実行し、結果を返します (同期の関数から呼び出すための入口)。
+    timeout 秒を過ぎた場合は処理を取り消し、TimeoutError を送出します。
+    """
+    future = asyncio.run_coroutine_threadsafe(coroutine, _get_loop())
+    try:
+        return future.result(timeout)
+    except TimeoutError:
+        future.cancel()
+        raise TimeoutError(f"LINE WORKS APIの呼び出しが{timeout}秒以内に終わりませんでした。")
+
+
+# --- 認証 ---
+
+def load_credentials(bot_id: str = None) -> dict:
+    """環境変数からBotの認証情報を読み込みます。bot_id を指定しない場合は LW_API_20_BOT_ID を使います"""
+    credentials = {
+        "client_id": os.environ.get("LW_API_20_CLIENT_ID"),
+        "client_secret": os.environ.get("LW_API_20_CLIENT_SECRET"),
+        "service_account_id": os.environ.get("LW_API_20_SERVICE_ACCOUNT_ID"),
+        "privatekey": os.environ.get("LW_API_20_PRIVATEKEY"),
+        "bot_id": bot_id if bot_id else os.environ.get("LW_API_20_BOT_ID"),
+    }
+    if not all(credentials.values()):
+        raise ValueError("必要な環境変数が設定されていないか、Bot IDが指定されていません。")
+    # .env に1行で書かれた秘密鍵の "\n" を改行に戻す
+    credentials["privatekey"] = credentials["privatekey"].replace('\\n', '\n')
+    return credentials
+
+
+def _get_jwt(client_id, service_account_id, privatekey):
+    current_time = datetime.now().timestamp()
+    jws = jwt.encode({
+        "iss": client_id, "sub": service_account_id,
+        "iat": current_time, "exp": current_time + 3600
+    }, privatekey, algorithm="RS256")
+    return jws
+
+
+async def _request_access_token(client_id, client_secret, scope, jws) -> dict:
+    url = f'{BASE_AUTH_URL}/token'
+    headers = {'Content-Type': 'application/x-www-form-urlencoded'}
+    params = {
+        "assertion": jws,
+        "grant_type": urllib.parse.quote("urn:ietf:params:oauth:grant-type:jwt-bearer"),
+        "client_id": client_id,
+        "client_secret": client_secret,
+        "scope": scope,
+    }
+    r = await _get_client().post(url, data=params, headers=headers)
+    r.raise_for_status()
+    return r.json()
+
+
+async def get_access_token_async(credentials: dict, scope: str = "bot") -> str:
+    """アクセストークンを返します。有効期限内のトークンがあればAPIを呼ばずにそれを返します"""
+    key = (credentials["client_id"], scope)
+    with _cache_lock:
+        cached = _token_cache.get(key)
+    if cached and cached[1] > time.monotonic():
+        return cached[0]
+
+    jws = _get_jwt(credentials["client_id"], credentials["service_account_id"], credentials["privatekey"])
+    data = await _request_access_token(credentials["client_id"], credentials["client_secret"], scope, jws)
+    access_token = data.get("access_token")
+    if not access_token:
+        raise ValueError("アクセストークンの取得に失敗しました。")
+    expires_in = int(data.get("expires_in") or 0)
+    if expires_in > TOKEN_REFRESH_MARGIN_SECONDS:
+        with _cache_lock:
+            _token_cache[key] = (access_token, time.monotonic() + expires_in - TOKEN_REFRESH_MARGIN_SECONDS)
+    return access_token
+
+
+def get_access_token(credentials: dict, scope: str = "bot") -> str:
+    return run(get_access_token_async(credentials, scope))
+
+
+# --- 添付ファイルのアップロード ---
+
+def file_digest(file_path: str) -> str:
+    """ファイルの内容のSHA-256 (16進数) を、少しずつ読みながら計算します"""
+    digest = hashlib.sha256()
+    with open(file_path, "rb") as f:
+        for chunk in iter(lambda: f.read(UPLOAD_CHUNK_SIZE), b""):
+            digest.update(chunk)
+    return digest.hexdigest()
+
+
+def _multipart_body(file_path: str, field_name: str = "FileData", content_type: str = "application/pdf"):
+    """
+    multipart/form-data の本文を、ファイルを少しずつ読みながら返す非同期イテレータとして作成します。
+    (Content-Type, Content-Length, 本文) を返します。長さが分かっているため Content-Length 付きで送信されます。
+    """
+    boundary = uuid.uuid4().hex
+    file_name = os.path.basename(file_path).replace('"', '%22')
+    head = (
+        f'--{boundary}\r\n'
+        f'Content-Disposition: form-data; name="{field_name}"; filename="{file_name}"\r\n'
+        f'Content-Type: {content_type}\r\n\r\n'
+    ).encode("utf-8")
+    tail = f'\r\n--{boundary}--\r\n'.encode("utf-8")
+    length = len(head) + os.path.getsize(file_path) + len(tail)
+
+    async def body():
+        yield head
+        with open(file_path, "rb") as f:
+            for chunk in iter(lambda: f.read(UPLOAD_CHUNK_SIZE), b""):
+                yield chunk
+        yield tail
+
+    return f"multipart/form-data; boundary={boundary}", length, body()
+
+
+async def _get_upload_url_and_file_id(file_name, bot_id, access_token):
+    url = f"{BASE_API_URL}/bots/{bot_id}/attachments"
+    headers = {"Authorization": f"Bearer {access_token}", "Content-Type": "application/json"}
+    response = await _get_client().post(url, headers=headers, json={"fileName": file_name})
+    response.raise_for_status()
+    data = response.json()
+    return data["uploadUrl"], data["fileId"]
+
+
+async def _upload_file_multipart(upload_url, file_path, access_token):
+    content_type, length, body = _multipart_body(file_path)
+    headers = {"Authorization": f"Bearer {access_token}", "Content-Type": content_type, "Content-Length": str(length)}
+    response = await _get_client().post(
+        upload_url, headers=headers, content=body,
+        timeout=httpx.Timeout(UPLOAD_TIMEOUT_SECONDS, connect=CONNECT_TIMEOUT_SECONDS)
+    )
+    response.raise_for_status()
+
+
+def _remember_file_id(key: tuple, file_id: str):
+    with _cache_lock:
+        _file_id_cache[key] = (file_id, time.monotonic())
+        _file_id_cache.move_to_end(key)
+        while len(_file_id_cache) > FILE_ID_CACHE_SIZE:
+            _file_id_cache.popitem(last=False)
+
+
+def _forget_file_id(key: tuple):
+    with _cache_lock:
+        _file_id_cache.pop(key, None)
+
+
+async def _attachment_key(file_path: str, bot_id: str) -> tuple:
+    started = time.perf_counter()
+    digest = await asyncio.to_thread(file_digest, file_path) # 大きなファイルでもイベントループを止めない
+    with _cache_lock:
+        _metrics["hash_seconds"] += time.perf_counter() - started
+    return bot_id, os.path.basename(file_path), digest
+
+
+async def upload_attachment(file_path: str, bot_id: str, access_token: str) -> tuple:
+    """
+    ファイルをアップロードし、(fileId, 再利用したか) を返します。
+    同じBot・同じファイル名・同じ内容のファイルを FILE_ID_TTL_SECONDS 以内にアップロード済みの場合は、
+    アップロードせずにその fileId を返します。
+    """
+    key = await _attachment_key(file_path, bot_id)
+    with _cache_lock:
+        cached = _file_id_cache.get(key)
+        if cached and time.monotonic() - cached[1] < FILE_ID_TTL_SECONDS:
+            _file_id_cache.move_to_end(key)
+            _metrics["reused"] += 1
+            return cached[0], True
+
+    started = time.perf_counter()
+    upload_url, file_id = await _get_upload_url_and_file_id(key[1], bot_id, access_token)
+    await _upload_file_multipart(upload_url, file_path, access_token)
+    elapsed = time.perf_counter() - started
+    with _cache_lock:
+        _metrics["uploads"] += 1
+        _metrics["uploaded_bytes"] += os.path.getsize(file_path)
+        _metrics["upload_seconds"] += elapsed
+        _metrics["last_upload_seconds"] = elapsed
+    print(f"DEBUG: lineworks_api: {key[1]} をアップロードしました ({elapsed:.2f}秒)。")
+    _remember_file_id(key, file_id)
+    return file_id, False
+
+
+def get_upload_metrics() -> dict:
+    """このプロセスでのアップロードの回数・再利用の回数・かかった時間などを返します"""
+    with _cache_lock:
+        metrics = dict(_metrics)
+        metrics["cached_file_ids"] = len(_file_id_cache)
+    return metrics
+
+
+# --- メッセージの送信 ---
+
+async def send_bot_message_async(content: dict, bot_id: str, destination: str, access_token: str):
+    """
+    メッセージを送信します。destination は送信先のパスです
+    ("users/{ユーザーID}" または "channels/{チャンネルID}")。
+    """
+    url = f"{BASE_API_URL}/bots/{bot_id}/{destination}/messages"
+    headers = {'Content-Type': 'application/json', 'Authorization': f"Bearer {access_token}"}
+    r = await _get_client().post(url, content=json.dumps(content), headers=headers)
+    r.raise_for_status()
+
+
+async def _send_file_id(file_path: str, file_id: str, reused: bool, bot_id: str, destination: str, access_token: str):
+    """
+    ファイルメッセージを送信します。
+    再利用した fileId がLINE WORKS側で既に無効になっていた場合は、アップロードし直して一度だけ再送信します。
+    """
+    try:
+        await send_bot_message_async({"content": {"type": "file", "fileId": file_id}}, bot_id, destination, access_token)
+    except httpx.HTTPStatusError as e:
+        status = e.response.status_code
+        if not reused or status not in (400, 404, 410):
+            raise
+        print(f"DEBUG: lineworks_api: 再利用したfileIdが使用できないため、アップロードし直します (HTTP {status})。")
+        _forget_file_id(await _attachment_key(file_path, bot_id))
+        file_id, _ = await upload_attachment(file_path, bot_id, access_token)
+        await send_bot_message_async({"content": {"type": "file", "fileId": file_id}}, bot_id, destination, access_token)
+
+
+async def send_file_messages_async(file_paths: list, bot_id: str, destination: str, access_token: str):
+    """複数のファイルを同時にアップロードし、ファイルメッセージを file_paths の順に送信します"""
+    uploads = await asyncio.gather(*(upload_attachment(path, bot_id, access_token) for path in file_paths))
+    for path, (file_id, reused) in zip(file_paths, uploads):
+        print(f"   -> fileId: {file_id}{' (アップロード済みのファイルを再利用)' if reused else ''}")
+        await _send_file_id(path, file_id, reused, bot_id, destination, access_token)
+
+
+# --- 同期の関数 (lineworks_bot.py / lineworks_bot_room.py から呼び出す) ---
+
+def send_bot_message(content: dict, bot_id: str, destination: str, access_token: str):
+    run(send_bot_message_async(content, bot_id, destination, access_token))
+
+
+def send_file_message(file_path: str, bot_id: str, destination: str, access_token: str):
+    """ファイルをアップロード (またはアップロード済みの fileId を再利用) して、ファイルメッセージを送信します"""
+    run(send_file_messages_async([file_path], bot_id, destination, access_token))
+
+
+def send_file_messages(file_paths: list, bot_id: str, destination: str, access_token: str):
+    run(send_file_messages_async(list(file_paths), bot_id, destination, access_token))
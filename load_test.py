@@ -0,0 +1,314 @@
+import argparse
+import contextlib
+import datetime
+import io
+import logging
+import os
+import random
+import sys
+import multiprocessing
+import tempfile
+import time
+from concurrent.futures import ProcessPoolExecutor
+
+# 同時に利用する職員の数を増やしながら、実際の画面 (pages/*.py) を streamlit.testing.v1.AppTest で
+# ヘッドレスに実行し、処理件数・応答時間のパーセンタイル・エラー率を計測する負荷テストです。
+#
+# - 仮想ユーザーは1人ずつ別のプロセスで実行します (AppTestは1プロセスで1つしか同時に実行できないため)。
+#   CPUの数より多い同時利用者数では、OSのスケジューリングの待ち時間も応答時間に含まれます。
+# - DBは一時ディレクトリに合成データで作成するため、運用中のDBは変更しません。
+# - LINE WORKSへの送信はスタブに置き換え (--notify-latency 秒だけ待つ)、
+#   承認済みレポートのCSV/PDFは共有フォルダではなく一時ディレクトリに保存します。
+#
+# 例: python load_test.py --concurrency 1,2,4,8 --duration 30
+
+APP_DIR = os.path.dirname(os.path.abspath(__file__))
+APP_SCRIPT = os.path.join(APP_DIR, "app.py")
+PASSWORD = "loadtest-password"
+
+# シナリオ -> 重み (1回の操作でどのシナリオを選ぶかの比率)
+SCENARIO_WEIGHTS = {
+    "login": 1,        # ログイン (新しいセッション)
+    "new_report": 3,   # 新規報告の送信
+    "search": 4,       # 検索・一覧で条件を指定して検索
+    "dashboard": 2,    # グラフ分析の表示
+    "approve": 2,      # 承認管理で1件を承認 (管理者)
+}
+
+
+# --- 準備 ---
+
+def prepare_environment(work_dir: str, notify_latency: float):
+    """
+    db_utils などを読み込む前に呼び出し、通知先と保存先を負荷テスト用に設定します。
+    (load_dotenv は既に設定されている環境変数を上書きしないため、.envの設定より優先されます)
+    """
+    for name in ("LW_API_20_CHANNEL_ID", "LW_API_20_BOT_ID", "LW_API_20_APPROVAL_CHANNEL_ID", "LW_API_20_APPROVAL_BOT_ID"):
+        os.environ[name] = "loadtest"
+    os.environ["REPORT_CSV_DIR"] = os.path.join(work_dir, "csv")
+    os.environ["REPORT_PDF_DIR"] = os.path.join(work_dir, "pdf")
+    os.environ["REPORT_DIGEST_DIR"] = os.path.join(work_dir, "digest")
+    os.environ["DIGEST_SCHEDULE"] = "" # 週報・月報の自動作成は計測の対象外
+    os.environ["MAINTENANCE_HOUR"] = "" # 定期メンテナンス (VACUUM) も計測の対象外
+    os.environ["JOB_RUNNER"] = "thread"
+
+    import lineworks_bot
+    import lineworks_bot_room
+
+    def fake_send(*args, **kwargs):
+        time.sleep(notify_latency) # LINE WORKSのAPI呼び出しにかかる時間の代わり
+        return True
+
+    for module, names in (
+        (lineworks_bot_room, ("send_text_message_to_channel", "send_file_to_channel", "send_files_to_channel")),
+        (lineworks_bot, ("send_text_message_to_user", "send_line_works_file")),
+    ):
+        for name in names:
+            setattr(module, name, fake_send)
+
+
+def build_synthetic_db(db_path: str, report_count: int, user_count: int, seed: int = 0) -> list:
+    """合成データのDBを作成し、作成したユーザー名のリストを返します (先頭のユーザーは管理者)"""
+    import db_utils
+    from auth import hash_password
+    from report_schema import (
+        CONTENT_DETAILS, JOB_TYPE_OPTIONS, LEVEL_OPTIONS, LOCATION_OPTIONS, STATUS_APPROVED, STATUS_FIRST_APPROVED, STATUS_UNREAD,
+    )
+
+    db_utils.DB_NAME = db_path
+    db_utils.init_db()
+
+    rng = random.Random(seed)
+    usernames = [f"loadtest_{i:03d}" for i in range(user_count)]
+    password_hash = hash_password(PASSWORD) # 全員同じパスワードのため、ハッシュ化は1回だけ行う
+    with db_utils.get_db_connection() as conn:
+        conn.executemany(
+            "INSERT INTO users (username, password_hash, role) VALUES (?, ?, ?)",
+            [(name, password_hash, "admin" if i == 0 else "general") for i, name in enumerate(usernames)]
+        )
+        conn.commit()
+    db_utils.invalidate_user_cache()
+
+    now = datetime.datetime.now()
+    categories = list(CONTENT_DETAILS.keys())
+    records = []
+    for i in range(report_count):
+        occurred = now - datetime.timedelta(minutes=rng.randint(0, 3 * 365 * 24 * 60))
+        status = rng.choices([STATUS_APPROVED, STATUS_UNREAD, STATUS_FIRST_APPROVED], weights=[7, 2, 1])[0]
+        records.append({
+            "occurrence_datetime": occurred.replace(second=0, microsecond=0).isoformat(sep=" "),
+            "reporter_name": rng.choice(usernames),
+            "job_type": rng.choice(JOB_TYPE_OPTIONS),
+            "level": rng.choice(LEVEL_OPTIONS),
+            "location": rng.choice(LOCATION_OPTIONS),
+            "content_category": rng.choice(categories),
+            "situation": f"負荷テスト用の報告 {i}。転倒・誤薬などの状況説明。",
+            "countermeasure": "声かけと確認の徹底",
+            "status": status,
+            "approver1": usernames[0] if status == STATUS_FIRST_APPROVED else None,
+        })
+    db_utils.add_reports_many(records)
+    return usernames
+
+
+# --- シナリオ ---
+
+class ScenarioError(Exception):
+    """画面は実行できたが、期待した結果にならなかった場合"""
+
+
+def _check(at):
+    if at.exception:
+        raise ScenarioError(at.exception[0].value.splitlines()[0])
+    if at.error:
+        raise ScenarioError(str(at.error[0].value))
+
+
+def _button(at, label: str):
+    for button in at.button:
+        if button.label == label:
+            return button
+    raise ScenarioError(f"ボタン「{label}」が見つかりません")
+
+
+class VirtualUser:
+    """1人の職員のブラウザのセッションを表します"""
+
+    def __init__(self, username: str, is_admin: bool, rng: random.Random, timeout: float):
+        self.username = username
+        self.is_admin = is_admin
+        self.rng = rng
+        self.timeout = timeout
+        self.at = None
+
+    def _open(self, page: str):
+        if self.at is None:
+            self.login()
+        self.at.switch_page(page).run()
+        _check(self.at)
+        return self.at
+
+    def login(self):
+        from streamlit.testing.v1 import AppTest
+        at = AppTest.from_file(APP_SCRIPT, default_timeout=self.timeout)
+        at.switch_page("pages/0_Login.py").run()
+        at.text_input[0].input(self.username)
+        at.text_input[1].input(PASSWORD)
+        _button(at, "ログイン").click().run()
+        _check(at)
+        if not at.session_state["logged_in"]:
+            raise ScenarioError("ログインできませんでした")
+        self.at = at
+
+    def new_report(self):
+        at = self._open("pages/1_新規報告.py")
+        at.text_input(key="reporter_name").input(self.username)
+        at.text_area(key="situation").input(f"負荷テスト {self.rng.random():.6f}: 歩行中にふらつき")
+        at.text_area(key="countermeasure").input("見守りを強化する")
+        _button(at, "✅ この内容で報告する").click().run()
+        _check(at)
+
+    def search(self):
+        at = self._open("pages/3_データ一覧.py")
+        at.text_input[1].input(self.rng.choice(["転倒", "誤薬", "確認", ""]))
+        _button(at, "🔍 検索").click().run()
+        _check(at)
+
+    def dashboard(self):
+        self._open("pages/4_グラフ分析.py")
+
+    def approve(self):
+        if not self.is_admin:
+            return self.search() # 一般ユーザーは承認できないため、検索に置き換える
+        at = self._open("pages/5_承認管理.py")
+        candidates = [button for button in at.button if (button.key or "").startswith("approve_btn_")]
+        if not candidates:
+            return
+        self.rng.choice(candidates).click().run()
+        _check(at)
+        if not any(button.label == "承認する" for button in at.button):
+            return # 他の管理者が先に承認を終えていた場合など
+        _button(at, "承認する").click().run()
+        # 他の管理者と同じレポートを承認した場合の競合 (st.warning) は正常な結果として扱う
+        _check(at)
+
+
+# --- 計測 ---
+
+def _percentile(values: list, p: float) -> float:
+    if not values:
+        return 0.0
+    values = sorted(values)
+    return values[min(len(values) - 1, int(round(p / 100 * (len(values) - 1))))]
+
+
+def _init_process(work_dir: str, db_path: str, notify_latency: float, verbose: bool):
+    """仮想ユーザーのプロセスの初期化 (環境変数とスタブを設定し、合成データのDBを使うようにします)"""
+    if not verbose:
+        sys.stdout = io.StringIO() # アプリのDEBUG出力を捨てる (エラーは sys.__stderr__ に出す)
+        logging.getLogger("streamlit.deprecation_util").disabled = True # 画面ごとの非推奨の警告も表示しない
+    sys.path.insert(0, APP_DIR)
+    prepare_environment(work_dir, notify_latency)
+    import db_utils
+    db_utils.DB_NAME = db_path
+
+
+def _run_session(username: str, is_admin: bool, index: int, duration: float, timeout: float, seed: int, barrier) -> dict:
+    """1人分の操作を duration 秒間続け、シナリオごとの [(応答時間, 成功したか)] を返します"""
+    results = {name: [] for name in SCENARIO_WEIGHTS}
+    scenarios, weights = list(SCENARIO_WEIGHTS), list(SCENARIO_WEIGHTS.values())
+    rng = random.Random(seed * 1000 + index)
+    user = VirtualUser(username, is_admin, rng, timeout)
+    try:
+        user.login() # 画面の読み込みを済ませてから計測を始める (計測には含めない)
+    except Exception as e:
+        print(f"ERROR: login ({username}): {e}", file=sys.__stderr__)
+    barrier.wait() # 全員の準備ができてから一斉に開始する
+
+    deadline = time.monotonic() + duration
+    while time.monotonic() < deadline:
+        scenario = rng.choices(scenarios, weights=weights)[0]
+        started = time.perf_counter()
+        try:
+            getattr(user, scenario)()
+            ok = True
+        except Exception as e:
+            ok = False
+            user.at = None # 次の操作はログインからやり直す
+            print(f"ERROR: {scenario} ({username}): {e}", file=sys.__stderr__)
+        results[scenario].append((time.perf_counter() - started, ok))
+    return results
+
+
+def run_level(usernames: list, concurrency: int, duration: float, timeout: float, seed: int, initargs: tuple) -> dict:
+    """
+    concurrency 人が duration 秒間操作を続け、シナリオごとの [(応答時間, 成功したか)] を返します。
+    AppTest はStreamlitのランタイムをプロセス全体で1つだけ持つため、同じプロセスの複数スレッドからは
+    実行できません。そのため仮想ユーザーは1人ずつ別のプロセスで実行します (launch_workers.py の運用と同じく、
+    DBは全プロセスで共有します)。
+    """
+    results = {name: [] for name in SCENARIO_WEIGHTS}
+    context = multiprocessing.get_context("spawn") # Windowsと同じ起動方法にそろえる
+    with context.Manager() as manager:
+        barrier = manager.Barrier(concurrency)
+        with ProcessPoolExecutor(max_workers=concurrency, mp_context=context, initializer=_init_process, initargs=initargs) as executor:
+            futures = []
+            for index in range(concurrency):
+                # 最初のユーザーが管理者。承認のシナリオを実行できるよう、各レベルで1人は管理者にする
+                username = usernames[0] if index == 0 else usernames[1 + (index - 1) % (len(usernames) - 1)]
+                futures.append(executor.submit(
+                    _run_session, username, username == usernames[0], index, duration, timeout, seed, barrier
+                ))
+            for future in futures:
+                for scenario, samples in future.result().items():
+                    results[scenario].extend(samples)
+    return results
+
+
+def print_report(concurrency: int, duration: float, results: dict, out):
+    print(f"\n同時利用者 {concurrency}人 ({duration:.0f}秒)", file=out)
+    print(f"  {'シナリオ':<12}{'件数':>6}{'件/秒':>8}{'p50(ms)':>9}{'p95(ms)':>9}{'p99(ms)':>9}{'エラー率':>9}", file=out)
+    total = []
+    for scenario, samples in list(results.items()) + [("合計", None)]:
+        if samples is None:
+            samples = total
+        else:
+            total.extend(samples)
+        latencies = [latency * 1000 for latency, _ in samples]
+        errors = sum(1 for _, ok in samples if not ok)
+        error_rate = errors / len(samples) * 100 if samples else 0.0
+        print(
+            f"  {scenario:<12}{len(samples):>6}{len(samples) / duration:>8.2f}"
+            f"{_percentile(latencies, 50):>9.0f}{_percentile(latencies, 95):>9.0f}{_percentile(latencies, 99):>9.0f}{error_rate:>8.1f}%",
+            file=out,
+        )
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="同時に利用する職員の数を増やしながら、画面の処理件数と応答時間を計測します。")
+    parser.add_argument("--concurrency", default="1,2,4,8", help="同時利用者数 (カンマ区切りで順に計測)")
+    parser.add_argument("--duration", type=float, default=30.0, help="各同時利用者数での計測時間 (秒)")
+    parser.add_argument("--reports", type=int, default=5000, help="合成データの報告件数")
+    parser.add_argument("--users", type=int, default=20, help="合成データのユーザー数 (先頭の1人は管理者)")
+    parser.add_argument("--notify-latency", type=float, default=0.2, help="LINE WORKSへの送信のスタブが待つ秒数")
+    parser.add_argument("--timeout", type=float, default=60.0, help="1回の画面実行のタイムアウト (秒)")
+    parser.add_argument("--seed", type=int, default=0, help="乱数の種")
+    parser.add_argument("--verbose", action="store_true", help="アプリのDEBUG出力を表示する")
+    args = parser.parse_args(argv)
+
+    out = sys.stdout
+    with tempfile.TemporaryDirectory() as work_dir:
+        db_path = os.path.join(work_dir, "loadtest.db")
+        prepare_environment(work_dir, args.notify_latency)
+        sys.path.insert(0, APP_DIR)
+        with (contextlib.nullcontext() if args.verbose else contextlib.redirect_stdout(io.StringIO())):
+            usernames = build_synthetic_db(db_path, args.reports, max(2, args.users), args.seed)
+        print(f"合成データ: 報告 {args.reports}件 / ユーザー {len(usernames)}人 (CPU {os.cpu_count()}個)", file=out)
+
+        initargs = (work_dir, db_path, args.notify_latency, args.verbose)
+        for concurrency in [int(n) for n in args.concurrency.split(",")]:
+            results = run_level(usernames, concurrency, args.duration, args.timeout, args.seed, initargs)
+            print_report(concurrency, args.duration, results, out)
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,37 @@
+import argparse
+from db_utils import init_db
+from db_utils.maintenance import DELETED_DRAFT_RETENTION_DAYS, DELETED_REPORT_RETENTION_DAYS, get_maintenance_history, run_maintenance
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="削除済みのレポート・下書きを完全に削除し、古いレポートをアーカイブして、DBファイルを切り詰めます (VACUUM)。")
+    parser.add_argument("--force", action="store_true", help="今日実行済みの場合も実行する")
+    parser.add_argument("--retention-days", type=int, default=DELETED_REPORT_RETENTION_DAYS,
+                        help=f"削除してからこの日数を過ぎたレポートを完全に削除する (既定: {DELETED_REPORT_RETENTION_DAYS})")
+    parser.add_argument("--draft-retention-days", type=int, default=DELETED_DRAFT_RETENTION_DAYS,
+                        help=f"削除してからこの日数を過ぎた下書きを完全に削除する (既定: {DELETED_DRAFT_RETENTION_DAYS})")
+    parser.add_argument("--history", action="store_true", help="実行せず、最近のメンテナンスの記録を表示する")
+    args = parser.parse_args(argv)
+
+    init_db()
+    if args.history:
+        for run in get_maintenance_history():
+            print(
+                f"{run['started_at']} (UTC) {run['status']}: レポート{run['purged_reports'] or 0}件・下書き{run['purged_drafts'] or 0}件, "
+                f"アーカイブ{run['archived_reports'] or 0}件, "
+                f"ページ数 {run['pages_before']} → {run['pages_after']}, "
+                f"ファイル {run['file_bytes_before']} → {run['file_bytes_after']} bytes{' ' + run['error'] if run['error'] else ''}"
+            )
+        return
+
+    result = run_maintenance(args.force, args.retention_days, args.draft_retention_days)
+    if result is None:
+        print("今日のメンテナンスは実行済みです (もう一度実行する場合は --force を指定してください)。")
+    else:
+        print(
+            f"レポート{result['purged_reports']}件・下書き{result['purged_drafts']}件を完全に削除し、"
+            f"レポート{result['archived_reports']}件をアーカイブしました。"
+            f" ファイル {result['file_bytes_before']} → {result['file_bytes_after']} bytes"
+        )
+
+if __name__ == "__main__":
+    main()
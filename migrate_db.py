@@ -0,0 +1,24 @@
+import argparse
+from db_utils import DB_NAME, MIGRATIONS, SCHEMA_VERSION, get_db_connection, get_schema_version, migrate_db
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="データベースのスキーマを最新のバージョンにします。")
+    parser.add_argument("--status", action="store_true", help="適用済みのバージョンを表示するだけで、マイグレーションは行わない")
+    args = parser.parse_args(argv)
+
+    with get_db_connection() as conn:
+        current = get_schema_version(conn)
+    print(f"データベース '{DB_NAME}' のスキーマバージョン: {current} (最新: {SCHEMA_VERSION})")
+    if args.status:
+        for version, description, _ in MIGRATIONS:
+            print(f"  {'適用済み' if version <= current else '未適用'}  {version}: {description}")
+        return
+
+    applied = migrate_db()
+    if applied:
+        print(f"マイグレーション {', '.join(map(str, applied))} を適用しました。")
+    else:
+        print("スキーマは最新です。")
+
+if __name__ == "__main__":
+    main()
@@ -1,8 +1,16 @@
 import streamlit as st
-from db_utils import get_user_by_username, verify_password, add_user
+from db_utils import authenticate_user, add_user
+from auth import check_register_rate, resolve_client_address, AuthBusyError, start_session, restore_session
 
 st.set_page_config(page_title="ログイン", page_icon="🔑", layout="centered")
 
+# 接続元 (試行回数の制限に使用。X-Forwarded-For は TRUSTED_PROXIES のプロキシ経由の場合だけ使う)
+client_address = resolve_client_address(st.context.ip_address, st.context.headers.get("X-Forwarded-For"))
+
+# 有効なログイントークンがあれば (再接続・再読み込み時)、ログインし直さずに移動する
+if restore_session():
+    st.switch_page(st.session_state.pop('post_login_redirect_page', "app.py"))
+
 st.title("🔑 ログイン")
 st.markdown("--- ")
 
@@ -14,18 +22,16 @@ with st.form(key='login_form'):
     login_button = st.form_submit_button("ログイン", use_container_width=True)
 
     if login_button:
-        user = get_user_by_username(login_username)
-        if user and verify_password(login_password, user['password_hash']):
-            st.session_state.logged_in = True
-            st.session_state.username = user['username']
-            st.session_state.role = user['role']
+        user, login_error = authenticate_user(login_username, login_password, client_address)
+        if user:
+            start_session(user)
             st.success(f"ようこそ、{user['username']}さん！")
             
             # リダイレクト先のページを確認
             redirect_page = st.session_state.pop('post_login_redirect_page', "app.py")
             st.switch_page(redirect_page)
         else:
-            st.error("ユーザー名またはパスワードが間違っています。")
+            st.error(login_error)
 
 st.markdown("--- ")
 
@@ -44,8 +50,13 @@ with st.form(key='register_form'):
             st.error("パスワードが一致しません。")
         elif len(new_password) < 6:
             st.error("パスワードは6文字以上である必要があります。")
+        elif check_register_rate(client_address):
+            st.error("登録の試行回数が多すぎます。しばらくしてから再度お試しください。")
         else:
-            if add_user(new_username, new_password, 'general'): # 新規登録ユーザーは'general'ロール
-                st.success("ユーザー登録が完了しました。ログインしてください。")
-            else:
-                st.error("このユーザー名は既に存在します。別のユーザー名をお試しください。")
+            try:
+                if add_user(new_username, new_password, 'general'): # 新規登録ユーザーは'general'ロール
+                    st.success("ユーザー登録が完了しました。ログインしてください。")
+                else:
+                    st.error("このユーザー名は既に存在します。別のユーザー名をお試しください。")
+            except AuthBusyError:
+                st.error("現在混み合っています。しばらくしてから再度お試しください。")
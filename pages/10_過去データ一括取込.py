@@ -0,0 +1,96 @@
+import streamlit as st
+import io
+from db_utils import start_approval_batch_worker
+from report_import import (
+    import_reports, errors_to_dataframe, find_unknown_headers, template_dataframe, iter_source_rows, IMPORT_ENCODINGS, ImportInterruptedError
+)
+from report_schema import STATUS_APPROVED
+from auth import restore_session # ログイン状態の確認 (再接続時はトークンから復元)
+
+st.set_page_config(page_title="過去データ一括取込", page_icon="📥", layout="wide")
+
+# --- 認証チェック ---
+if not restore_session():
+    st.switch_page("pages/0_Login.py")
+
+# --- ロールベースのアクセス制御 ---
+if st.session_state.get("role") != "admin":
+    st.warning("このページにアクセスする権限がありません。管理者としてログインしてください。")
+    st.stop() # ページの実行を停止
+
+st.title("📥 過去データ一括取込")
+st.markdown("--- ")
+st.info(
+    "紙やExcelで管理していた過去の報告を、CSVまたはExcel (.xlsx) ファイルからまとめて取り込みます。"
+    "見出し行には「データ一覧」と同じ項目名 (発生日時・報告者・職種など) を使用してください。"
+    "取り込んだ報告のステータスは、ステータス列が無い場合「承認済み」になります。"
+)
+
+st.download_button(
+    label="取り込み用テンプレート (CSV) をダウンロード",
+    data=template_dataframe().to_csv(index=False).encode('utf-8-sig'),
+    file_name="過去データ取込テンプレート.csv",
+    mime="text/csv",
+)
+
+uploaded_file = st.file_uploader("取り込むファイル", type=["csv", "xlsx"])
+encoding_labels = {"utf-8-sig": "UTF-8", "cp932": "Shift_JIS (Excelで保存したCSV)"}
+encoding = st.selectbox("CSVの文字コード", IMPORT_ENCODINGS, format_func=lambda e: encoding_labels[e])
+dry_run = st.checkbox("検証のみ行う (データベースには保存しない)", value=True)
+generate_files = st.checkbox("取り込み後に承認済みレポートのCSV/PDFをバックグラウンドで生成する", value=False)
+
+if uploaded_file is not None:
+    # 見出し行だけを先に確認し、取り込まれない列があれば知らせる
+    # (pandasは読み込み後にファイルを閉じるため、読み込みのたびに新しいバッファを渡す)
+    try:
+        first_row = next(iter_source_rows(io.BytesIO(uploaded_file.getvalue()), uploaded_file.name, encoding=encoding), None)
+    except (UnicodeDecodeError, ValueError) as e:
+        st.error(f"ファイルを読み込めませんでした。文字コードを確認してください: {e}")
+        st.stop()
+    if first_row is None:
+        st.warning("ファイルにデータ行がありません。")
+        st.stop()
+    unknown_headers = find_unknown_headers(first_row[1].keys())
+    if unknown_headers:
+        st.warning(f"次の列は項目名と一致しないため取り込まれません: {', '.join(map(str, unknown_headers))}")
+
+    if st.button("検証を実行" if dry_run else "取り込みを実行", type="primary"):
+        progress_text = st.empty()
+        interrupted = None
+        with st.spinner("処理中..."):
+            try:
+                result = import_reports(
+                    io.BytesIO(uploaded_file.getvalue()), uploaded_file.name, status=STATUS_APPROVED, encoding=encoding, dry_run=dry_run,
+                    progress=lambda n: progress_text.text(f"{n}行を処理しました..."),
+                )
+            except ImportInterruptedError as e:
+                # 中止する前のチャンクは保存済みのため、その件数を知らせる
+                interrupted, result = e, e.result
+            except (UnicodeDecodeError, ValueError) as e:
+                st.error(f"ファイルを読み込めませんでした: {e}")
+                st.stop()
+        progress_text.empty()
+
+        if dry_run:
+            st.success(f"{result.total_rows}行を検証しました。取り込み可能: {result.total_rows - result.error_rows}行 / エラー: {result.error_rows}行")
+        elif interrupted:
+            st.error(
+                f"{interrupted}\n\n中止する前の {result.inserted}件 (報告ID {min(result.report_ids)}〜{max(result.report_ids)}) は"
+                "データベースに保存済みです。ファイルを直して取り込み直す場合は、保存済みの行を除いてください。"
+            )
+        else:
+            st.success(f"{result.total_rows}行中 {result.inserted}件の報告をデータベースに保存しました。")
+        if not dry_run and generate_files and result.approved_ids:
+            start_approval_batch_worker(result.approved_ids, notify=False)
+            st.info(f"{len(result.approved_ids)}件のCSV/PDFをバックグラウンドで生成しています。")
+
+        if result.errors:
+            st.error(f"{result.error_rows}行にエラーがあります。エラーのある行は取り込まれていません。")
+            errors_df = errors_to_dataframe(result.errors)
+            st.dataframe(errors_df, use_container_width=True, hide_index=True)
+            st.download_button(
+                label="エラー一覧をダウンロード",
+                data=errors_df.to_csv(index=False).encode('utf-8-sig'),
+                file_name="取込エラー一覧.csv",
+                mime="text/csv",
+            )
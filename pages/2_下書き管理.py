@@ -1,62 +1,73 @@
 import streamlit as st
 import pandas as pd
-import json
-from db_utils import get_all_drafts, delete_draft, generate_draft_pdf_bytes
+from db_utils import get_draft_summaries, load_draft, delete_draft, get_draft_pdf_bytes, DRAFT_TTL_DAYS
+from auth import restore_session # ログイン状態の確認 (再接続時はトークンから復元)
 
 # --- 認証チェック ---
-if "logged_in" not in st.session_state or not st.session_state.logged_in:
+if not restore_session():
     st.switch_page("pages/0_Login.py")
 
 st.set_page_config(page_title="下書き管理", page_icon="")
 st.title("📝 下書き管理")
 st.markdown("--- ")
 
-st.info("「新規報告」ページで入力途中の内容を「下書き保存」ボタンで保存できます。")
+st.info(f"「新規報告」ページで入力途中の内容を「下書き保存」ボタンで保存できます。{DRAFT_TTL_DAYS}日以上更新されていない下書きは自動で削除されます。")
 
 st.subheader("保存済み下書き一覧")
 
-# --- 下書き一覧の取得 ---
-df = get_all_drafts()
+# --- 下書き一覧の取得 (ログインユーザーの下書きについて一覧表示に必要な項目だけを取得し、中身は読み込まない) ---
+current_username = st.session_state.get("username")
+df = get_draft_summaries(current_username, include_unowned=st.session_state.get("role") == "admin")
 
 if df.empty:
     st.info("保存されている下書きはありません。")
 else:
     # --- 一覧をカード形式で表示 ---
     for _, row in df.iterrows():
+        draft_id = int(row['id'])
         with st.container():
-            # --- JSONデータを読み込んで報告者名を取得 ---
-            draft_data = json.loads(row['data_json'])
-            reporter_name = draft_data.get('reporter_name', '氏名未入力') # .get()で安全に取得
+            reporter_name = row['reporter_name']
 
             st.markdown(f"#### {row['title']}")
             col1, col2, col_pdf, col3 = st.columns([3, 2, 1, 1]) # col_pdfを追加
             with col1:
-                st.write(f"*保存日時: {pd.to_datetime(row['created_at']).strftime('%Y-%m-%d %H:%M')}*")
+                st.write(f"*最終更新: {pd.to_datetime(row['updated_at']).strftime('%Y-%m-%d %H:%M')}*")
                 # 報告者名を表示（空の場合は「氏名未入力」）
                 st.write(f"**代表報告者:** {reporter_name if reporter_name else '氏名未入力'}")
             with col2:
                 # 読み込みボタン
-                if st.button("この下書きを読み込む", key=f"load_{row['id']}", use_container_width=True):
-                    # session_stateに保存して新規報告ページに渡す
-                    st.session_state.loaded_draft = draft_data # 既に読み込み済みのデータを使用
-                    st.session_state.loaded_draft_id = row['id'] # ★ 下書きのIDも保存
-                    # 新規報告ページに切り替え
-                    st.switch_page("pages/1_新規報告.py")
-            with col_pdf: # 新しいカラムにPDF出力ボタンを追加
-                pdf_bytes = generate_draft_pdf_bytes(draft_data, row['title'], row['created_at'])
-                st.download_button(
-                    label="📄 印刷",
-                    data=pdf_bytes,
-                    file_name=f"{row['title']}.pdf",
-                    mime="application/pdf",
-                    key=f"pdf_{row['id']}",
-                    use_container_width=True
-                )
+                if st.button("この下書きを読み込む", key=f"load_{draft_id}", use_container_width=True):
+                    draft = load_draft(draft_id, current_username) # 押された下書きだけ中身を読み込む
+                    if draft:
+                        # session_stateに保存して新規報告ページに渡す
+                        st.session_state.loaded_draft = draft['data']
+                        st.session_state.loaded_draft_id = draft_id # ★ 下書きのIDも保存
+                        # 新規報告ページに切り替え
+                        st.switch_page("pages/1_新規報告.py")
+                    else:
+                        st.error("この下書きは既に削除されています。")
+            with col_pdf:
+                # PDFは印刷ボタンが押された下書きだけ生成する (生成済みの内容はキャッシュから返す)
+                if st.session_state.get("draft_pdf_id") == draft_id:
+                    with st.spinner("PDFを作成中..."):
+                        pdf_bytes = get_draft_pdf_bytes(draft_id, current_username)
+                    if pdf_bytes:
+                        st.download_button(
+                            label="⬇️ 保存",
+                            data=pdf_bytes,
+                            file_name=f"{row['title']}.pdf",
+                            mime="application/pdf",
+                            key=f"pdf_download_{draft_id}",
+                            use_container_width=True
+                        )
+                elif st.button("📄 印刷", key=f"pdf_{draft_id}", use_container_width=True):
+                    st.session_state.draft_pdf_id = draft_id
+                    st.rerun()
             with col3:
                 # 削除ボタン
-                if st.button("❌ 削除", key=f"delete_{row['id']}", use_container_width=True):
-                    delete_draft(row['id'])
+                if st.button("❌ 削除", key=f"delete_{draft_id}", use_container_width=True):
+                    delete_draft(draft_id, current_username)
                     st.success(f"「{row['title']}」を削除しました。")
                     # 削除後、ページを再読み込みして一覧を更新
                     st.rerun()
-            st.markdown("--- ")
\ No newline at end of file
+            st.markdown("--- ")
@@ -1,10 +1,13 @@
 import streamlit as st
 import pandas as pd
-from db_utils import get_all_reports, update_report_status
+from db_utils import get_all_reports
+from db_utils.archive import archive_cutoff
+from report_schema import ALL_CONTENT_DETAIL_OPTIONS, CONTENT_DETAILS, DETAIL_COLUMNS, FIELDS_BY_COLUMN, filter_options, label
 import datetime
+from auth import restore_session # ログイン状態の確認 (再接続時はトークンから復元)
 
 # --- 認証チェック ---
-if "logged_in" not in st.session_state or not st.session_state.logged_in:
+if not restore_session():
     st.switch_page("pages/0_Login.py")
 
 st.set_page_config(page_title="検索・一覧", page_icon="🔍")
@@ -12,56 +15,13 @@ st.set_page_config(page_title="検索・一覧", page_icon="🔍")
 st.title(" 報告データの検索・一覧")
 st.markdown("---")
 
-df = get_all_reports() # DBから全てのデータを読み込む
+df = get_all_reports(labeled=True) # DBから全てのデータを表示用の列名で読み込む
 
 if df.empty:
     st.info("まだ報告データがありません。「新規報告」ページから入力してください。")
 else:
     # (DBから読み込むと文字列になっていることがあるため)
-    df['occurrence_datetime'] = pd.to_datetime(df['occurrence_datetime'])
-    df.reset_index(inplace=True) # idを列に変換
-    # ▼▼▼ ここに列名変更の処理を追加 ▼▼▼
-    df.rename(columns={
-        'id': '報告ID',
-        'occurrence_datetime': '発生日時',
-        'reporter_name': '報告者',
-        'job_type': '職種',
-        'level': '影響度レベル',
-        'location': '発生場所',
-        'connection_with_accident': '事故との関連性',
-        'years_of_experience': '経験年数',
-        'years_since_joining': '入職年数',
-        'patient_ID': '患者ID',
-        'patient_name': '患者氏名',
-        'patient_gender': '性別',
-        'patient_age': '年齢',
-        'dementia_status': '認知症の有無',
-        'patient_status_change_accident': '患者状態変化',
-        'patient_status_change_patient_explanation': '患者への説明',
-        'patient_status_change_family_explanation': '家族への説明',
-        'content_category': '大分類',
-        'content_details': 'インシデント内容',
-        'content_details_shinsatsu': '診察詳細',
-        'content_details_shochi': '処置詳細',
-        'content_details_uketsuke': '受付詳細',
-        'content_details_houshasen': '放射線業務詳細',
-        'content_details_rehabili': 'リハビリ業務詳細',
-        'content_details_kanjataio': '患者対応詳細',
-        'content_details_buhin': '物品破損詳細',
-        'injury_details': '外傷詳細',
-        'injury_other_text': 'その他外傷',
-        'cause_details': '発生原因',
-        'manual_relation': 'マニュアル関連',
-        'situation': '状況詳細',
-        'countermeasure': '今後の対策',
-        'created_at': '報告日時',
-        'status': 'ステータス',
-        'approver1': '承認者1',
-        'approved_at1': '承認日時1',
-        'approver2': '承認者2',
-        'approved_at2': '承認日時2',
-        'manager_comments': '管理者コメント'
-    }, inplace=True)
+    df['発生日時'] = pd.to_datetime(df['発生日時'])
     
     st.header("データ検索")
 
@@ -73,6 +33,7 @@ else:
         with st.form(key='search_form'):
             # 1行目: 期間
             st.write("**発生期間**")
+            st.caption(f"{archive_cutoff():%Y年%m月%d日}より前に発生した承認済みの報告は、発生期間を指定して検索した場合に表示されます。")
             date_col1, date_col2 = st.columns(2)
             start_date = date_col1.date_input("開始日", value=st.session_state.search_criteria.get('start_date'), label_visibility="collapsed")
             end_date = date_col2.date_input("終了日", value=st.session_state.search_criteria.get('end_date'), label_visibility="collapsed")
@@ -83,26 +44,18 @@ else:
             with c1:
                 reporter_name = st.text_input("報告者氏名", value=st.session_state.search_criteria.get('reporter_name'))
             with c2:
-                locations = st.multiselect("発生場所", options=df['発生場所'].unique(), default=st.session_state.search_criteria.get('locations', []))
+                locations = st.multiselect("発生場所", options=filter_options('location', df['発生場所'].unique()), default=st.session_state.search_criteria.get('locations', []))
             with c3:
-                levels = st.multiselect("影響度レベル", options=sorted(df['影響度レベル'].unique()), default=st.session_state.search_criteria.get('levels', []))
+                levels = st.multiselect("影響度レベル", options=filter_options('level', df['影響度レベル'].unique()), default=st.session_state.search_criteria.get('levels', []))
 
             # 3行目:
             c4, c5, c6 = st.columns(3)
             with c4:
-                job_types = st.multiselect("職種", options=df['職種'].unique(), default=st.session_state.search_criteria.get('job_types', []))
+                job_types = st.multiselect("職種", options=filter_options('job_type', df['職種'].unique()), default=st.session_state.search_criteria.get('job_types', []))
             with c5:
-                content_categories = st.multiselect("大分類", options=df['大分類'].unique(), default=st.session_state.search_criteria.get('content_categories', []))
+                content_categories = st.multiselect("大分類", options=filter_options('content_category', df['内容分類'].unique()), default=st.session_state.search_criteria.get('content_categories', []))
             with c6:
-                all_content_details = [
-                    "患者間違い", "オーダー間違い", "予約間違い", "案内間違い", "紛失", "カルテ記載間違い", "伝達漏れ", "返却忘れ", "確認漏れ", "情報漏洩",
-                    "部位間違い", "ラベル間違い", "針刺し事故", "検体採り間違い", "不適切な前処置", "未処置帰宅", "薬液間違い", "会計間違い", "郵送関係", "機器登録間違い", "マーカー間違い", 
-                    "骨密度解析間違い", "MRI室金属持ち込み", "画像転送忘れ", "左右間違い", "伝達間違い", "MRI完全吸着", "技師コメント間違い", "装置故障", "評価ミス", 
-                    "計画書関連", "リハビリ処方による受傷", "リハビリ中の軽微な事故", "転倒", "転落", "滑落", "外傷なし", "擦過傷", "表皮剥離", "打撲", "骨折",
-                    "接遇に対する不満", "検査・治療に対する不満", "医療費に対する不満", "待ち時間に対する不満", "設備・環境に対する不満", "電話対応に対する不満", 
-                    "患者間のトラブル", "破損", "故障", "不具合", "操作ミス", "盗難", "在庫不足", "発注ミス", "不審者", "施錠忘れ", "災害"
-                ]
-                content_details = st.multiselect("インシデント内容", options=sorted(list(set(all_content_details))), default=st.session_state.search_criteria.get('content_details', []))
+                content_details = st.multiselect("インシデント内容", options=list(ALL_CONTENT_DETAIL_OPTIONS), default=st.session_state.search_criteria.get('content_details', []))
 
             st.markdown("--- ")
             # 最終行: 全文キーワード
@@ -132,7 +85,9 @@ else:
     if criteria.get('start_date') and criteria.get('end_date'):
         start_datetime = pd.to_datetime(criteria['start_date'])
         end_datetime = pd.to_datetime(criteria['end_date']) + pd.Timedelta(days=1)
-        filtered_df = filtered_df[(filtered_df['発生日時'] >= start_datetime) & (filtered_df['発生日時'] < end_datetime)]
+        # 期間で読み直す (期間がアーカイブ済みの年にかかる場合は、アーカイブのレポートも含まれる)
+        filtered_df = get_all_reports(labeled=True, since=start_datetime, until=end_datetime)
+        filtered_df['発生日時'] = pd.to_datetime(filtered_df['発生日時'])
     if criteria.get('reporter_name'):
         filtered_df = filtered_df[filtered_df['報告者'].str.contains(criteria['reporter_name'], na=False)]
     if criteria.get('locations'):
@@ -142,14 +97,11 @@ else:
     if criteria.get('job_types'):
         filtered_df = filtered_df[filtered_df['職種'].isin(criteria['job_types'])]
     if criteria.get('content_categories'):
-        filtered_df = filtered_df[filtered_df['大分類'].isin(criteria['content_categories'])]
+        filtered_df = filtered_df[filtered_df['内容分類'].isin(criteria['content_categories'])]
     if criteria.get('content_details'):
         search_terms = criteria['content_details']
         # 複数の詳細カラムを対象に、いずれかの検索語を含む行をフィルタリング
-        detail_columns = [
-            'インシデント内容', '診察詳細', '処置詳細', '受付詳細', '放射線業務詳細', 
-            'リハビリ業務詳細', '患者対応詳細', '物品破損詳細', '外傷詳細', 'その他外傷'
-        ]
+        detail_columns = [label(column) for column in DETAIL_COLUMNS]
         # DataFrameの各行に対して、指定された検索語のいずれかが詳細カラムに含まれているかを確認
         filtered_df = filtered_df[filtered_df.apply(
             lambda row: any(
@@ -287,25 +239,14 @@ else:
             st.markdown(detail_item_html("内容分類", report_details.get('内容分類', '-')), unsafe_allow_html=True)
             st.markdown(detail_block_html("インシデント内容", report_details.get('インシデント内容', '-')), unsafe_allow_html=True)
             
-            # 新しい詳細項目を表示
-            if report_details.get('内容分類') == "診察":
-                st.markdown(detail_block_html("診察詳細", report_details.get('診察詳細', '-')), unsafe_allow_html=True)
-            elif report_details.get('内容分類') == "処置":
-                st.markdown(detail_block_html("処置詳細", report_details.get('処置詳細', '-')), unsafe_allow_html=True)
-            elif report_details.get('内容分類') == "受付":
-                st.markdown(detail_block_html("受付詳細", report_details.get('受付詳細', '-')), unsafe_allow_html=True)
-            elif report_details.get('内容分類') == "放射線業務":
-                st.markdown(detail_block_html("放射線業務詳細", report_details.get('放射線業務詳細', '-')), unsafe_allow_html=True)
-            elif report_details.get('内容分類') == "リハビリ業務":
-                st.markdown(detail_block_html("リハビリ業務詳細", report_details.get('リハビリ業務詳細', '-')), unsafe_allow_html=True)
-            elif report_details.get('内容分類') == "転倒・転落":
-                st.markdown(detail_block_html("転倒・転落詳細", report_details.get('転倒・転落詳細', '-')), unsafe_allow_html=True)
-                st.markdown(detail_block_html("外傷詳細", report_details.get('外傷詳細', '-')), unsafe_allow_html=True)
-                st.markdown(detail_block_html("その他外傷", report_details.get('その他外傷', '-')), unsafe_allow_html=True)
-            elif report_details.get('内容分類') == "患者対応":
-                st.markdown(detail_block_html("患者対応詳細", report_details.get('患者対応詳細', '-')), unsafe_allow_html=True)
-            elif report_details.get('内容分類') == "物品破損":
-                st.markdown(detail_block_html("物品破損詳細", report_details.get('物品破損詳細', '-')), unsafe_allow_html=True)
+            # 大分類に対応する詳細項目を表示
+            category = report_details.get('内容分類')
+            detail_column = CONTENT_DETAILS.get(category, (None,))[0]
+            if detail_column in FIELDS_BY_COLUMN:
+                st.markdown(detail_block_html(label(detail_column), report_details.get(label(detail_column), '-')), unsafe_allow_html=True)
+            if category == "転倒・転落":
+                st.markdown(detail_block_html(label('injury_details'), report_details.get(label('injury_details'), '-')), unsafe_allow_html=True)
+                st.markdown(detail_block_html(label('injury_other_text'), report_details.get(label('injury_other_text'), '-')), unsafe_allow_html=True)
             st.markdown(detail_block_html("状況詳細", report_details.get('状況詳細', '-')), unsafe_allow_html=True)
             st.markdown(detail_block_html("今後の対策", report_details.get('今後の対策', '-')), unsafe_allow_html=True)
 
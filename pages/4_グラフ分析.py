@@ -1,57 +1,42 @@
 import streamlit as st
 import pandas as pd
 import plotly.express as px
-from db_utils import get_all_reports
+from db_utils import get_detail_cube, get_report_cube, get_report_trend
+from db_utils.analytics import BUCKETS
+from db_utils.snapshot import get_snapshot_info
+from report_schema import JOB_TYPE_OPTIONS, LEVEL_OPTIONS, LOCATION_OPTIONS
+from charts import CHART_RENDER_MODE, CHART_TEMPLATE, downsample_indexes, freeze, show_chart, static_mode_available
+from auth import restore_session # ログイン状態の確認 (再接続時はトークンから復元)
 
 # --- 認証チェック ---
-if "logged_in" not in st.session_state or not st.session_state.logged_in:
+if not restore_session():
     st.switch_page("pages/0_Login.py")
 
 st.set_page_config(page_title="グラフ・分析", page_icon="📊", layout="wide")
 
 st.title("📊 グラフ・分析ダッシュボード")
+# 画像表示: グラフをサーバーで画像にして表示する (グラフの操作はできないが、動作の遅いPCでも表示が軽い)
+static_charts = st.toggle("グラフを画像で表示する (動作の遅いPC向け)", value=CHART_RENDER_MODE == "static", key="static_charts")
+if static_charts and not static_mode_available():
+    st.caption("このサーバーではグラフを画像に変換できないため (kaleido が必要です)、通常の表示にしています。")
 st.markdown("---")
 
-df = get_all_reports()
+# 件数はキューブ (影響度レベル × 発生場所 × 内容分類 × 職種 × 年月 ごとの件数の配列) から集計する。
+# キューブはデータが更新されたときだけ作り直されるため、画面の操作のたびに全件を読み込むことはない
+# (集計は読み取り専用のスナップショットから読むため、新しい報告が反映されるまで数分かかることがある)
+cube = get_report_cube()
+snapshot_age = get_snapshot_info()["age_seconds"]
+if snapshot_age is not None:
+    st.caption(f"集計は{'1分以内' if snapshot_age < 60 else f'約{round(snapshot_age / 60)}分前'}の時点のデータです。")
 
-if df.empty:
+def _sorted_counts(pairs) -> pd.Series:
+    """[(値, 件数)] を件数の降順の Series にします"""
+    return pd.Series(dict(pairs), dtype="int64").sort_values(ascending=False)
+
+if cube.total() == 0:
     st.info("分析対象のデータがありません。「新規報告」ページから入力してください。")
 else:
-    # ▼▼▼ ここに列名変更の処理を追加 ▼▼▼
-    df.rename(columns={
-        'id': '報告ID',
-        'occurrence_datetime': '発生日時',
-        'years_of_experience': '経験年数',
-        'years_since_joining': '入職年数',
-        'reporter_name': '報告者',
-        'job_type': '職種',
-        'level': '影響度レベル',
-        'location': '発生場所',
-        'connection_with_accident': '事故との関連性',
-        'content_category': '内容分類',
-        'content_details': 'インシデント内容',
-        'cause_details': '発生原因',
-        'manual_relation': 'マニュアル関連',
-        'situation': '状況詳細',
-        'countermeasure': '今後の対策',
-        'created_at': '報告日時',
-        'status': 'ステータス',
-        'approver1': '承認者1',
-        'approved_at1': '承認日時1',
-        'approver2': '承認者2',
-        'approved_at2': '承認日時2',
-        'manager_comments': '管理者コメント'
-    }, inplace=True)
-    
-    level_order = ["0", "1", "2", "3a", "3b", "4", "5", "その他"]
-    
-    # '影響度レベル' 列を、定義した順序を持つ「カテゴリ型」に変換する
-    try:
-        df['影響度レベル'] = pd.Categorical(df['影響度レベル'], categories=level_order, ordered=True)
-    except Exception as e:
-        st.error(f"データ型の変換中にエラーが発生しました: {e}")
-        st.info("データに予期せぬ値が含まれている可能性があります。")
-        
+
     st.header("インシデント傾向分析")
 
     # --- 1行目: 影響度レベル円グラフと内容分類棒グラフ ---
@@ -60,32 +45,38 @@ else:
     with col1:
         st.subheader("影響度レベルの割合")
         # 影響度レベルのカウントを降順でソート
-        level_counts = df['影響度レベル'].value_counts().sort_values(ascending=False)
-        fig_pie_level = px.pie(
-            level_counts, 
-            values=level_counts.values, 
-            names=level_counts.index, 
-            title='影響度レベル別インシデント件数',
-            hole=0.3, # ドーナツグラフにする
-            color_discrete_sequence=px.colors.sequential.RdBu # 色のシーケンス
-        )
-        fig_pie_level.update_traces(textposition='inside', textinfo='percent+label', sort=False)
-        st.plotly_chart(fig_pie_level, use_container_width=True)
+        def _level_pie():
+            level_counts = _sorted_counts(cube.series("level"))
+            fig_pie_level = px.pie(
+                level_counts, 
+                values=level_counts.values, 
+                names=level_counts.index, 
+                title='影響度レベル別インシデント件数',
+                hole=0.3, # ドーナツグラフにする
+                color_discrete_sequence=px.colors.sequential.RdBu, # 色のシーケンス
+                template=CHART_TEMPLATE
+            )
+            fig_pie_level.update_traces(textposition='inside', textinfo='percent+label', sort=False)
+            return fig_pie_level
+        show_chart(("level_pie", cube.generation), _level_pie, static_charts)
 
     with col2:
         st.subheader("内容分類別インシデント件数")
         # 内容分類のカウントを降順でソート
-        content_category_counts = df['内容分類'].value_counts().sort_values(ascending=False)
-        fig_bar_category = px.bar(
-            content_category_counts, 
-            x=content_category_counts.index, 
-            y=content_category_counts.values, 
-            title='内容分類別',
-            labels={'x':'内容分類', 'y':'件数'},
-            color_discrete_sequence=px.colors.qualitative.Pastel # 色のシーケンス
-        )
-        fig_bar_category.update_layout(xaxis_tickangle=-45) # X軸ラベルを斜めにする
-        st.plotly_chart(fig_bar_category, use_container_width=True)
+        def _category_bar():
+            content_category_counts = _sorted_counts(cube.series("content_category"))
+            fig_bar_category = px.bar(
+                content_category_counts, 
+                x=content_category_counts.index, 
+                y=content_category_counts.values, 
+                title='内容分類別',
+                labels={'x':'内容分類', 'y':'件数'},
+                color_discrete_sequence=px.colors.qualitative.Pastel, # 色のシーケンス
+                template=CHART_TEMPLATE
+            )
+            fig_bar_category.update_layout(xaxis_tickangle=-45) # X軸ラベルを斜めにする
+            return fig_bar_category
+        show_chart(("category_bar", cube.generation), _category_bar, static_charts)
 
     st.markdown("--- ")
 
@@ -95,69 +86,181 @@ else:
     with col3:
         st.subheader("発生場所別インシデント件数")
         # 発生場所のカウントを降順でソート
-        location_counts = df['発生場所'].value_counts().sort_values(ascending=False)
-        fig_bar_location = px.bar(
-            location_counts, 
-            x=location_counts.index, 
-            y=location_counts.values, 
-            title='発生場所別',
-            labels={'x':'発生場所', 'y':'件数'},
-            color_discrete_sequence=px.colors.qualitative.Pastel # 色のシーケンス
-        )
-        fig_bar_location.update_layout(xaxis_tickangle=-45) # X軸ラベルを斜めにする
-        st.plotly_chart(fig_bar_location, use_container_width=True)
+        def _location_bar():
+            location_counts = _sorted_counts(cube.series("location"))
+            fig_bar_location = px.bar(
+                location_counts, 
+                x=location_counts.index, 
+                y=location_counts.values, 
+                title='発生場所別',
+                labels={'x':'発生場所', 'y':'件数'},
+                color_discrete_sequence=px.colors.qualitative.Pastel, # 色のシーケンス
+                template=CHART_TEMPLATE
+            )
+            fig_bar_location.update_layout(xaxis_tickangle=-45) # X軸ラベルを斜めにする
+            return fig_bar_location
+        show_chart(("location_bar", cube.generation), _location_bar, static_charts)
 
     with col4:
         st.subheader("職種ごとのインシデント詳細")
-        # 職種の表示順を定義
-        job_type_order = ["Dr", "Ns", "PT", "At", "RT", "その他"]
-        # 既存のデータフレームからユニークな職種を取得し、定義した順序でソート
-        # データに存在しない職種は表示されないようにする
-        available_job_types = [job for job in job_type_order if job in df['職種'].unique()]
+        # データに存在する職種だけを、定義した順序で表示する
+        available_job_types = [job for job, _ in cube.series("job_type")]
         selected_job_type = st.selectbox("職種を選択してください", available_job_types)
 
         if selected_job_type:
-            filtered_by_job = df[df['職種'] == selected_job_type]
-            if not filtered_by_job.empty:
-                # インシデント内容をカンマで分割し、フラット化してカウント
-                # 空文字列やNaNを除外
-                incident_details_counts = filtered_by_job['インシデント内容'].dropna().str.split(',').explode().str.strip()
-                # データを降順でソート
-                incident_details_counts = incident_details_counts[incident_details_counts != ''].value_counts().sort_values(ascending=False)
-
-                if not incident_details_counts.empty:
+            # インシデント内容 (カンマ区切り) は職種 × インシデント内容 のキューブで集計済み
+            detail_cube = get_detail_cube()
+            incident_details_counts = _sorted_counts(detail_cube.series("content_detail", {"job_type": selected_job_type}))
+
+            if not incident_details_counts.empty:
+                def _job_detail_pie():
                     fig_pie_job_incident_details = px.pie(
                         incident_details_counts, 
                         values=incident_details_counts.values, 
                         names=incident_details_counts.index, 
                         title=f'{selected_job_type} のインシデント内容別件数',
                         hole=0.3,
-                        color_discrete_sequence=px.colors.sequential.Plasma
+                        color_discrete_sequence=px.colors.sequential.Plasma,
+                        template=CHART_TEMPLATE
                     )
                     fig_pie_job_incident_details.update_traces(textposition='inside', textinfo='percent+label', sort=False)
-                    st.plotly_chart(fig_pie_job_incident_details, use_container_width=True)
-                else:
-                    st.info(f"{selected_job_type} のインシデント内容データはありません。")
+                    return fig_pie_job_incident_details
+                show_chart(("job_detail_pie", detail_cube.generation, selected_job_type), _job_detail_pie, static_charts)
             else:
-                st.info(f"{selected_job_type} のインシデントデータはありません。")
+                st.info(f"{selected_job_type} のインシデント内容データはありません。")
 
     st.markdown("--- ")
 
     # --- 3行目: 時系列グラフ ---
-    st.subheader("月別インシデント発生件数")
-    df_time = df.copy()
-    df_time['発生日時'] = pd.to_datetime(df_time['発生日時'])
-    # 月別カウントを降順でソート
-    monthly_counts = df_time.set_index('発生日時').resample('ME').size().sort_index(ascending=False)
-    monthly_counts.index = monthly_counts.index.strftime('%Y-%m')
-    
-    fig_line_monthly = px.line(
-        monthly_counts, 
-        x=monthly_counts.index, 
-        y=monthly_counts.values, 
-        title='月別インシデント発生件数',
-        labels={'x':'年月', 'y':'件数'},
-        markers=True # マーカーを表示
+    st.subheader("期間別インシデント発生件数")
+    # 件数はDB側で期間ごとに集計する (締まった期間の件数はキャッシュされ、現在の期間だけ数え直される)
+    bucket_labels = {key: label for key, (label, _) in BUCKETS.items()}
+    col_bucket, col_rolling = st.columns([3, 1])
+    with col_bucket:
+        bucket = st.radio("集計の単位", list(bucket_labels), index=list(bucket_labels).index("month"),
+                          format_func=lambda key: bucket_labels[key], horizontal=True)
+    with col_rolling:
+        rolling = st.number_input("移動平均 (期間数、0で表示しない)", min_value=0, max_value=24, value=3, step=1)
+
+    col_level, col_location, col_job = st.columns(3)
+    with col_level:
+        selected_levels = st.multiselect("影響度レベル", LEVEL_OPTIONS, key="trend_level")
+    with col_location:
+        selected_locations = st.multiselect("発生場所", LOCATION_OPTIONS, key="trend_location")
+    with col_job:
+        selected_job_types = st.multiselect("職種", JOB_TYPE_OPTIONS, key="trend_job_type")
+
+    trend_rows = get_report_trend(
+        bucket,
+        filters={"level": selected_levels, "location": selected_locations, "job_type": selected_job_types},
+        rolling=int(rolling),
     )
-    # 時系列グラフのX軸は通常昇順なので、ここではソート順を調整しない
-    st.plotly_chart(fig_line_monthly, use_container_width=True)
+    if not trend_rows:
+        st.info("条件に一致するデータがありません。")
+    else:
+        period_label = "年度" if bucket == "fiscal_year" else bucket_labels[bucket]
+
+        def _trend_line():
+            # 点が多い場合 (日単位で数年分など) は、グラフの形を保ったまま MAX_SERIES_POINTS 点に間引く
+            keep = downsample_indexes([row["count"] for row in trend_rows])
+            trend = pd.DataFrame([trend_rows[i] for i in keep])
+            if rolling:
+                trend["rolling_mean"] = trend["rolling_mean"].round(2)
+            title = f'{period_label}別インシデント発生件数'
+            if len(keep) < len(trend_rows):
+                title += f' ({len(trend_rows)}点から{len(keep)}点に間引いて表示)'
+            # 時系列グラフは古い順 (左から右へ時間が進む) に表示する
+            fig_line_trend = px.line(
+                trend,
+                x="bucket",
+                y=["count", "rolling_mean"] if rolling else ["count"],
+                title=title,
+                labels={'bucket': period_label, 'value': '件数', 'variable': ''},
+                markers=len(keep) <= 100, # 点が少ない場合だけマーカーを表示
+                template=CHART_TEMPLATE
+            )
+            fig_line_trend.for_each_trace(
+                lambda trace: trace.update(name={"count": "件数", "rolling_mean": f"{int(rolling)}期間の移動平均"}[trace.name])
+            )
+            fig_line_trend.update_xaxes(type='category') # 期間のキーをそのまま順に並べる
+            return fig_line_trend
+        # 時系列の件数は毎回DBから求めるため、件数そのものをキーに含める
+        trend_key = ("trend_line", bucket, int(rolling), tuple((row["bucket"], row["count"]) for row in trend_rows))
+        show_chart(trend_key, _trend_line, static_charts)
+
+    st.markdown("--- ")
+
+    # --- 4行目: クロス集計 (ヒートマップ・ピボット表) ---
+    st.subheader("クロス集計")
+    dimensions = list(cube.dimensions)
+    col_rows, col_columns = st.columns(2)
+    with col_rows:
+        pivot_rows = st.selectbox("行", dimensions, index=dimensions.index("location"), format_func=cube.label)
+    with col_columns:
+        column_choices = [dim for dim in dimensions if dim != pivot_rows]
+        pivot_columns = st.selectbox("列", column_choices, index=column_choices.index("level") if "level" in column_choices else 0, format_func=cube.label)
+
+    # 絞り込み (指定しない項目はすべてを合計する)
+    selection = {}
+    with st.expander("絞り込み"):
+        filter_columns = st.columns(len(dimensions) - 1)
+        for column, dim in zip(filter_columns, [dim for dim in dimensions if dim != "month"]):
+            with column:
+                selection[dim] = st.multiselect(cube.label(dim), cube.members[dim], key=f"pivot_{dim}")
+        months = cube.members["month"]
+        if len(months) > 1:
+            month_from, month_to = st.select_slider("期間 (年月)", options=months, value=(months[0], months[-1]))
+            selection["month"] = months[months.index(month_from):months.index(month_to) + 1]
+
+    row_members, column_members, matrix = cube.pivot(pivot_rows, pivot_columns, selection)
+    if not row_members:
+        st.info("条件に一致するデータがありません。")
+    else:
+        tab_heatmap, tab_pivot = st.tabs(["ヒートマップ", "ピボット表"])
+        with tab_heatmap:
+            def _heatmap():
+                fig_heatmap = px.imshow(
+                    matrix,
+                    x=column_members,
+                    y=row_members,
+                    labels={'x': cube.label(pivot_columns), 'y': cube.label(pivot_rows), 'color': '件数'},
+                    text_auto=True,
+                    aspect='auto',
+                    color_continuous_scale='Reds',
+                    template=CHART_TEMPLATE
+                )
+                fig_heatmap.update_xaxes(type='category', side='top')
+                fig_heatmap.update_yaxes(type='category')
+                return fig_heatmap
+            show_chart(("heatmap", cube.generation, pivot_rows, pivot_columns, freeze(selection)), _heatmap, static_charts)
+        with tab_pivot:
+            pivot_table = pd.DataFrame(matrix, index=row_members, columns=column_members)
+            pivot_table['合計'] = pivot_table.sum(axis=1)
+            pivot_table.loc['合計'] = pivot_table.sum(axis=0)
+            pivot_table.index.name = cube.label(pivot_rows)
+            st.dataframe(pivot_table, use_container_width=True)
+
+        # --- ドリルダウン: 行の値を1つ選び、別の項目での内訳を表示 ---
+        col_member, col_breakdown = st.columns(2)
+        with col_member:
+            drill_member = st.selectbox(f"内訳を表示する{cube.label(pivot_rows)}", row_members)
+        with col_breakdown:
+            breakdown_choices = [dim for dim in dimensions if dim != pivot_rows]
+            breakdown = st.selectbox("内訳の項目", breakdown_choices, format_func=cube.label)
+        def _drill_bar():
+            drill_counts = pd.Series(dict(cube.series(breakdown, {**selection, pivot_rows: drill_member})), dtype="int64")
+            if breakdown != "month":
+                drill_counts = drill_counts.sort_values(ascending=False)
+            fig_drill = px.bar(
+                drill_counts,
+                x=drill_counts.index,
+                y=drill_counts.values,
+                title=f'{drill_member} の{cube.label(breakdown)}別件数',
+                labels={'x': cube.label(breakdown), 'y': '件数'},
+                color_discrete_sequence=px.colors.qualitative.Pastel,
+                template=CHART_TEMPLATE
+            )
+            fig_drill.update_xaxes(type='category')
+            return fig_drill
+        drill_key = ("drill_bar", cube.generation, pivot_rows, drill_member, breakdown, freeze(selection))
+        show_chart(drill_key, _drill_bar, static_charts)
@@ -1,20 +1,14 @@
 import streamlit as st
 import pandas as pd
 import json
-from db_utils import get_all_reports, update_report_status, get_report_by_id
-from lineworks_bot_room import send_text_message_to_channel
+from db_utils import get_all_reports, transition_report, get_report_by_id
+from report_schema import CONTENT_CATEGORY_OPTIONS, JOB_TYPE_OPTIONS, LEVEL_OPTIONS
+from db_utils.notify import is_routed, publish # LINE WORKSへの通知 (送信先は db_utils/notify.py の RULES)
 import datetime
-import os
-
-# LINE WORKS設定
-LINEWORKS_CHANNEL_ID = os.environ.get("LW_API_20_CHANNEL_ID") if os.environ.get("LW_API_20_CHANNEL_ID") else None
-LINEWORKS_BOT_ID = os.environ.get("LW_API_20_BOT_ID") if os.environ.get("LW_API_20_BOT_ID") else None
-# 承認通知用のBOT ID と CHANNEL ID
-LINEWORKS_APPROVAL_BOT_ID = os.environ.get("LW_API_20_APPROVAL_BOT_ID") if os.environ.get("LW_API_20_APPROVAL_BOT_ID") else None
-LINEWORKS_APPROVAL_CHANNEL_ID = os.environ.get("LW_API_20_APPROVAL_CHANNEL_ID") if os.environ.get("LW_API_20_APPROVAL_CHANNEL_ID") else None
+from auth import restore_session # ログイン状態の確認 (再接続時はトークンから復元)
 
 # --- 認証チェック ---
-if "logged_in" not in st.session_state or not st.session_state.logged_in:
+if not restore_session():
     st.switch_page("pages/0_Login.py")
 
 st.set_page_config(page_title="差し戻し", page_icon="", layout="wide")
@@ -25,27 +19,11 @@ st.markdown("---")
 # 説明
 st.info("管理者から差し戻されたレポートを確認修正して再提出できます。修正完了後、「再提出」ボタンを押してください。")
 
-df = get_all_reports()
+df = get_all_reports(labeled=True)
 
 if df.empty:
     st.warning("現在、レポートはありません。")
 else:
-    df.reset_index(inplace=True)
-    df.rename(columns={
-        'id': '報告ID',
-        'occurrence_datetime': '発生日時',
-        'reporter_name': '報告者',
-        'job_type': '職種',
-        'level': '影響度レベル',
-        'location': '発生場所',
-        'content_category': '内容分類',
-        'content_details': 'インシデント内容',
-        'cause_details': '発生原因',
-        'situation': '状況詳細',
-        'countermeasure': '今後の対策',
-        'status': 'ステータス',
-        'manager_comments': '管理者コメント'
-    }, inplace=True)
 
     current_username = st.session_state.get('username', '')
     rejected_df = df[(df['ステータス'] == '差し戻し') & (df['報告者'] == current_username)].copy()
@@ -71,6 +49,7 @@ else:
                 st.markdown("---")
                 if st.button(f" このレポートを修正再提出", key=f"edit_btn_{report['報告ID']}", use_container_width=True):
                     st.session_state.selected_rejection_report_id = report['報告ID']
+                    st.session_state.selected_rejection_revision = None
                     st.rerun()
 
         if st.session_state.selected_rejection_report_id is not None:
@@ -83,6 +62,9 @@ else:
                 st.session_state.selected_rejection_report_id = None
                 st.rerun()
             else:
+                # 修正フォームを開いた時点の更新番号を保持し、再提出時に競合を検出する
+                if st.session_state.get('selected_rejection_revision') is None:
+                    st.session_state.selected_rejection_revision = int(report_data.get('revision') or 0)
                 selected_report = rejected_df[rejected_df['報告ID'] == st.session_state.selected_rejection_report_id].iloc[0]
                 st.error(f"**差し戻し理由:** {selected_report.get('管理者コメント', '-')}")
                 
@@ -94,13 +76,13 @@ else:
                         reporter_name = st.text_input("報告者氏名", value=report_data.get('reporter_name', ''))
                     with col2:
                         occurrence_time = st.time_input("発生時刻", value=pd.to_datetime(report_data.get('occurrence_datetime')).time() if report_data.get('occurrence_datetime') else datetime.time(9, 0))
-                        job_type = st.selectbox("職種", ["Dr", "Ns", "PT", "At", "RT", "その他"], index=["Dr", "Ns", "PT", "At", "RT", "その他"].index(report_data.get('job_type')) if report_data.get('job_type') in ["Dr", "Ns", "PT", "At", "RT", "その他"] else 0)
+                        job_type = st.selectbox("職種", JOB_TYPE_OPTIONS, index=JOB_TYPE_OPTIONS.index(report_data.get('job_type')) if report_data.get('job_type') in JOB_TYPE_OPTIONS else 0)
                     
                     location = st.text_input("発生場所", value=report_data.get('location', ''))
-                    level = st.selectbox("影響度レベル", ["0", "1", "2", "3a", "3b", "4", "5", "その他"], index=["0", "1", "2", "3a", "3b", "4", "5", "その他"].index(report_data.get('level')) if report_data.get('level') in ["0", "1", "2", "3a", "3b", "4", "5", "その他"] else 0)
+                    level = st.selectbox("影響度レベル", LEVEL_OPTIONS, index=LEVEL_OPTIONS.index(report_data.get('level')) if report_data.get('level') in LEVEL_OPTIONS else 0)
                     
                     st.markdown("### インシデント内容")
-                    content_category = st.selectbox("内容分類", ["診察", "処置", "受付", "放射線業務", "リハビリ業務", "転倒転落", "患者対応", "機器関連", "その他"], index=["診察", "処置", "受付", "放射線業務", "リハビリ業務", "転倒転落", "患者対応", "機器関連", "その他"].index(report_data.get('content_category')) if report_data.get('content_category') in ["診察", "処置", "受付", "放射線業務", "リハビリ業務", "転倒転落", "患者対応", "機器関連", "その他"] else 0)
+                    content_category = st.selectbox("内容分類", CONTENT_CATEGORY_OPTIONS, index=CONTENT_CATEGORY_OPTIONS.index(report_data.get('content_category')) if report_data.get('content_category') in CONTENT_CATEGORY_OPTIONS else 0)
                     content_details = st.text_area("インシデント内容（詳細）", value=report_data.get('content_details', ''), height=100)
                     cause_details = st.text_area("発生原因", value=report_data.get('cause_details', ''), height=100)
                     
@@ -116,6 +98,7 @@ else:
                     
                     if cancel_button:
                         st.session_state.selected_rejection_report_id = None
+                        st.session_state.selected_rejection_revision = None
                         st.rerun()
                     
                     if submit_button:
@@ -133,24 +116,29 @@ else:
                                 'cause_details': cause_details,
                                 'situation': situation,
                                 'countermeasure': countermeasure,
-                                'status': '未読',
                                 'manager_comments': ''
                             }
-                            update_report_status(st.session_state.selected_rejection_report_id, updates)
+                            success, message = transition_report(
+                                st.session_state.selected_rejection_report_id, "resubmit", current_username,
+                                st.session_state.selected_rejection_revision, updates
+                            )
+                            if not success:
+                                st.error(message)
+                                st.session_state.selected_rejection_revision = None
+                                st.stop()
                             
                             # 承認グループに通知
-                            if LINEWORKS_APPROVAL_CHANNEL_ID and LINEWORKS_APPROVAL_BOT_ID:
+                            if is_routed("report_resubmitted"):
                                 message = (
-                                    f"【再提出インシデント報告】\n\n"
                                     f"報告ID: {st.session_state.selected_rejection_report_id}\n"
                                     f"報告者: {reporter_name}\n"
                                     f"発生日時: {occurrence_date} {occurrence_time}\n"
                                     f"影響度レベル: {level}\n"
-                                    f"内容分類: {content_category}\n\n"
-                                    f"差し戻し後の修正が完了しました。再承認をお願いします。"
+                                    f"内容分類: {content_category}"
                                 )
-                                send_text_message_to_channel(message, LINEWORKS_APPROVAL_CHANNEL_ID, bot_id=LINEWORKS_APPROVAL_BOT_ID)
+                                publish("report_resubmitted", text=message)
                             
                             st.success("レポートを再提出しました！承認管理者に通知されました。")
                             st.session_state.selected_rejection_report_id = None
+                            st.session_state.selected_rejection_revision = None
                             st.rerun()
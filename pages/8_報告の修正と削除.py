@@ -2,10 +2,13 @@ import streamlit as st
 import pandas as pd
 import datetime
 import json
-from db_utils import get_all_reports, get_report_by_id, update_report, delete_report
+from db_utils import get_all_reports, get_report_by_id, update_report, delete_report, get_report_events, get_deleted_reports, restore_report
+from db_utils.maintenance import DELETED_REPORT_RETENTION_DAYS
+from report_schema import label
+from auth import restore_session # ログイン状態の確認 (再接続時はトークンから復元)
 
 # --- 認証チェック ---
-if "logged_in" not in st.session_state or not st.session_state.logged_in:
+if not restore_session():
     st.switch_page("pages/0_Login.py")
 
 st.set_page_config(page_title="報告の修正・削除", page_icon="📝", layout="wide")
@@ -13,11 +16,19 @@ st.set_page_config(page_title="報告の修正・削除", page_icon="📝", layo
 st.title("📝 報告の修正・削除")
 st.markdown("---")
 
+# 変更履歴の操作の表示名
+EVENT_LABELS = {
+    "create": "新規報告", "import": "一括取込", "update": "修正", "delete": "削除", "status": "ステータス変更",
+    "approve": "承認", "reject": "差し戻し", "resubmit": "再提出", "restore": "復元", "purge": "完全削除", "archive": "アーカイブ",
+}
+
 # --- セッションステートの初期化 ---
 if 'edit_report_id' not in st.session_state:
     st.session_state.edit_report_id = None
 if 'delete_confirm_id' not in st.session_state:
     st.session_state.delete_confirm_id = None
+if 'edit_report_revision' not in st.session_state:
+    st.session_state.edit_report_revision = None
 
 # --- ユーザーの権限に応じて表示するレポートをフィルタリング ---
 reports_df = get_all_reports()
@@ -28,6 +39,9 @@ if not reports_df.empty:
 # --- 編集フォーム --- 
 if st.session_state.edit_report_id is not None:
     report_data = get_report_by_id(st.session_state.edit_report_id)
+    if st.session_state.edit_report_revision is None:
+        # 編集を始めた時点の revision (更新時に、その後に他のユーザーが承認などをしていないか確認する)
+        st.session_state.edit_report_revision = int(report_data['revision'])
     
     st.header(f"報告ID: {st.session_state.edit_report_id} の修正")
 
@@ -66,15 +80,36 @@ if st.session_state.edit_report_id is not None:
             'situation': st.session_state.situation,
             'countermeasure': st.session_state.countermeasure
         }
-        update_report(st.session_state.edit_report_id, updated_data)
-        st.success(f"報告ID: {st.session_state.edit_report_id} を更新しました。")
-        st.session_state.edit_report_id = None
-        st.rerun()
+        updated, message = update_report(
+            st.session_state.edit_report_id, updated_data, st.session_state.edit_report_revision, actor=st.session_state.get("username")
+        )
+        if updated:
+            st.success(message)
+            st.session_state.edit_report_id = None
+            st.session_state.edit_report_revision = None
+            st.rerun()
+        else:
+            # 入力した内容は残したまま、最新の内容を確認してもらう (キャンセルして開き直すと最新の revision で編集できる)
+            st.error(message)
 
     if cancel_button:
         st.session_state.edit_report_id = None
+        st.session_state.edit_report_revision = None
         st.rerun()
 
+    # --- 変更履歴 ---
+    with st.expander("変更履歴"):
+        events = get_report_events(st.session_state.edit_report_id)
+        if not events:
+            st.write("変更履歴はありません。")
+        for event in reversed(events):
+            st.markdown(f"**{event['created_at']} (UTC)** {EVENT_LABELS.get(event['event'], event['event'])} / {event['actor'] or '不明'}")
+            if event['changes']:
+                st.table(pd.DataFrame(
+                    [(label(column), before, after) for column, (before, after) in event['changes'].items()],
+                    columns=["項目", "変更前", "変更後"]
+                ).astype(str))
+
 # --- 一覧表示 --- 
 else:
     if reports_df.empty:
@@ -90,6 +125,7 @@ else:
                 
                 if col4.button("修正", key=f"edit_{index}"):
                     st.session_state.edit_report_id = index
+                    st.session_state.edit_report_revision = int(row['revision'])
                     st.rerun()
                 
                 if col5.button("削除", key=f"delete_{index}"):
@@ -98,10 +134,10 @@ else:
 
                 # 削除確認
                 if st.session_state.delete_confirm_id == index:
-                    st.warning(f"本当に報告ID: {index} を削除しますか？この操作は元に戻せません。")
+                    st.warning(f"本当に報告ID: {index} を削除しますか？削除から{DELETED_REPORT_RETENTION_DAYS}日間は管理者が復元できます。")
                     confirm_col1, confirm_col2 = st.columns(2)
                     if confirm_col1.button("はい、削除します", key=f"confirm_delete_{index}"):
-                        delete_report(index)
+                        delete_report(index, actor=st.session_state.get("username"))
                         st.success(f"報告ID: {index} を削除しました。")
                         st.session_state.delete_confirm_id = None
                         st.rerun()
@@ -109,3 +145,19 @@ else:
                         st.session_state.delete_confirm_id = None
                         st.rerun()
             st.markdown("---")
+
+# --- 削除済みの報告 (管理者のみ) ---
+if st.session_state.get("role") == 'admin' and st.session_state.edit_report_id is None:
+    with st.expander(f"削除済みの報告 (削除から{DELETED_REPORT_RETENTION_DAYS}日後に完全に削除されます)"):
+        deleted_df = get_deleted_reports()
+        if deleted_df.empty:
+            st.write("削除済みの報告はありません。")
+        for _, row in deleted_df.iterrows():
+            col1, col2, col3, col4 = st.columns([2, 2, 2, 1])
+            col1.text(f"報告ID: {row['id']} ({row['reporter_name']})")
+            col2.text(f"発生日時: {pd.to_datetime(row['occurrence_datetime']).strftime('%Y-%m-%d %H:%M')}")
+            col3.text(f"削除日時: {row['deleted_at']} (UTC)")
+            if col4.button("復元", key=f"restore_{row['id']}"):
+                restore_report(row['id'], actor=st.session_state.get("username"))
+                st.success(f"報告ID: {row['id']} を復元しました。")
+                st.rerun()
@@ -1,13 +1,14 @@
 import streamlit as st
 from db_utils import get_all_users, update_user_role, update_user_password, delete_user, add_user, update_user_lineworks_id
-import bcrypt
+from auth import AuthBusyError
 import pandas as pd
 import os
+from auth import restore_session # ログイン状態の確認 (再接続時はトークンから復元)
 
 st.set_page_config(page_title="ユーザー管理", page_icon="👥", layout="wide")
 
 # --- 認証チェック ---
-if "logged_in" not in st.session_state or not st.session_state.logged_in:
+if not restore_session():
     st.switch_page("pages/0_Login.py")
 
 # --- ロールベースのアクセス制御 ---
@@ -81,9 +82,13 @@ else:
                         st.session_state.user_management_message = "パスワードは6文字以上である必要があります。"
                         st.session_state.user_management_message_type = "error"
                     else:
-                        update_user_password(selected_user_id, new_password)
-                        st.session_state.user_management_message = f"{selected_username} のパスワードをリセットしました。"
-                        st.session_state.user_management_message_type = "success"
+                        try:
+                            update_user_password(selected_user_id, new_password)
+                            st.session_state.user_management_message = f"{selected_username} のパスワードをリセットしました。"
+                            st.session_state.user_management_message_type = "success"
+                        except AuthBusyError:
+                            st.session_state.user_management_message = "現在混み合っています。しばらくしてから再度お試しください。"
+                            st.session_state.user_management_message_type = "error"
                     st.rerun()
 
             # LINE WORKS ID編集
@@ -141,10 +146,14 @@ with st.form(key='admin_add_user_form'):
             st.session_state.user_management_message = "パスワードは6文字以上である必要があります。"
             st.session_state.user_management_message_type = "error"
         else:
-            if add_user(new_username_admin, new_password_admin, new_role_admin):
-                st.session_state.user_management_message = f"{new_username_admin} ({new_role_admin}) を追加しました。"
-                st.session_state.user_management_message_type = "success"
-            else:
-                st.session_state.user_management_message = "このユーザー名は既に存在します。"
+            try:
+                if add_user(new_username_admin, new_password_admin, new_role_admin):
+                    st.session_state.user_management_message = f"{new_username_admin} ({new_role_admin}) を追加しました。"
+                    st.session_state.user_management_message_type = "success"
+                else:
+                    st.session_state.user_management_message = "このユーザー名は既に存在します。"
+                    st.session_state.user_management_message_type = "error"
+            except AuthBusyError:
+                st.session_state.user_management_message = "現在混み合っています。しばらくしてから再度お試しください。"
                 st.session_state.user_management_message_type = "error"
         st.rerun()
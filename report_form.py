@@ -0,0 +1,309 @@
+import datetime
+from types import MappingProxyType
+
+import pandas as pd
+import streamlit as st
+
+from report_schema import (
+    CONTENT_DETAILS, CONTENT_CATEGORY_OPTIONS, LEVEL_OPTIONS, JOB_TYPE_OPTIONS, LOCATION_OPTIONS,
+    CONNECTION_OPTIONS, YEARS_OPTIONS, GENDER_OPTIONS, DEMENTIA_OPTIONS, YES_NO_OPTIONS,
+    MANUAL_RELATION_OPTIONS, INJURY_OPTIONS, FIELDS_BY_COLUMN,
+)
+
+# --- 報告入力フォームの定義 ---
+# 「新規報告」「過去データ報告」の2つのページで共通の入力フォームです。
+# 大分類・詳細項目・発生原因の選択肢はここ (と report_schema) で一度だけ定義し、
+# ウィジェットの表示、報告データへの変換、入力チェックはすべて下の索引を参照します。
+# 大分類や原因を追加する場合は、定義に1行足すだけで全てのページとPDFに反映されます。
+
+JST = datetime.timezone(datetime.timedelta(hours=9))
+
+# 発生・発見の原因 (分類 -> 選択肢)
+CAUSE_OPTIONS = MappingProxyType({
+    "不適切な指示": ("口頭指示", "検査伝票・指示ラベル・処方箋の誤記", "その他"),
+    "無確認": ("検査伝票・指示ラベル・処方箋で確認せず", "思い込み・勘違い", "疑問に思ったが確認せず", "ダブルチェックせず", "正しい確認方法を知らなかった", "機器・器具の操作方法を確認しなかった", "患者情報を確認しなかった", "その他"),
+    "指示の見落としなど": ("指示の見落とし", "指示の見誤り", "その他"),
+    "患者観察の不足": ("処置・検査・手技中または直前直後における観察不足", "投薬中または直前直後における観察不足"),
+    "説明・知識・経験の不足": ("説明不足", "業務に対する知識不足", "業務に対する技術不足"),
+    "偶発症・災害": ("偶発症", "不可抗力（患者に関する発見）", "不可抗力（施設設備等に関する発見・災害被害等）"),
+    "発生時の状況": ("多忙であった", "時間に追われていた", "疲弊していた", "集中できる環境ではなかった", "人員不足"),
+})
+
+# --- 索引 (モジュールの読み込み時に一度だけ作成) ---
+# 原因の分類 -> (選択のキー, 「その他」の詳細のキー)
+CAUSE_KEYS = MappingProxyType({category: (f"cause_{category}", f"cause_{category}_other") for category in CAUSE_OPTIONS})
+# 大分類 -> 詳細項目のキー / 詳細項目のキー -> 選択肢
+DETAIL_KEY_BY_CATEGORY = MappingProxyType({category: key for category, (key, _) in CONTENT_DETAILS.items()})
+DETAIL_OPTIONS_BY_KEY = MappingProxyType({key: options for key, options in CONTENT_DETAILS.values()})
+INJURY_CATEGORY = "転倒・転落" # 外傷の入力欄を表示する大分類
+
+# 入力必須の項目 (キー -> 表示名)
+REQUIRED_INPUTS = MappingProxyType({"reporter_name": "報告者氏名", "situation": "発生の状況", "countermeasure": "今後の対策"})
+
+# 報告データにそのまま写す項目 (session_stateのキーとDBのカラム名が同じもの)
+PLAIN_REPORT_KEYS = (
+    "reporter_name", "job_type", "level", "location", "years_of_experience", "years_since_joining",
+    "patient_ID", "patient_name", "patient_gender", "patient_age", "dementia_status",
+    "patient_status_change_accident", "patient_status_change_patient_explanation", "patient_status_change_family_explanation",
+    "content_category", "injury_details", "injury_other_text", "manual_relation", "situation", "countermeasure",
+)
+
+# 影響度レベルの定義表 (再実行のたびに作り直さない)
+LEVEL_INCIDENT_TABLE = pd.DataFrame({
+    'レベル': ['0', '1', '2'],
+    '説明': [
+        "間違ったことが実施される前に気づいた場合。",
+        "間違ったことが実施されたが、患者様かつ職員には影響・変化がなかった場合。",
+        "間違ったことが実施されたが、患者様かつ職員に処置や治療を行う必要はなかった。（患者観察の強化など）"
+    ]
+}).set_index('レベル')
+LEVEL_ACCIDENT_TABLE = pd.DataFrame({
+    'レベル': ['3a', '3b', '4', '5'],
+    '説明': [
+        "事故により、簡単な処置や治療を要した。（消毒、湿布、鎮痛剤の投与など）",
+        "事故により、濃厚な処置や治療を要した。（骨折、手術、入院日数の延長など）",
+        "事故により、永続的な障害や後遺症が残った。",
+        "事故が死因になった。"
+    ]
+}).set_index('レベル')
+
+
+# --- セッションステート ---
+
+def form_defaults() -> dict:
+    """フォームの初期値を返します (日時は呼び出した時点の日本時間)"""
+    now = datetime.datetime.now(JST)
+    defaults = {
+        'level': "1",
+        'occurrence_date': now.date(),
+        'occurrence_time': now.time(),
+        'reporter_name': "",
+        'job_type': "Dr",
+        'connection_with_accident': [],
+        'years_of_experience': "1年未満",
+        'years_since_joining': "1年未満",
+        'patient_ID': "",
+        'patient_name': "",
+        'patient_gender': "",
+        'patient_age': None,
+        'dementia_status': "",
+        'patient_status_change_accident': "無",
+        'patient_status_change_patient_explanation': "無",
+        'patient_status_change_family_explanation': "無",
+        'location': "1FMRI室",
+        'situation': "",
+        'countermeasure': "",
+        'content_category': "診察",
+        'injury_details': [],
+        'injury_other_text': "",
+        'manual_relation': "手順に従っていた",
+    }
+    for key in DETAIL_OPTIONS_BY_KEY:
+        defaults[key] = []
+    for selected_key, other_key in CAUSE_KEYS.values():
+        defaults[selected_key] = []
+        defaults[other_key] = ""
+    return defaults
+
+
+def init_form_state(defaults: dict):
+    """session_stateに未設定の項目だけ初期値を入れます"""
+    for key, value in defaults.items():
+        if key not in st.session_state:
+            st.session_state[key] = value
+
+
+def apply_draft_data(draft_data: dict):
+    """下書きの内容をsession_stateに反映します (ウィジェットの表示前に呼び出してください)"""
+    for k, v in draft_data.items():
+        if k == 'occurrence_date' and v:
+            st.session_state[k] = datetime.date.fromisoformat(v)
+        elif k == 'occurrence_time' and v:
+            st.session_state[k] = datetime.time.fromisoformat(v)
+        else:
+            st.session_state[k] = v
+
+
+def reset_details_on_category_change():
+    """大分類が切り替わった場合に、前の大分類で選んだ詳細項目と外傷の入力をクリアします"""
+    if 'prev_content_category' not in st.session_state:
+        st.session_state.prev_content_category = st.session_state.content_category
+    elif st.session_state.prev_content_category != st.session_state.content_category:
+        for key in DETAIL_OPTIONS_BY_KEY:
+            st.session_state[key] = []
+        st.session_state.injury_details = []
+        st.session_state.injury_other_text = ""
+        st.session_state.prev_content_category = st.session_state.content_category
+
+
+def clear_form_state(defaults: dict):
+    """報告後にフォームの入力内容をsession_stateから削除します"""
+    for key in defaults.keys():
+        if key in st.session_state:
+            del st.session_state[key]
+
+
+# --- 報告データへの変換と入力チェック ---
+
+def summarize_content_details(data) -> str:
+    """選択中の大分類の詳細項目 (転倒・転落の場合は外傷も含む) を「, 」区切りの文字列にします"""
+    category = data.get('content_category')
+    key = DETAIL_KEY_BY_CATEGORY.get(category)
+    details = list(data.get(key) or []) if key else []
+    if category == INJURY_CATEGORY and data.get('injury_details'):
+        injury_str = f"(外傷: {', '.join(data['injury_details'])})"
+        if data.get('injury_other_text'):
+            injury_str += f" その他: {data['injury_other_text']}"
+        details.append(injury_str)
+    return ", ".join(details)
+
+
+def summarize_causes(data) -> str:
+    """選択された発生原因を「分類: 項目, 項目 | 分類: ...」の形式の文字列にします"""
+    cause_list = []
+    for category, (selected_key, other_key) in CAUSE_KEYS.items():
+        items = data.get(selected_key) or []
+        if items:
+            item_str = f"{category}: {', '.join(items)}"
+            if "その他" in items and data.get(other_key):
+                item_str += f" ({data[other_key]})"
+            cause_list.append(item_str)
+    return " | ".join(cause_list)
+
+
+def validate_report_input(data) -> list:
+    """入力チェックを行い、エラーメッセージのリストを返します (問題が無ければ空)"""
+    missing = [name for key, name in REQUIRED_INPUTS.items() if not data.get(key)]
+    if missing:
+        return [f"{'、'.join(missing)}は必須項目です。"]
+    return []
+
+
+def build_report_data(data) -> dict:
+    """フォームの入力内容から add_report に渡す報告データを作ります"""
+    report = {key: data.get(key) for key in PLAIN_REPORT_KEYS}
+    report["occurrence_datetime"] = datetime.datetime.combine(data['occurrence_date'], data['occurrence_time'])
+    report["connection_with_accident"] = ", ".join(data.get('connection_with_accident') or [])
+    report["content_details"] = summarize_content_details(data)
+    report["cause_details"] = summarize_causes(data)
+    # DBにカラムが無い詳細項目 (転倒・転落) は、インシデント内容の文字列にだけ含める
+    for key in DETAIL_OPTIONS_BY_KEY:
+        if key in FIELDS_BY_COLUMN:
+            report[key] = data.get(key) or []
+    return report
+
+
+# --- ウィジェットの表示 ---
+
+def render_category_selector():
+    """大分類のラジオボタンを表示します (選択に応じて詳細項目が切り替わるため、フォームの外に置きます)"""
+    st.subheader("1. インシデントの大分類を選択してください")
+    st.radio("大分類", CONTENT_CATEGORY_OPTIONS, key="content_category", horizontal=True, label_visibility="collapsed")
+    st.markdown("--- ")
+
+
+def _render_level_definitions():
+    with st.expander("レベル定義の確認"):
+        st.subheader("インシデント")
+        st.dataframe(LEVEL_INCIDENT_TABLE, use_container_width=True, column_config={"説明": st.column_config.TextColumn("説明", width="large")})
+
+        st.subheader("アクシデント")
+        st.dataframe(LEVEL_ACCIDENT_TABLE, use_container_width=True, column_config={"説明": st.column_config.TextColumn("説明", width="large")})
+
+        st.subheader("その他")
+        st.markdown("- 盗難、自殺、災害、クレーム、発注ミス、個人情報流出、針刺し事故など")
+
+
+def _render_content_details():
+    """選択中の大分類の詳細項目だけを表示します"""
+    category = st.session_state.content_category
+    key = DETAIL_KEY_BY_CATEGORY.get(category)
+    if key:
+        st.multiselect("詳細", DETAIL_OPTIONS_BY_KEY[key], key=key)
+    if category == INJURY_CATEGORY:
+        st.multiselect("外傷の有無など", INJURY_OPTIONS, key="injury_details")
+        if "その他" in st.session_state.injury_details:
+            st.text_input("その他（外傷の詳細）", key="injury_other_text")
+
+
+def render_report_fields():
+    """報告フォームの入力欄 (基本情報からマニュアルとの関連まで) を表示します。st.form の中で呼び出してください。"""
+    st.subheader("2. 詳細を入力してください")
+    st.markdown("<br>", unsafe_allow_html=True)
+
+    # --- 基本情報 ---
+    st.subheader("基本情報")
+    st.selectbox("影響度レベル", LEVEL_OPTIONS, key='level')
+    _render_level_definitions()
+
+    st.markdown("--- ")
+    col1, col2 = st.columns(2)
+    with col1:
+        st.write("**発生日時**")
+        sub_col1, sub_col2 = st.columns([2, 1])
+        sub_col1.date_input("発生日", key="occurrence_date", label_visibility="collapsed")
+        sub_col2.time_input("発生時刻", key="occurrence_time", label_visibility="collapsed")
+
+        st.write("**代表報告者**")
+        reporter_col1, reporter_col2 = st.columns([2, 1])
+        reporter_col1.text_input("報告者氏名", key="reporter_name", placeholder="氏名を入力", label_visibility="collapsed")
+        reporter_col2.selectbox("職種", JOB_TYPE_OPTIONS, key="job_type", label_visibility="collapsed")
+
+        st.write("**事故との関連性**")
+        st.multiselect("関連性をすべて選択", CONNECTION_OPTIONS, key='connection_with_accident', label_visibility="collapsed")
+
+        st.write("**経験年数**")
+        years_col1, years_col2 = st.columns(2)
+        years_col1.selectbox("総実務経験", YEARS_OPTIONS, key="years_of_experience")
+        years_col2.selectbox("入職年数", YEARS_OPTIONS, key="years_since_joining")
+
+    with col2:
+        st.write("**患者情報**")
+        patient_id_col, patient_name_col = st.columns([1, 2])
+        patient_id_col.text_input("患者ID", key="patient_ID", placeholder="IDを入力", label_visibility="collapsed")
+        patient_name_col.text_input("患者氏名", key="patient_name", placeholder="氏名を入力", label_visibility="collapsed")
+
+        gender_col, age_col, dementia_col = st.columns([1, 1, 2])
+        with gender_col:
+            st.write("**性別**")
+            st.selectbox("性別", GENDER_OPTIONS, key="patient_gender", label_visibility="collapsed")
+        with age_col:
+            st.write("**年齢**")
+            st.number_input("年齢", min_value=0, max_value=150, key="patient_age", label_visibility="collapsed")
+        with dementia_col:
+            st.write("**認知症の有無**")
+            st.selectbox("認知症の有無", DEMENTIA_OPTIONS, key="dementia_status", label_visibility="collapsed")
+
+        st.write("**発生場所**")
+        st.selectbox("発生場所", LOCATION_OPTIONS, key="location", label_visibility="collapsed")
+
+        st.write("**状態変化・説明**")
+        for key, text in (
+            ("patient_status_change_accident", "事故などによる患者の状態変化"),
+            ("patient_status_change_patient_explanation", "患者への説明"),
+            ("patient_status_change_family_explanation", "家族への説明"),
+        ):
+            col_text, col_radio = st.columns([3, 1])
+            col_text.write(text)
+            col_radio.radio(text, YES_NO_OPTIONS, key=key, horizontal=True, label_visibility="collapsed")
+
+    st.markdown("--- ")
+    st.subheader("状況と対策")
+    st.text_area("発生の状況と直後の対応（詳細に記入）", key="situation")
+    st.text_area("今後の対策（箇条書きで記入）", key="countermeasure")
+
+    st.markdown("--- ")
+    st.subheader("インシデントの詳細")
+    st.markdown(f"<h3 style='margin-bottom: 0;'>選択中の大分類: <span style='color: #3498db;'>{st.session_state.content_category}</span></h3>", unsafe_allow_html=True)
+
+    with st.expander("内容（関連する箇所にチェック）", expanded=True):
+        _render_content_details()
+
+    with st.expander("発生・発見の原因（複数選択可）", expanded=True):
+        for category, (selected_key, other_key) in CAUSE_KEYS.items():
+            st.multiselect(category, CAUSE_OPTIONS[category], key=selected_key)
+            if "その他" in st.session_state[selected_key]:
+                st.text_input(f"【{category}】その他の詳細", key=other_key)
+
+    with st.expander("マニュアルとの関連", expanded=True):
+        st.radio("手順に対して", MANUAL_RELATION_OPTIONS, key="manual_relation")
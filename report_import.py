@@ -0,0 +1,368 @@
+import argparse
+import datetime
+import json
+import os
+import sqlite3
+from typing import NamedTuple
+
+import pandas as pd
+
+from report_schema import FIELDS, FIELDS_BY_COLUMN, STATUS_OPTIONS, STATUS_APPROVED
+from report_form import summarize_content_details
+
+# --- 過去データの一括取り込み ---
+# 紙やExcelで管理していた過去の報告を CSV / Excel (.xlsx) からまとめて取り込みます。
+# ファイルは先頭から順に読み込み (全件をメモリに載せない)、行ごとにスキーマ定義で検証したうえで、
+# 一定件数ごとに1トランザクションで executemany により追加します。
+# CSV/PDFの生成は取り込みとは切り離し、必要な場合だけ最後にまとめて実行します。
+#
+# コマンドラインからの実行例:
+#   python report_import.py 過去データ.xlsx
+#   python report_import.py 過去データ.csv --encoding cp932 --dry-run
+
+IMPORT_CHUNK_SIZE = 500
+IMPORT_ENCODINGS = ("utf-8-sig", "cp932")
+
+# 取り込み時に無視する列 (IDと更新番号はDB側で採番する)
+IGNORED_COLUMNS = ("id", "revision")
+JSON_COLUMNS = frozenset(field.column for field in FIELDS if field.dtype == "json")
+REQUIRED_COLUMNS = ("occurrence_datetime", "reporter_name", "situation")
+
+# 「事故との関連性」などの複数選択項目で区切り文字として扱う文字
+MULTI_SEPARATORS = (", ", "、", ",", "，", "/", "\n")
+
+DATETIME_FORMATS = ("%Y-%m-%d %H:%M:%S", "%Y-%m-%d %H:%M", "%Y-%m-%d", "%Y%m%d %H%M", "%Y%m%d")
+
+
+class ImportRowError(NamedTuple):
+    """取り込みできなかった項目1件分のエラー"""
+    row: int            # ファイル上の行番号 (見出し行を1行目とする)
+    column: str         # 項目の日本語ラベル (行全体のエラーの場合は空文字)
+    message: str
+
+
+class ImportResult(NamedTuple):
+    """一括取り込みの結果"""
+    total_rows: int
+    report_ids: list
+    approved_ids: list  # report_ids のうちステータスが承認済みのもの (CSV/PDFの生成対象)
+    errors: list        # ImportRowError のリスト
+
+    @property
+    def inserted(self) -> int:
+        return len(self.report_ids)
+
+    @property
+    def error_rows(self) -> int:
+        return len({error.row for error in self.errors})
+
+
+class ImportInterruptedError(ValueError):
+    """
+    ファイルの途中で読み込めなくなり、取り込みを中止したことを表します。
+    それより前のチャンクは保存済みのため、result にその分の取り込み結果を持ちます。
+    """
+
+    def __init__(self, message: str, result: ImportResult):
+        super().__init__(message)
+        self.result = result
+
+
+def _build_header_map() -> dict:
+    """見出しの表記 (カラム名・ラベル・長いラベル) からDBのカラム名を引く辞書を作ります"""
+    header_map = {}
+    for field in FIELDS:
+        for name in (field.column, field.label, field.long_label):
+            if name:
+                header_map[name] = field.column
+    return header_map
+
+
+HEADER_MAP = _build_header_map()
+
+
+# --- ファイルの読み込み ---
+
+def _is_excel(filename: str) -> bool:
+    return os.path.splitext(filename or "")[1].lower() in (".xlsx", ".xlsm")
+
+
+def iter_source_rows(source, filename: str = None, encoding: str = "utf-8-sig", chunk_size: int = IMPORT_CHUNK_SIZE):
+    """
+    CSV / Excel ファイルを先頭から読み込み、(行番号, {見出し: 値}) を順に返します。
+    source にはファイルパスか、Streamlitのアップロードファイルなどのファイルオブジェクトを渡します。
+    """
+    filename = filename or (source if isinstance(source, str) else getattr(source, "name", ""))
+    if _is_excel(filename):
+        yield from _iter_excel_rows(source)
+        return
+
+    # CSVはchunksize単位で読み込むため、大きなファイルでもメモリ使用量が一定になる
+    reader = pd.read_csv(source, dtype=str, keep_default_na=False, encoding=encoding, chunksize=chunk_size)
+    row_number = 1
+    for chunk in reader:
+        for record in chunk.to_dict("records"):
+            row_number += 1
+            yield row_number, record
+
+
+def _iter_excel_rows(source):
+    """先頭シートを読み取り専用モードで1行ずつ読み込みます"""
+    from openpyxl import load_workbook # Excel取り込み時だけ必要なため、ここでインポート
+
+    workbook = load_workbook(source, read_only=True, data_only=True)
+    try:
+        rows = workbook.worksheets[0].iter_rows(values_only=True)
+        header = next(rows, None)
+        if header is None:
+            return
+        header = [str(h).strip() if h is not None else "" for h in header]
+        for row_number, values in enumerate(rows, start=2):
+            if values is None or all(v is None or v == "" for v in values):
+                continue # 空行は読み飛ばす
+            yield row_number, dict(zip(header, values))
+    finally:
+        workbook.close()
+
+
+# --- 行の検証と変換 ---
+
+def _is_blank(value) -> bool:
+    return value is None or (isinstance(value, float) and value != value) or str(value).strip() == ""
+
+
+def _parse_datetime(value) -> datetime.datetime:
+    if isinstance(value, datetime.datetime):
+        return value.replace(tzinfo=None, microsecond=0)
+    if isinstance(value, datetime.date):
+        return datetime.datetime.combine(value, datetime.time())
+    text = str(value).strip().replace("/", "-").replace("T", " ")
+    try:
+        return datetime.datetime.fromisoformat(text).replace(tzinfo=None, microsecond=0)
+    except ValueError:
+        pass
+    for fmt in DATETIME_FORMATS:
+        try:
+            return datetime.datetime.strptime(text, fmt)
+        except ValueError:
+            continue
+    raise ValueError(f"日時として解釈できません: {value}")
+
+
+def _split_multi(value) -> list:
+    """JSON配列、または区切り文字で並べた複数選択項目をリストに変換します"""
+    if isinstance(value, (list, tuple)):
+        return [str(v).strip() for v in value if not _is_blank(v)]
+    text = str(value).strip()
+    if text.startswith("["):
+        try:
+            return [str(v).strip() for v in json.loads(text) if not _is_blank(v)]
+        except json.JSONDecodeError:
+            pass
+    for separator in MULTI_SEPARATORS[1:]:
+        text = text.replace(separator, MULTI_SEPARATORS[0])
+    return [item.strip() for item in text.split(MULTI_SEPARATORS[0]) if item.strip()]
+
+
+def _convert_value(field, value):
+    """1項目分の値をDBに保存する形式に変換します。不正な値の場合は ValueError を送出します。"""
+    if field.dtype == "datetime":
+        parsed = _parse_datetime(value)
+        # 既存データと同じ形式 (発生日時は空白区切り、その他はisoformat) で保存する
+        return parsed.isoformat(sep=" ") if field.column == "occurrence_datetime" else parsed.isoformat()
+    if field.dtype == "int":
+        try:
+            number = float(str(value).strip())
+        except ValueError:
+            raise ValueError(f"数値ではありません: {value}")
+        if number != int(number) or number < 0:
+            raise ValueError(f"0以上の整数を入力してください: {value}")
+        return int(number)
+    if field.dtype in ("multi", "json"):
+        items = _split_multi(value)
+        if field.options:
+            unknown = [item for item in items if item not in field.options]
+            if unknown:
+                raise ValueError(f"選択肢にない値です: {', '.join(unknown)}")
+        return json.dumps(items, ensure_ascii=False) if field.dtype == "json" else ", ".join(items)
+
+    text = str(value).strip()
+    if isinstance(value, float) and value == int(value):
+        text = str(int(value)) # Excelで数値として入力された影響度レベルなど
+    if field.options and text not in field.options:
+        raise ValueError(f"選択肢にない値です: {text}")
+    return text
+
+
+def _summarize_content_details(record: dict) -> str:
+    """インシデント内容が空の場合、内容分類の詳細項目から入力フォームと同じ形式の要約を作ります"""
+    decoded = {key: json.loads(value) if key in JSON_COLUMNS and value else value for key, value in record.items()}
+    return summarize_content_details(decoded)
+
+
+def validate_row(row_number: int, raw: dict, status: str = STATUS_APPROVED):
+    """
+    1行分の入力をスキーマ定義に沿って検証し、DBに追加できるレコードに変換します。
+
+    Returns:
+        tuple: (レコード または None, ImportRowError のリスト)
+    """
+    record = {}
+    errors = []
+    for header, value in raw.items():
+        column = HEADER_MAP.get(str(header).strip())
+        if column is None or column in IGNORED_COLUMNS or _is_blank(value):
+            continue
+        field = FIELDS_BY_COLUMN[column]
+        try:
+            record[column] = _convert_value(field, value)
+        except ValueError as e:
+            errors.append(ImportRowError(row_number, field.label, str(e)))
+
+    for column in REQUIRED_COLUMNS:
+        if column not in record and not any(error.column == FIELDS_BY_COLUMN[column].label for error in errors):
+            errors.append(ImportRowError(row_number, FIELDS_BY_COLUMN[column].label, "必須項目が入力されていません。"))
+    if errors:
+        return None, errors
+
+    record.setdefault("status", status)
+    # 報告日時が無い過去データは発生日時を報告日時とみなす
+    record.setdefault("created_at", datetime.datetime.fromisoformat(record["occurrence_datetime"]).isoformat())
+    record.setdefault("countermeasure", "") # DB上は必須のため、対策の記録が無い過去データは空欄で保存する
+    record.setdefault("injury_other_text", "")
+    if not record.get("content_details"):
+        record["content_details"] = _summarize_content_details(record)
+    return record, []
+
+
+def find_unknown_headers(headers) -> list:
+    """取り込み対象にならない見出しを返します (画面やコマンドラインでの警告表示用)"""
+    return [h for h in headers if str(h).strip() not in HEADER_MAP]
+
+
+# --- 取り込み処理 ---
+
+def import_reports(source, filename: str = None, status: str = STATUS_APPROVED, encoding: str = "utf-8-sig",
+                   chunk_size: int = IMPORT_CHUNK_SIZE, dry_run: bool = False, progress=None) -> ImportResult:
+    """
+    CSV / Excel の過去データを検証し、chunk_size 件ごとに1トランザクションで追加します。
+    検証エラーのある行は追加せず、エラー内容を行番号付きで返します (他の行の取り込みは続行します)。
+    dry_run=True の場合は検証だけを行い、DBには書き込みません。
+    progress には処理済み行数を受け取る関数を渡せます (画面の進捗表示用)。
+    ファイルの途中で読み込めなくなった場合 (文字コードの誤りなど)、保存済みのチャンクがあれば
+    ImportInterruptedError を、無ければ読み込みのエラーをそのまま送出します。
+    """
+    from db_utils import add_reports_many # Streamlitを起動しないコマンドラインでもDBの書き込みを共通化する
+
+    if status not in STATUS_OPTIONS:
+        raise ValueError(f"ステータスが不正です: {status}")
+
+    total_rows = 0
+    report_ids = []
+    approved_ids = []
+    errors = []
+    pending = []
+
+    def flush():
+        if pending and not dry_run:
+            records = [record for _, record in pending]
+            try:
+                inserted_ids = add_reports_many(records)
+            except sqlite3.Error as e:
+                # チャンク単位でロールバックされるため、含まれる行をすべてエラーとして返す
+                print(f"ERROR: import_reports: Failed to insert rows {pending[0][0]}-{pending[-1][0]}: {e}")
+                errors.extend(ImportRowError(row_number, "", f"データベースへの保存に失敗しました: {e}") for row_number, _ in pending)
+            else:
+                report_ids.extend(inserted_ids)
+                approved_ids.extend(i for i, r in zip(inserted_ids, records) if r["status"] == STATUS_APPROVED)
+        pending.clear()
+
+    try:
+        for row_number, raw in iter_source_rows(source, filename, encoding=encoding, chunk_size=chunk_size):
+            total_rows += 1
+            record, row_errors = validate_row(row_number, raw, status)
+            if row_errors:
+                errors.extend(row_errors)
+                continue
+            pending.append((row_number, record))
+            if len(pending) >= chunk_size:
+                flush()
+                if progress:
+                    progress(total_rows)
+    except ValueError as e: # UnicodeDecodeError や pandas の読み込みエラー
+        if not report_ids:
+            raise
+        # 読み込めた行のうち、保存前のチャンクの行は保存しない (保存済みのチャンクは残る)
+        # 行番号は見出し行を1行目として数える (読み込めたデータ行の次の行から後で失敗した)
+        print(f"ERROR: import_reports: Failed to read after row {total_rows + 1}; {len(report_ids)} rows were already saved: {e}")
+        raise ImportInterruptedError(
+            f"{total_rows + 2}行目以降で読み込めなくなったため、取り込みを中止しました: {e}",
+            ImportResult(total_rows, report_ids, approved_ids, errors)
+        ) from e
+    flush()
+    if progress:
+        progress(total_rows)
+
+    print(f"DEBUG: import_reports: {total_rows}行中 {len(report_ids)}件を取り込みました (エラー {len(errors)}件, dry_run={dry_run})")
+    return ImportResult(total_rows, report_ids, approved_ids, errors)
+
+
+def errors_to_dataframe(errors: list) -> pd.DataFrame:
+    """エラー一覧を画面表示・CSV出力用のDataFrameに変換します"""
+    return pd.DataFrame(errors, columns=["row", "column", "message"]).rename(
+        columns={"row": "行", "column": "項目", "message": "エラー内容"}
+    )
+
+
+def template_dataframe() -> pd.DataFrame:
+    """取り込み用ファイルの見出し行 (日本語ラベル) だけを持つ空のDataFrameを返します"""
+    columns = [field.label for field in FIELDS if field.column not in IGNORED_COLUMNS and field.group != "workflow"]
+    return pd.DataFrame(columns=columns + [FIELDS_BY_COLUMN["created_at"].label])
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="過去のインシデント報告を CSV / Excel から一括で取り込みます。")
+    parser.add_argument("path", help="取り込むファイル (.csv / .xlsx)")
+    parser.add_argument("--encoding", default="utf-8-sig", choices=IMPORT_ENCODINGS, help="CSVの文字コード")
+    parser.add_argument("--status", default=STATUS_APPROVED, choices=STATUS_OPTIONS, help="ステータス列が無い行に設定するステータス")
+    parser.add_argument("--chunk-size", type=int, default=IMPORT_CHUNK_SIZE, help="1トランザクションで追加する件数")
+    parser.add_argument("--dry-run", action="store_true", help="検証だけを行い、DBには書き込まない")
+    parser.add_argument("--generate-files", action="store_true", help="取り込み後に承認済みレポートのCSV/PDFを生成する")
+    parser.add_argument("--errors", help="エラー一覧を書き出すCSVファイル")
+    args = parser.parse_args(argv)
+
+    from db_utils import init_db, process_approved_reports
+    init_db()
+
+    started = datetime.datetime.now()
+    interrupted = None
+    try:
+        result = import_reports(
+            args.path, status=args.status, encoding=args.encoding, chunk_size=args.chunk_size, dry_run=args.dry_run,
+            progress=lambda n: print(f"{n}行を処理しました..."),
+        )
+    except ImportInterruptedError as e:
+        interrupted, result = e, e.result
+        print(f"エラー: {e}")
+        print(f"中止する前に {result.inserted}件を保存済みです (報告ID {min(result.report_ids)}〜{max(result.report_ids)})。")
+    elapsed = (datetime.datetime.now() - started).total_seconds()
+    print(f"{result.total_rows}行中 {result.inserted}件を取り込みました。エラー: {result.error_rows}行 ({elapsed:.1f}秒)")
+
+    for error in result.errors[:20]:
+        print(f"  {error.row}行目 {error.column}: {error.message}")
+    if len(result.errors) > 20:
+        print(f"  ...他 {len(result.errors) - 20}件")
+    if args.errors and result.errors:
+        errors_to_dataframe(result.errors).to_csv(args.errors, index=False, encoding="utf-8-sig")
+        print(f"エラー一覧を '{args.errors}' に保存しました。")
+
+    if args.generate_files and result.approved_ids:
+        # コマンドラインではプロセス終了までに完了させる必要があるため、同期的に実行する
+        print("CSV/PDFを生成しています...")
+        process_approved_reports(result.approved_ids, notify=False)
+
+    return 1 if result.errors or interrupted else 0
+
+
+if __name__ == "__main__":
+    raise SystemExit(main())
@@ -0,0 +1,186 @@
+from typing import NamedTuple
+
+# --- 報告項目のスキーマ定義 ---
+# 各項目のDBカラム名・日本語ラベル・型・選択肢・表示グループをここで一元管理します。
+# ページ側で列名の変換辞書を個別に持たず、このモジュールを参照してください。
+
+
+class ReportField(NamedTuple):
+    """報告項目1件分の定義"""
+    column: str                 # DBのカラム名
+    label: str                  # 一覧・検索などで使う日本語ラベル
+    dtype: str = "text"         # text / int / datetime / multi (", "区切りで保存) / json (JSON配列で保存)
+    group: str = "basic"        # 表示グループ (GROUP_TITLES のキー)
+    options: tuple = ()         # 選択肢 (自由入力の場合は空)
+    long_label: str = None      # PDF・フォーム用の長いラベル (省略時は label)
+
+    @property
+    def caption(self) -> str:
+        return self.long_label or self.label
+
+
+# --- 選択肢 ---
+LEVEL_OPTIONS = ("0", "1", "2", "3a", "3b", "4", "5", "その他")
+JOB_TYPE_OPTIONS = ("Dr", "Ns", "PT", "At", "RT", "その他")
+LOCATION_OPTIONS = (
+    "1FMRI室", "1F操作室", "1F撮影室", "1Fエコー室", "1F廊下", "1Fトイレ",
+    "2F受付", "2F待合", "2F診察室", "2F処置室", "2Fトイレ",
+    "3Fリハビリ室", "3F受付", "3F待合", "3Fトイレ",
+    "4Fリハビリ室", "4F受付", "4F待合", "4Fトイレ",
+)
+CONNECTION_OPTIONS = ("当事者", "発見者", "患者本人より訴え", "患者家族より訴え")
+YEARS_OPTIONS = ("1年未満", "1～3年未満", "3～5年未満", "5～10年未満", "10年以上")
+GENDER_OPTIONS = ("", "男性", "女性", "その他")
+DEMENTIA_OPTIONS = ("", "あり", "なし", "不明")
+YES_NO_OPTIONS = ("有", "無")
+MANUAL_RELATION_OPTIONS = ("手順に従っていた", "手順に従っていなかった", "手順がなかった", "不慣れ・不手際")
+INJURY_OPTIONS = ("外傷なし", "擦過傷", "表皮剥離", "打撲", "骨折", "その他")
+
+# ステータス
+STATUS_UNREAD = "未読"
+STATUS_FIRST_APPROVED = "承認中(1/2)"
+STATUS_APPROVED = "承認済み"
+STATUS_REJECTED = "差し戻し"
+STATUS_OPTIONS = (STATUS_UNREAD, STATUS_FIRST_APPROVED, STATUS_APPROVED, STATUS_REJECTED)
+PENDING_STATUSES = (STATUS_UNREAD, STATUS_FIRST_APPROVED)
+
+# 承認ワークフローの状態遷移 ((アクション, 遷移前ステータス) -> 遷移後ステータス)
+APPROVAL_TRANSITIONS = {
+    ("approve", STATUS_UNREAD): STATUS_FIRST_APPROVED,
+    ("approve", STATUS_FIRST_APPROVED): STATUS_APPROVED,
+    ("reject", STATUS_UNREAD): STATUS_REJECTED,
+    ("reject", STATUS_FIRST_APPROVED): STATUS_REJECTED,
+    ("resubmit", STATUS_REJECTED): STATUS_UNREAD,
+}
+
+# 大分類ごとの詳細項目 (大分類 -> (保存キー, 選択肢))
+CONTENT_DETAILS = {
+    "診察": ("content_details_shinsatsu", ("患者間違い", "オーダー間違い", "予約間違い", "案内間違い", "紛失", "カルテ記載間違い", "伝達漏れ", "返却忘れ", "確認漏れ", "情報漏洩", "未処置帰宅")),
+    "処置": ("content_details_shochi", ("患者間違い", "部位間違い", "案内間違い", "カルテ記載間違い", "確認漏れ", "伝達漏れ", "ラベル間違い", "針刺し事故", "検体採り間違い", "不適切な前処置", "未処置帰宅", "薬液間違い")),
+    "受付": ("content_details_uketsuke", ("患者間違い", "予約間違い", "案内間違い", "紛失", "カルテ記載間違い", "伝達漏れ", "返却忘れ", "確認漏れ", "情報漏洩", "会計間違い", "郵送関係")),
+    "放射線業務": ("content_details_houshasen", ("患者間違い", "機器登録間違い", "マーカー間違い", "骨密度解析間違い", "MRI室金属持ち込み", "画像転送忘れ", "左右間違い", "案内間違い", "紛失", "カルテ記載間違い", "伝達間違い", "返却忘れ", "確認漏れ", "情報漏洩", "MRI完全吸着", "技師コメント間違い", "装置故障")),
+    "リハビリ業務": ("content_details_rehabili", ("患者間違い", "部位間違い", "評価ミス", "計画書関連", "リハビリ処方による受傷", "リハビリ中の軽微な事故", "オーダー間違い", "予約間違い", "案内間違い", "紛失", "カルテ記載間違い", "伝達間違い", "返却忘れ", "確認漏れ", "情報漏洩")),
+    "転倒・転落": ("content_details_tentou", ("転倒", "転落", "滑落")),
+    "患者対応": ("content_details_kanjataio", ("接遇に対する不満", "検査・治療に対する不満", "医療費に対する不満", "待ち時間に対する不満", "設備・環境に対する不満", "電話対応に対する不満", "患者間のトラブル")),
+    "機器関連": ("content_details_kiki", ("破損", "故障", "不具合", "操作ミス")),
+    "その他": ("content_details_sonota", ("盗難", "紛失", "在庫不足", "発注ミス", "不審者", "施錠忘れ", "災害")),
+}
+CONTENT_CATEGORY_OPTIONS = tuple(CONTENT_DETAILS.keys())
+
+# 検索フィルタ用: 全ての詳細項目 (外傷を含む) を重複なしで並べたもの
+ALL_CONTENT_DETAIL_OPTIONS = tuple(sorted(
+    {item for _, options in CONTENT_DETAILS.values() for item in options} | (set(INJURY_OPTIONS) - {"その他"})
+))
+
+# --- 表示グループ ---
+GROUP_TITLES = {
+    "basic": "基本情報",
+    "patient": "患者情報",
+    "incident": "インシデントの詳細",
+    "detail": "内容詳細",
+    "narrative": "状況と対策",
+    "workflow": "承認ワークフロー",
+    "system": "システム項目",
+}
+
+# --- 項目定義 (DBのカラム順) ---
+FIELDS = (
+    ReportField("id", "報告ID", "int"),
+    ReportField("occurrence_datetime", "発生日時", "datetime"),
+    ReportField("reporter_name", "報告者", long_label="報告者氏名"),
+    ReportField("job_type", "職種", options=JOB_TYPE_OPTIONS),
+    ReportField("level", "影響度レベル", options=LEVEL_OPTIONS),
+    ReportField("location", "発生場所", options=LOCATION_OPTIONS),
+    ReportField("connection_with_accident", "事故との関連性", "multi", options=CONNECTION_OPTIONS),
+    ReportField("years_of_experience", "経験年数", options=YEARS_OPTIONS, long_label="総実務経験"),
+    ReportField("years_since_joining", "入職年数", options=YEARS_OPTIONS),
+
+    ReportField("patient_ID", "患者ID", group="patient"),
+    ReportField("patient_name", "患者氏名", group="patient"),
+    ReportField("patient_gender", "性別", group="patient", options=GENDER_OPTIONS),
+    ReportField("patient_age", "年齢", "int", group="patient"),
+    ReportField("dementia_status", "認知症の有無", group="patient", options=DEMENTIA_OPTIONS),
+    ReportField("patient_status_change_accident", "患者状態変化", group="patient", options=YES_NO_OPTIONS, long_label="事故などによる患者の状態変化"),
+    ReportField("patient_status_change_patient_explanation", "患者への説明", group="patient", options=YES_NO_OPTIONS),
+    ReportField("patient_status_change_family_explanation", "家族への説明", group="patient", options=YES_NO_OPTIONS),
+
+    ReportField("content_category", "内容分類", group="incident", options=CONTENT_CATEGORY_OPTIONS, long_label="大分類"),
+    ReportField("content_details", "インシデント内容", group="incident", long_label="詳細内容"),
+    ReportField("cause_details", "発生原因", group="incident", long_label="発生・発見の原因"),
+    ReportField("manual_relation", "マニュアル関連", group="incident", options=MANUAL_RELATION_OPTIONS, long_label="マニュアルとの関連"),
+
+    ReportField("content_details_shinsatsu", "診察詳細", "json", "detail", CONTENT_DETAILS["診察"][1]),
+    ReportField("content_details_shochi", "処置詳細", "json", "detail", CONTENT_DETAILS["処置"][1]),
+    ReportField("content_details_uketsuke", "受付詳細", "json", "detail", CONTENT_DETAILS["受付"][1]),
+    ReportField("content_details_houshasen", "放射線業務詳細", "json", "detail", CONTENT_DETAILS["放射線業務"][1]),
+    ReportField("content_details_rehabili", "リハビリ業務詳細", "json", "detail", CONTENT_DETAILS["リハビリ業務"][1]),
+    ReportField("content_details_kanjataio", "患者対応詳細", "json", "detail", CONTENT_DETAILS["患者対応"][1]),
+    ReportField("content_details_kiki", "機器関連詳細", "json", "detail", CONTENT_DETAILS["機器関連"][1]),
+    ReportField("content_details_sonota", "その他詳細", "json", "detail", CONTENT_DETAILS["その他"][1]),
+    ReportField("content_details_buhin", "物品破損詳細", "json", "detail"), # 旧項目 (既存データ表示用)
+    ReportField("injury_details", "外傷詳細", "json", "detail", INJURY_OPTIONS),
+    ReportField("injury_other_text", "その他外傷", group="detail"),
+
+    ReportField("situation", "状況詳細", group="narrative", long_label="発生の状況と直後の対応"),
+    ReportField("countermeasure", "今後の対策", group="narrative"),
+
+    ReportField("created_at", "報告日時", "datetime", "workflow"),
+    ReportField("status", "ステータス", group="workflow", options=STATUS_OPTIONS),
+    ReportField("approver1", "承認者1", group="workflow"),
+    ReportField("approved_at1", "承認日時1", "datetime", "workflow"),
+    ReportField("approver2", "承認者2", group="workflow"),
+    ReportField("approved_at2", "承認日時2", "datetime", "workflow"),
+    ReportField("manager_comments", "管理者コメント", group="workflow"),
+
+    ReportField("revision", "更新番号", "int", "system"), # 楽観的排他制御用 (更新のたびに+1)
+)
+
+FIELDS_BY_COLUMN = {field.column: field for field in FIELDS}
+COLUMN_LABELS = {field.column: field.label for field in FIELDS}
+LABEL_COLUMNS = {field.label: field.column for field in FIELDS}
+
+# キーワード・詳細検索の対象列
+DETAIL_COLUMNS = tuple(f.column for f in FIELDS if f.group == "detail") + ("content_details",)
+KEYWORD_COLUMNS = ("situation", "countermeasure")
+
+
+# --- 下書きとして保存するフォーム項目 ---
+# 入力フォームのsession_stateのうち下書きに保存するキーです。ログイン情報やウィジェット内部のキーは保存しません。
+DRAFT_KEYS = frozenset(
+    {f.column for f in FIELDS if f.group not in ("workflow", "system")} - {"id", "occurrence_datetime", "content_details", "cause_details"}
+) | {"occurrence_date", "occurrence_time", "content_details_tentou"}
+DRAFT_KEY_PREFIXES = ("cause_",) # 発生原因の選択 (cause_<分類>, cause_<分類>_other)
+
+
+def is_draft_key(key: str) -> bool:
+    """session_stateのキーが下書きに保存する項目かどうかを返します"""
+    return key in DRAFT_KEYS or key.startswith(DRAFT_KEY_PREFIXES)
+
+
+def label(column: str) -> str:
+    """DBカラム名から日本語ラベルを返します (未定義の場合はカラム名のまま)"""
+    field = FIELDS_BY_COLUMN.get(column)
+    return field.label if field else column
+
+
+def fields_in_group(group: str) -> list:
+    """指定した表示グループに属する項目を定義順で返します"""
+    return [field for field in FIELDS if field.group == group]
+
+
+def filter_options(column: str, present_values=()) -> list:
+    """検索フィルタの選択肢を返します。定義済みの選択肢に、データ中にだけ存在する値を後ろに追加します。"""
+    options = list(FIELDS_BY_COLUMN[column].options)
+    extras = sorted({str(v) for v in present_values if v is not None and v == v and v != ""} - set(options))
+    return [o for o in options if o != ""] + extras
+
+
+def select_list(columns=None, labeled: bool = True) -> str:
+    """
+    SELECT句の列リストを生成します。
+    labeled=True の場合は日本語ラベルを別名に付けるため、取得したDataFrameの列名変換が不要になります。
+    """
+    columns = columns or [field.column for field in FIELDS]
+    if not labeled:
+        return ", ".join(columns)
+    return ", ".join(f'{column} AS "{label(column)}"' for column in columns)
@@ -0,0 +1,5 @@
+@echo off
+cd C:\code\incident_report_app_Gemini
+call venv\Scripts\activate
+REM Login tokens are signed with SESSION_SECRET in .env (if empty, session_secret.key next to the DB is generated and shared by all workers)
+python launch_workers.py --workers 4 >> streamlit.log 2>&1